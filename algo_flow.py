@@ -1,40 +1,107 @@
-import pandas as pd
-import networkx as nx
-import itertools
 import sys
 import os
+import re
 import json
+import hashlib
+import cProfile
+import tracemalloc
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from maximum_flow_impl import min_cost_max_flow
+from flow_network import FlowNetwork, ASSIGN, UNASSIGN, SAVED_ARRAYS
+from problem_instance import ProblemInstance, SHIFT_IDS, SHIFT_BITS, WEEKS
+from week_schedule import WeekSchedule
+from solver_stats import SolveStats, format_month_stats
+from solve_control import SolveControl
+from solve_cache import SolveCache, week_key
+
+# A part of a clinic with fewer doctors solves a week faster than a worker process starts, so
+# parts only go to a pool when at least two of them are this big.
+PARALLEL_MIN_DOCTORS = 40
+
+
+def state_path(schedule_path):
+    # week_1.jsonl, week_1.txt, week_1.xlsx and week_1_temp.txt all share week_1.state
+    return re.sub(r'(_temp)?\.\w+$', '', schedule_path) + '.state'
+
+
+def _state_key(instance):
+    # A digest rather than the lists themselves, so a state does not change with the instance
+    # it was saved for.
+    return hashlib.sha256(repr((instance.doctors, instance.eligible, instance.forbidden)).encode('utf-8')).hexdigest()
+
+
+def week_state(week, instance, schedule, network, potential):
+    # The solved week network (residuals and node potentials) with the week's schedule, so that
+    # change_weekly_schedule can repair the week without rebuilding it. Kept next to the
+    # schedule file by save_week_state, or in memory by a caller that holds on to the week.
+    # A week solved in parts (see _split_week) has a list of networks and one of potentials,
+    # one per part.
+    return {'week': week, 'key': _state_key(instance), 'schedule': schedule, 'network': network, 'potential': potential}
+
+
+def _state_networks(state):
+    # (network, potential) for every network of a week state.
+    if isinstance(state['network'], list):
+        return list(zip(state['network'], state['potential']))
+    return [(state['network'], state['potential'])]
+
+
+def _state_matches(state, week, instance):
+    return state['week'] == week and state['key'] == _state_key(instance)
+
+
+def _tuples(value):
+    # JSON gives back the tuples of node names and shifts as lists.
+    return tuple(_tuples(item) for item in value) if isinstance(value, list) else value
+
+
+def save_week_state(path, week, instance, schedule, network, potential):
+    # An .npz archive: the arrays of every network and its potentials, and the rest as JSON in
+    # 'meta', so loading a state never runs code from the file.
+    state = week_state(week, instance, schedule, network, potential)
+    rows = [[loc, cab, shift, doctor] for loc, cabs in schedule.items() for cab, slots in cabs.items() for shift, doctor in slots.items()]
+    meta = {'week': week, 'key': state['key'], 'parts': isinstance(network, list), 'schedule': rows, 'networks': []}
+    arrays = {}
+    for i, (part, part_potential) in enumerate(_state_networks(state)):
+        part_arrays, names, doctors, cabinets, cabinet_size = part.saved()
+        arrays.update({f'{i}.{field}': values for field, values in part_arrays.items()})
+        arrays[f'{i}.potential'] = np.asarray(part_potential, dtype=np.float64)
+        meta['networks'].append({'names': names, 'doctors': doctors, 'cabinets': cabinets, 'cabinet_size': cabinet_size})
+    arrays['meta'] = np.array(json.dumps(meta, ensure_ascii=False))
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_week_state(path, week, instance):
+    # None when there is no state for this week of this instance, or the file is not one
+    # save_week_state wrote.
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as archive:
+            meta = json.loads(str(archive['meta']))
+            if meta['week'] != week or meta['key'] != _state_key(instance):
+                return None
+            networks, potentials = [], []
+            for i, part in enumerate(meta['networks']):
+                arrays = {field: archive[f'{i}.{field}'] for field, _ in SAVED_ARRAYS}
+                networks.append(FlowNetwork.from_saved(arrays, _tuples(part['names']), _tuples(part['doctors']), _tuples(part['cabinets']), part['cabinet_size']))
+                potentials.append(archive[f'{i}.potential'].tolist())
+    except (OSError, ValueError, KeyError):
+        return None
 
-def split_data(data_str, delim=','):
-    return [elem.strip() for elem in data_str.split(delim)]
-
-def distribute_evenly(number, parts = 4):
-    if not number:
-        return [0] * parts
-
-    result = [number // parts] * parts
-    for i in range(number % parts):
-        result[i] += 1
-    return result
-
-def get_obligatory_shifts(df_input, week):
-    obl_shifts = split_data(df_input)
-    res = set()
-
-    for data in obl_shifts:
-
-        if not data:
-            continue
-        
-        data = data.split('|')
-        if data[2][0] == str(week):
-            res.add((data[0], data[1], tuple(map(int, data[2][2:].split('.')))))
+    schedule = {}
+    for loc, cab, shift, doctor in meta['schedule']:
+        schedule.setdefault(loc, {}).setdefault(cab, {})[_tuples(shift)] = doctor
+    if not meta['parts']:
+        networks, potentials = networks[0], potentials[0]
+    return {'week': week, 'key': meta['key'], 'schedule': schedule, 'network': networks, 'potential': potentials}
 
-    return res
 
 def reverse_schedule_dict(schedule):
     reversed_schedule = {}
@@ -48,70 +115,163 @@ def reverse_schedule_dict(schedule):
     return reversed_schedule
 
 
-def calculate_necessary_allocations(df, all_shift_ids, loc_cabs_dict, week, doctor_penalty):
-
-    G = nx.DiGraph()
-    source, sink = 'S', 'T'
-    G.add_node(source, type='source')
-    G.add_node(sink, type='sink')
-    costs = {}
-    cabinet_penalty = defaultdict(int)
+def _number(mask, start):
+    # Node ids for the True entries of mask, handed out in row-major order from start; -1 elsewhere.
+    ids = np.full(mask.shape, -1, dtype=np.int64)
+    ids[mask] = start + np.arange(np.count_nonzero(mask))
+    return ids
+
+
+def _assignment_arcs(instance, available, allowed):
+    # The doctor x cabinet eligibility (instance.eligible_doctor/_cabinet) broadcast against the
+    # shifts every doctor can take (available, doctors x shift columns); allowed (eligible pairs
+    # x shift columns) says which of those cabinet shifts the pair may be assigned. One
+    # (doctor, cabinet, column) per assignment arc, doctor by doctor in eligible order.
+    pair, column = np.nonzero(available[instance.eligible_doctor] & allowed)
+    return instance.eligible_doctor[pair], instance.eligible_cabinet[pair], column
+
+
+def _shift_network(instance, open_slots, available, capacity, allowed=None, present=None, slot_capacity=None):
+    # S -> doctor -> (doctor, shift) -> (loc, cab, shift) -> (loc, cab) -> T for one week, built
+    # from arrays: open_slots says which cabinet shifts get a node, available which shifts every
+    # doctor can take, capacity is source -> doctor and allowed is as in _assignment_arcs (by
+    # default any open slot); present says which doctors get a node (all by default) and
+    # slot_capacity is (loc, cab, shift) -> (loc, cab) (1 by default). Nodes and edges come in
+    # the order the builders used to add them one by one, so the frozen network is laid out
+    # exactly as before.
+    doctors = len(instance.doctors)
+    present = np.ones(doctors, dtype=bool) if present is None else present
+    slot_ids = _number(open_slots, 2)
+    used = open_slots.any(axis=1)
+    cabinet_ids = _number(used, 2 + np.count_nonzero(open_slots))
+    block = np.hstack((present.reshape(-1, 1), available))
+    block_ids = _number(block, 2 + np.count_nonzero(open_slots) + np.count_nonzero(used))
+    doctor_ids, shift_ids = block_ids[:, 0], block_ids[:, 1:]
+
+    names, types = ['S', 'T'], ['source', 'sink']
+    slot_cabinet, slot_shift = np.nonzero(open_slots)
+    for c, s in zip(slot_cabinet.tolist(), slot_shift.tolist()):
+        names.append(instance.cabinets[c] + (SHIFT_IDS[s],))
+        types.append('loc_cab_shift')
+    for c in np.flatnonzero(used).tolist():
+        names.append(instance.cabinets[c])
+        types.append('cabinet')
+    for d, column in zip(*(index.tolist() for index in np.nonzero(block))):
+        names.append(instance.doctors[d] if column == 0 else (instance.doctors[d], SHIFT_IDS[column - 1]))
+        types.append('doctor' if column == 0 else 'doctor_shift')
+
+    shift_doctor, shift_column = np.nonzero(available)
+    if allowed is None:
+        allowed = open_slots[instance.eligible_cabinet]
+    doctor, cabinet, column = _assignment_arcs(instance, available, allowed)
+    slots = np.ones(len(slot_cabinet), dtype=np.int64) if slot_capacity is None else slot_capacity[slot_cabinet, slot_shift]
+    gathered = np.bincount(slot_cabinet, weights=slots, minlength=len(used)).astype(np.int64)[used]
+    tails = np.concatenate((slot_ids[slot_cabinet, slot_shift], cabinet_ids[used], np.zeros(np.count_nonzero(present), dtype=np.int64),
+                            doctor_ids[shift_doctor], shift_ids[doctor, column]))
+    heads = np.concatenate((cabinet_ids[slot_cabinet], np.ones(len(gathered), dtype=np.int64), doctor_ids[present], shift_ids[shift_doctor, shift_column],
+                            slot_ids[cabinet, column]))
+    capacities = np.concatenate((slots, gathered, capacity[present], np.ones(len(shift_doctor) + len(doctor), dtype=np.int64)))
+    return FlowNetwork.from_arrays(names, types, tails, heads, capacities)
+
+
+def _network_size(instance, open_slots, available, present):
+    # Nodes and edges _shift_network would build from these masks.
+    doctor, _, _ = _assignment_arcs(instance, available, open_slots[instance.eligible_cabinet])
+    slots, shifts, doctors = int(np.count_nonzero(open_slots)), int(np.count_nonzero(available)), int(np.count_nonzero(present))
+    cabinets = int(np.count_nonzero(open_slots.any(axis=1)))
+    return 2 + slots + cabinets + doctors + shifts, slots + cabinets + doctors + shifts + len(doctor)
+
+
+def _reduce_week(instance, week, open_slots, available, necessary_shifts):
+    # Everything the solver cannot use is left out of the week network: required shifts are
+    # fixed outside it (their slot and the doctor's time go, min_cost_max_flow still places them
+    # as pre-assigned shifts), doctors with no shifts to take that week, slots no available
+    # doctor is eligible for, doctor shifts without an eligible open slot and doctors left
+    # without shifts. Then a slot that only one doctor shift can reach, while that doctor shift
+    # reaches no other slot, is forced if the doctor needs every shift left to reach MinShifts:
+    # every maximum flow of the first phase takes it, so it is pre-assigned as well.
+    fixed = np.zeros(len(instance.doctors), dtype=np.int64)
+    for d, doctor in enumerate(instance.doctors):
+        if max(instance.weekly_min(d, week), instance.weekly_max(d, week)) <= 0:
+            available[d] = False
+        for loc, cab, shift in necessary_shifts[doctor]:
+            fixed[d] += 1
+            if shift in SHIFT_BITS:
+                available[d, SHIFT_BITS[shift]] = False
+                if (loc, cab) in instance.cabinet_ids:
+                    open_slots[instance.cabinet_ids[(loc, cab)], SHIFT_BITS[shift]] = False
+
+    def prune():
+        doctor, cabinet, column = _assignment_arcs(instance, available, open_slots[instance.eligible_cabinet])
+        open_slots[:] = False
+        open_slots[cabinet, column] = True
+        available[:] = False
+        available[doctor, column] = True
+        return doctor, cabinet, column
+
+    doctor, cabinet, column = prune()
+    into_slot = np.zeros(open_slots.shape, dtype=np.int64)
+    out_of_shift = np.zeros(available.shape, dtype=np.int64)
+    np.add.at(into_slot, (cabinet, column), 1)
+    np.add.at(out_of_shift, (doctor, column), 1)
+    needed = np.array([instance.weekly_min(d, week) for d in range(len(instance.doctors))], dtype=np.int64) - fixed
+    single = (into_slot[cabinet, column] == 1) & (out_of_shift[doctor, column] == 1)
+    forced = single & (needed[doctor] >= available.sum(axis=1)[doctor])
+
+    for d, c, s in zip(doctor[forced].tolist(), cabinet[forced].tolist(), column[forced].tolist()):
+        necessary_shifts[instance.doctors[d]].add(instance.cabinets[c] + (SHIFT_IDS[s],))
+        open_slots[c, s] = available[d, s] = False
+    if forced.any():
+        prune()
+    return available.any(axis=1), int(np.count_nonzero(forced))
+
+
+def build_week_network(instance, week, reduce=False, stats=None, aggregated=None):
+    # Both phases of a week run on this one network: source -> doctor starts at the doctor's
+    # weekly MinShifts and is raised by extra_capacity up to MaxShifts for the preference phase.
+    # reduce leaves out what the solver cannot use and pre-assigns forced slots (see
+    # _reduce_week); stats then gets how much smaller the network came out. aggregated
+    # (instance.aggregated(), only with reduce) gives every group of interchangeable cabinets
+    # one node per shift, taking as many doctors as the group has cabinets left open then.
     necessary_shifts = {}
-    schedule = {}
+    extra_capacity = {}
+    schedule = instance.empty_schedule()
 
     expected_flow = 0
+    capacity = np.zeros(len(instance.doctors), dtype=np.int64)
 
-    for loc in loc_cabs_dict:
-        for spec in loc_cabs_dict[loc]:
-            for cab in loc_cabs_dict[loc][spec]:
-                cabinet_penalty[(loc, cab)] = 0
-                for shift in all_shift_ids:
-                    schedule.setdefault(loc, {}).setdefault(cab, {})
-                    schedule[loc][cab][shift] = None
-                    G.add_node((loc, cab, shift), type='loc_cab_shift')
-                    G.add_edge((loc, cab, shift), sink, capacity=1)
-
-    for _, row in df.iterrows():
-
-        doctor = row['Doctor']
-        costs[doctor] = {}
-
-        specs = split_data(row['Specialization'])
-        locs = split_data(row['Cabinets'])
-
-        min_shifts = distribute_evenly(int(row['MinShifts']) if pd.notna(row['MinShifts']) else 0)[week - 1]
+    for d, doctor in enumerate(instance.doctors):
+        min_shifts = instance.weekly_min(d, week)
         expected_flow += min_shifts
+        extra_capacity[doctor] = instance.weekly_max(d, week) - min_shifts
+        necessary_shifts[doctor] = set(instance.required_shifts[d][week - 1]) if reduce else instance.required_shifts[d][week - 1]
+        capacity[d] = min_shifts
+
+    open_slots = np.ones((len(instance.cabinets), len(SHIFT_IDS)), dtype=bool)
+    available = instance.availability(week)
+    present = None
+    if reduce:
+        full = _network_size(instance, open_slots, available, np.ones(len(instance.doctors), dtype=bool))
+        present, forced = _reduce_week(instance, week, open_slots, available, necessary_shifts)
+    if aggregated is not None:
+        slot_capacity = np.array([open_slots[members].sum(axis=0) for members in aggregated.members], dtype=np.int64)
+        network = _shift_network(aggregated, slot_capacity > 0, available, capacity, present=present, slot_capacity=slot_capacity)
+        network.cabinet_size = [len(aggregated.members[aggregated.cabinet_ids[cabinet]]) for cabinet in network.cabinets]
+    else:
+        network = _shift_network(instance, open_slots, available, capacity, present=present)
+    if reduce and stats is not None:
+        stats.pruned_nodes = full[0] - len(network)
+        stats.pruned_edges = full[1] - network.number_of_edges()
+        stats.fixed_shifts = sum(len(shifts) for shifts in necessary_shifts.values())
+        stats.forced_shifts = forced
+        if aggregated is not None:
+            stats.merged_slots = int(np.count_nonzero(open_slots) - np.count_nonzero(slot_capacity))
+    return network, necessary_shifts, schedule, expected_flow, extra_capacity
 
-        forbidden = set(split_data(row['ForbiddenShifts'])) if pd.notna(row['ForbiddenShifts']) else set()
-        forbidden = set(tuple(map(int, data.split('.')[1:])) for data in forbidden if data[0] == str(week))
-
-        necessary_shifts[doctor] = get_obligatory_shifts(row['RequiredShifts'] if pd.notna(row['RequiredShifts']) else '', week)
-
-        G.add_node(doctor, type='doctor')
-        G.add_edge(source, doctor, capacity=min_shifts)
-
-        for shift in all_shift_ids:
-            if shift in forbidden:
-                continue
-            G.add_node((doctor, shift), type='doctor_shift')
-            G.add_edge(doctor, (doctor, shift), capacity=1)
-
-        for i, loc in enumerate(locs):
-
-            if loc not in costs:
-                costs[loc] = {}
-
-            costs[doctor][loc] = costs[loc][doctor] = 5*i + 1
 
-            for spec in specs:
-                if loc in loc_cabs_dict and spec in loc_cabs_dict[loc]:
-                    for cab in loc_cabs_dict[loc][spec]:
-                        for shift in all_shift_ids:
-                            if shift in forbidden:
-                                continue
-                            G.add_edge((doctor, shift), (loc, cab, shift), capacity=1)
+def calculate_necessary_allocations(network, costs, necessary_shifts, schedule, expected_flow, doctor_penalty, cabinet_penalty, potential, engine='dijkstra', stats=None, control=None):
 
-    flow, _, schedule = min_cost_max_flow(G, costs, doctor_penalty, cabinet_penalty, necessary_shifts, schedule, source, sink)
+    flow, _, schedule = min_cost_max_flow(network, costs, doctor_penalty, cabinet_penalty, necessary_shifts, schedule, 'S', 'T', engine=engine, potential=potential, stats=stats, control=control)
 
     if flow != expected_flow:
         print(f"Warning: Expected flow {expected_flow}, but got {flow}. Not all doctors may be assigned their minimum shifts.")
@@ -121,268 +281,679 @@ def calculate_necessary_allocations(df, all_shift_ids, loc_cabs_dict, week, doct
     return reverse_schedule_dict(schedule)
 
 
-def generate_preference_schedule_from_csv(input_csv_path: str, loc_cabs_path: str, output_path: str, doctor_penalty: dict, week) -> str:
-    
-    df = pd.read_csv(input_csv_path)
-
-    days, shifts = range(1, 8), range(1, 3)
-    all_shift_ids = [(d, s) for d, s in itertools.product(days, shifts)]
-
-    with open(loc_cabs_path, 'r', encoding='utf-8') as f:
-        loc_cabs_data = json.load(f)
-        loc_cabs_dict = {}
-
-        for elem in loc_cabs_data:
-            loc = elem['location']
-            cabinets = elem['room']
-            spec = elem['specialization']
-            if not loc in loc_cabs_dict:
-                loc_cabs_dict[loc] = {}
-
-            loc_cabs_dict[loc][spec] = split_data(cabinets)
-
-    required = calculate_necessary_allocations(df, all_shift_ids, loc_cabs_dict, week, doctor_penalty)
-
-    G = nx.DiGraph()
-    source, sink = 'S', 'T'
-    G.add_node(source, type='source')
-    G.add_node(sink, type='sink')
-    costs = {}
-    cabinet_penalty = defaultdict(int)
-    schedule = {}
+def generate_preference_schedule_from_csv(input_csv_path: str, loc_cabs_path: str, output_path: str, doctor_penalty: dict, week, engine: str = 'dijkstra', instance: ProblemInstance = None,
+                                          control: SolveControl = None, cache: SolveCache = None) -> WeekSchedule:
+    instance = instance or ProblemInstance.from_files(input_csv_path, loc_cabs_path)
+
+    return generate_preference_schedule(instance, output_path, doctor_penalty, week, engine=engine, control=control, cache=cache)
+
+
+def _remaining_flow(network):
+    # Most flow the preference phase could still add: limited by the doctors' spare capacity and
+    # by the slots that are still free.
+    source, sink = network.ids['S'], network.ids['T']
+    residual, reverse = network.residual, network.reverse
+    spare = sum(max(residual[a], 0) for a in range(network.first[source], network.first[source + 1]))
+    free = sum(max(residual[reverse[a]], 0) for a in range(network.first[sink], network.first[sink + 1]))
+    return min(spare, free)
+
+
+def _spread_groups(instance, aggregated, network, necessary_shifts):
+    # The week's schedule off an aggregated network (see build_week_network): pre-assigned shifts
+    # stay in their cabinets, and every doctor the flow put into a group at a shift goes to the
+    # group's free cabinet with the fewest shifts so far (the first of them on a tie), shift by
+    # shift in SHIFT_IDS order, so the load is spread over the cabinets as their penalties
+    # would have spread it.
+    schedule = instance.empty_schedule()
+    for doctor, slots in necessary_shifts.items():
+        for loc, cab, shift in slots:
+            schedule[loc][cab][shift] = doctor
+    load = {(loc, cab): sum(doctor is not None for doctor in slots.values()) for loc, cabs in schedule.items() for cab, slots in cabs.items()}
+
+    taken = defaultdict(list)
+    kind = np.frombuffer(network.kind, dtype=np.int8)
+    flow = np.frombuffer(network.capacity, dtype=np.int32) - np.frombuffer(network.residual, dtype=np.int32)
+    for a in np.flatnonzero((kind == ASSIGN) & (flow > 0)).tolist():
+        loc, cab, shift = network.names[network.head[a]]
+        taken[shift].append((network.names[network.tail(a)][0], aggregated.members[aggregated.cabinet_ids[(loc, cab)]]))
+
+    for shift in SHIFT_IDS:
+        for doctor, members in taken[shift]:
+            free = [instance.cabinets[c] for c in members if schedule[instance.cabinets[c][0]][instance.cabinets[c][1]][shift] is None]
+            loc, cab = min(free, key=load.__getitem__)
+            schedule[loc][cab][shift] = doctor
+            load[(loc, cab)] += 1
+    return schedule
 
-    for loc in loc_cabs_dict:
-        for spec in loc_cabs_dict[loc]:
-            for cab in loc_cabs_dict[loc][spec]:
-                cabinet_penalty[(loc, cab)] = 0
-                for shift in all_shift_ids:
-                    schedule.setdefault(loc, {}).setdefault(cab, {})
-                    schedule[loc][cab][shift] = None
-                    G.add_node((loc, cab, shift), type='loc_cab_shift')
-                    G.add_edge((loc, cab, shift), sink, capacity=1)
 
-    for _, row in df.iterrows():
+def _cached_week(instance, output_path, doctor_penalty, week, entry, control, states):
+    # A week solved before from the same inputs: its schedule, the penalties it handed on to the
+    # next week and the solved network for change_weekly_schedule, as if it had just been solved.
+    doctor_penalty.update(entry['penalty'])
+    result = WeekSchedule.from_dict(week, entry['schedule'])
+    result.stats = {'cached': SolveStats()}
+    if control is not None:
+        assigned = sum(doctor is not None for doctor in result.doctors)
+        control.begin(week, 'cached', assigned)
+        control.advance(assigned)
+    # Entries stored before weeks solved in parts kept their networks come without one.
+    solved = entry['network'] is not None
+    if output_path is not None:
+        result.write(output_path)
+        if solved:
+            save_week_state(state_path(output_path), week, instance, entry['schedule'], entry['network'], entry['potential'])
+        elif os.path.exists(state_path(output_path)):
+            os.remove(state_path(output_path))
+    if states is not None and solved:
+        states[week] = week_state(week, instance, entry['schedule'], entry['network'], entry['potential'])
+    return result
 
-        doctor = row['Doctor']
-        costs[doctor] = {}
 
-        specs = split_data(row['Specialization'])
-        locs = split_data(row['Cabinets'])
+def _solve_part(part, week, doctor_penalty, engine, reduce, aggregate, control=None):
+    states = {}
+    result = generate_preference_schedule(part, None, doctor_penalty, week, engine=engine, control=control, states=states, reduce=reduce, aggregate=aggregate)
+    return result.to_dict(), doctor_penalty, result.stats, result.truncated, states[week]['network'], states[week]['potential']
 
-        max_shifts = distribute_evenly(int(row['MaxShifts']) if pd.notna(row['MaxShifts']) else 4 * len(all_shift_ids))[week - 1]
 
-        forbidden = set(split_data(row['ForbiddenShifts'])) if pd.notna(row['ForbiddenShifts']) else set()
-        forbidden = set(tuple(map(int, data.split('.')[1:])) for data in forbidden if data[0] == str(week))
+def _split_week(instance, output_path, doctor_penalty, week, parts, engine, control, pool, cache, key, reduce, aggregate, states):
+    # No doctor of one part can take a cabinet of another (see ProblemInstance.components), so
+    # every part is solved as a clinic of its own and the schedules merged: a search only ever
+    # scans its own part's network, and with a pool the parts are solved side by side. Control
+    # cannot follow a worker, so with control the parts are solved here one after another.
+    # The week state keeps every part's network, and a change of the week repairs the part
+    # networks its freed slots are in.
+    jobs = [(instance.subset(doctors, cabinets), week, {instance.doctors[d]: doctor_penalty[instance.doctors[d]] for d in doctors}, engine, reduce, aggregate)
+            for doctors, cabinets in parts]
+    if pool is not None and control is None:
+        results = list(pool.map(_solve_part, *zip(*jobs)))
+    else:
+        results = [_solve_part(*job, control=control) for job in jobs]
+
+    schedule = instance.empty_schedule()
+    stats = {'necessary': SolveStats(), 'preference': SolveStats()}
+    truncated = False
+    networks, potentials = [], []
+    for part_schedule, part_penalty, part_stats, part_truncated, network, potential in results:
+        for loc, cabs in part_schedule.items():
+            for cab, shifts in cabs.items():
+                schedule[loc][cab].update(shifts)
+        doctor_penalty.update(part_penalty)
+        for phase, part_phase_stats in part_stats.items():
+            stats[phase].add(part_phase_stats)
+        truncated = truncated or part_truncated
+        networks.append(network)
+        potentials.append(potential)
+
+    result = WeekSchedule.from_dict(week, schedule)
+    result.stats = stats
+    result.truncated = truncated
+    if output_path is not None:
+        result.write(output_path)
+        save_week_state(state_path(output_path), week, instance, schedule, networks, potentials)
+    if states is not None:
+        states[week] = week_state(week, instance, schedule, networks, potentials)
+    if key is not None and not truncated:
+        cache.put(key, {'schedule': schedule, 'penalty': dict(doctor_penalty), 'network': networks, 'potential': potentials})
+    return result
 
-        G.add_node(doctor, type='doctor')
-        G.add_edge(source, doctor, capacity=max_shifts)
 
-        for shift in all_shift_ids:
-            if shift in forbidden:
-                continue
-            G.add_node((doctor, shift), type='doctor_shift')
-            G.add_edge(doctor, (doctor, shift), capacity=1)
-
-        for i, loc in enumerate(locs):
-
-            if loc not in costs:
-                costs[loc] = {}
-
-            costs[doctor][loc] = costs[loc][doctor] = 5*i + 1
-
-            for spec in specs:
-                if loc in loc_cabs_dict and spec in loc_cabs_dict[loc]:
-                    for cab in loc_cabs_dict[loc][spec]:
-                        for shift in all_shift_ids:
-                            if shift in forbidden:
-                                continue
-                            G.add_edge((doctor, shift), (loc, cab, shift), capacity=1)
-
-    _, _, schedule = min_cost_max_flow(G, costs, doctor_penalty, cabinet_penalty, required, schedule, source, sink)
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        for loc in sorted(schedule.keys()):
-            f.write(f"Локація: {loc}\n")
-            f.write("="*40 + "\n")
-            
-            for cab in sorted(schedule[loc].keys()):
-                f.write(f"Кабінет: {cab}\n")
-                f.write("-"*30 + "\n")
-                
-                for shift in all_shift_ids:
-                    assigned = schedule[loc][cab].get(shift, "Немає лікаря")
-                    f.write(f"{shift} - {assigned}\n")
-                
-                f.write("-"*30 + "\n")
-    
-    return schedule
+def generate_preference_schedule(instance: ProblemInstance, output_path, doctor_penalty: dict, week, engine: str = 'dijkstra', control: SolveControl = None,
+                                 cache: SolveCache = None, states: dict = None, parts: list = None, pool: ProcessPoolExecutor = None, reduce: bool = True,
+                                 aggregate: bool = False):
+    # With a cache, a week whose inputs (see week_key) were solved before is read back instead of
+    # solved; a week cut short by control is not stored. states, if given, gets the week's
+    # state (see week_state) under the week number, whether or not it is saved to a file.
+    # parts are instance.components() if the caller has them; with more than one the week is
+    # solved part by part (in pool if given), see _split_week. reduce solves the week on the
+    # reduced network of build_week_network. aggregate (which implies reduce) solves it with
+    # interchangeable cabinets merged, see ProblemInstance.aggregated, and spreads the doctors
+    # over the cabinets afterwards, see _spread_groups. Each merged cabinet is priced at the
+    # average penalty of its cabinets, so the schedule is close to, not always the same as,
+    # the one solved cabinet by cabinet.
+    if aggregate:
+        if engine not in ('dijkstra', 'bellman_ford'):
+            raise ValueError(f"Engine {engine} cannot solve merged cabinets, use dijkstra or bellman_ford")
+        reduce = True
+    key = week_key(instance, week, doctor_penalty, engine, reduce, aggregate) if cache is not None else None
+    if key is not None:
+        entry = cache.get(key)
+        if entry is not None:
+            return _cached_week(instance, output_path, doctor_penalty, week, entry, control, states)
+
+    parts = instance.components() if parts is None else parts
+    if len(parts) > 1:
+        return _split_week(instance, output_path, doctor_penalty, week, parts, engine, control, pool, cache, key, reduce, aggregate, states)
+
+    stats = {'necessary': SolveStats(), 'preference': SolveStats()}
+
+    stats['necessary'].start()
+    aggregated = instance.aggregated() if aggregate else None
+    network, necessary_shifts, schedule, expected_flow, extra_capacity = build_week_network(instance, week, reduce, stats['necessary'], aggregated)
+    stats['necessary'].stop('build_time')
+    costs = instance.costs
+    cabinet_penalty = defaultdict(int)
+    potential = [0] * len(network)
+    if aggregated is not None:
+        # A merged slot holds several doctors, more than the schedule min_cost_max_flow fills in
+        # can show: it gets a scratch one and the week's schedule is read off the flow. A merged
+        # cabinet's penalty starts with the pre-assigned shifts of its cabinets (a cabinet on its
+        # own gets them from min_cost_max_flow).
+        schedule = defaultdict(lambda: defaultdict(dict))
+        for slots in necessary_shifts.values():
+            for loc, cab, _ in slots:
+                merged = aggregated.cabinets[aggregated.merged[instance.cabinet_ids[(loc, cab)]]]
+                if merged != (loc, cab):
+                    cabinet_penalty[merged] += 1
+
+    if control is not None:
+        control.begin(week, 'necessary', expected_flow)
+    required = calculate_necessary_allocations(network, costs, necessary_shifts, schedule, expected_flow, doctor_penalty, cabinet_penalty, potential, engine=engine,
+                                               stats=stats['necessary'], control=control)
+    if aggregated is not None:
+        required = reverse_schedule_dict(_spread_groups(instance, aggregated, network, necessary_shifts))
+
+    # The minimum-requirements flow stays in place and can no longer be undone; the preference
+    # phase only tops it up to MaxShifts, continuing from the same residual network and
+    # potentials. Those shifts count once more towards the doctor penalty, as they did when the
+    # second phase took them in as pre-assigned shifts.
+    stats['preference'].start()
+    network.lock_flow()
+    source = network.ids['S']
+    for doctor, extra in extra_capacity.items():
+        a = network.arc(source, network.ids.get(doctor))
+        if a != -1:
+            network.residual[a] += extra
+            network.capacity[a] += extra
+    for doctor, assigned in required.items():
+        doctor_penalty[doctor] += len(assigned)
+    stats['preference'].stop('build_time')
+
+    if control is not None:
+        control.begin(week, 'preference', _remaining_flow(network))
+    _, _, schedule = min_cost_max_flow(network, costs, doctor_penalty, cabinet_penalty, {}, schedule, 'S', 'T', engine=engine, potential=potential, stats=stats['preference'],
+                                       control=control)
+    if aggregated is not None:
+        schedule = _spread_groups(instance, aggregated, network, necessary_shifts)
+
+    result = WeekSchedule.from_dict(week, schedule)
+    result.stats = stats
+    result.truncated = control is not None and control.truncated
+    if output_path is not None:
+        result.write(output_path)
+        save_week_state(state_path(output_path), week, instance, schedule, network, potential)
+    if states is not None:
+        states[week] = week_state(week, instance, schedule, network, potential)
+    if key is not None and not result.truncated:
+        cache.put(key, {'schedule': schedule, 'penalty': dict(doctor_penalty), 'network': network, 'potential': potential})
 
-def generate_monthly_schedule_from_csv(input_csv_path: str, loc_cabs_path: str, output_path: str) -> str:
+    return result
 
-    df = pd.read_csv(input_csv_path)
-    doctors = {row['Doctor']: int(row['Fine']) for _, row in df.iterrows()}
+def generate_monthly_schedule_from_csv(input_csv_path: str, loc_cabs_path: str, output_path: str, engine: str = 'dijkstra', instance: ProblemInstance = None, format: str = 'jsonl',
+                                       profile: str = None, trace_memory: bool = False, control: SolveControl = None, joint: bool = False,
+                                       cache: SolveCache = None, workers: int = None, reduce: bool = True, aggregate: bool = False) -> list:
+    # profile: file to dump cProfile stats of the whole run to; trace_memory: run under
+    # tracemalloc so every phase also reports its peak memory.
+    profiler = cProfile.Profile() if profile else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+
+    try:
+        instance = instance or ProblemInstance.from_files(input_csv_path, loc_cabs_path)
+        schedules = generate_monthly_schedule(instance, output_path, engine=engine, format=format, control=control, joint=joint, cache=cache,
+                                              workers=workers, reduce=reduce, aggregate=aggregate)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        if trace_memory:
+            tracemalloc.stop()
+
+    if profile or trace_memory:
+        print(format_month_stats(schedules))
+
+    return schedules
+
+
+def generate_monthly_schedule(instance: ProblemInstance, output_path=None, engine: str = 'dijkstra', format: str = 'jsonl', control: SolveControl = None, joint: bool = False,
+                              cache: SolveCache = None, states: dict = None, workers: int = None, reduce: bool = True, aggregate: bool = False):
+    # output_path is a folder that gets week_N.<format> (jsonl, txt or xlsx) for every week. A
+    # cancelled or timed out run returns the weeks solved so far, the last one marked truncated.
+    # joint solves the whole month at once on one network, see generate_joint_monthly_schedule.
+    # With a cache every week is looked up first; a week only depends on the weeks before it
+    # through doctor_penalty, so an edit to week 3 still reuses weeks 1 and 2. states is as for
+    # generate_preference_schedule (the joint solve leaves it empty). A clinic that falls apart
+    # into independent parts has them solved in a pool of up to workers processes (all CPUs by
+    # default, 1 to stay in this process), started once for the month; no more workers than
+    # parts of PARALLEL_MIN_DOCTORS doctors or more, so small parts stay in this process
+    # whatever workers is. reduce and aggregate are as for generate_preference_schedule (the
+    # joint solve takes neither).
+    if joint:
+        return generate_joint_monthly_schedule(instance, output_path, engine=engine, format=format, control=control)
+
+    parts = instance.components()
+    large = sum(len(doctors) >= PARALLEL_MIN_DOCTORS for doctors, _ in parts)
+    workers = min(workers or os.cpu_count() or 1, large)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and control is None else None
+    try:
+        return _generate_weeks(instance, output_path, engine, format, control, cache, states, parts, pool, reduce, aggregate)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+def _generate_weeks(instance, output_path, engine, format, control, cache, states, parts, pool, reduce, aggregate):
+    doctors = dict(zip(instance.doctors, instance.fine))
     doctor_penalty = {doctor: 4 if not fine else 0 for doctor, fine in doctors.items()}
+    schedules = []
 
     for week in range(1, 5):
 
-        out_res =os.path.join(output_path, f"week_{week}.txt")
+        if control is not None and control.should_stop():
+            break
+
+        out_res = os.path.join(output_path, f"week_{week}.{format}") if output_path is not None else None
 
-        schedule = generate_preference_schedule_from_csv(input_csv_path, loc_cabs_path, out_res, doctor_penalty, week)
-        for loc in schedule:
-            for cab in schedule[loc]:
-                for shift in schedule[loc][cab]:
-                    if schedule[loc][cab][shift] is not None:
-                        doctor_penalty[schedule[loc][cab][shift]] += 0.5
+        schedule = generate_preference_schedule(instance, out_res, doctor_penalty, week, engine=engine, control=control, cache=cache, states=states,
+                                                parts=parts, pool=pool, reduce=reduce, aggregate=aggregate)
+        schedules.append(schedule)
+        if control is not None:
+            control.week_done(schedule)
+        for doctor in schedule.doctors:
+            if doctor is not None:
+                doctor_penalty[doctor] += 0.5
         
         for doctor in doctor_penalty:
             if not doctors[doctor]:
                 doctor_penalty[doctor] *= 1.2
     
-    print('Generated monthly schedule')
-
-
-def change_weekly_schedule(input_csv_path: str, loc_cabs_path: str, weekly_schedule_path: str, deleted_shifts: dict) -> str:
-    df = pd.read_csv(input_csv_path)
-    week = int(weekly_schedule_path.split('_')[-2][0])
-    with open(weekly_schedule_path, 'r', encoding='utf-8') as f:
-        weekly_schedule = f.read().splitlines()
-        current_schedule = {}
-        shifts_to_change = set()
-        necessary_set = set()
-        exp_flow = 0
-
-        current_location, current_cab = None, None
-        for line in weekly_schedule:
-            if line.startswith("Локація:"):
-                current_location = line.replace("Локація: ", "").strip()
-            elif line.startswith("Кабінет:"):
-                current_cab = line.replace("Кабінет: ", "").strip()
-            elif line.startswith("-") or line.startswith("="):
-                continue
-            else:
-                shift, doctor = line.split(" - ")
-
-                if doctor == "None" or doctor == "Немає лікаря":
-                    continue
-
-                exp_flow += 1
-                shift = tuple(map(int, shift[1:-1].split(',')))
+    if control is not None and control.truncated:
+        print(f'Monthly schedule stopped early after {len(schedules)} week(s)')
+    else:
+        print('Generated monthly schedule')
+    if cache is not None:
+        print(f'Solve cache: {cache}')
+    return schedules
+
+
+def build_month_network(instance):
+    # All four weeks on one time-expanded network: S -> doctor -> (doctor, week) -> doctor shift
+    # -> (loc, cab, (week, day, shift)) -> (loc, cab) -> T. source -> doctor carries the monthly
+    # MinShifts (MaxShifts once raised by extra_capacity), with nothing split per week. The
+    # penalty is charged on doctor -> (doctor, week), so it grows with the shifts of that week:
+    # the k-th shift of a week costs (p + k) * PENALTY_MULTIPLIER on top of the location cost,
+    # a convex cost that spreads a doctor's shifts over the month. Required shifts are placed
+    # while building: their slot and the doctor's time are left out of the network.
+    schedule = {loc: {cab: {(week, day, shift): None for week in range(1, WEEKS + 1) for day, shift in SHIFT_IDS}
+                      for cab in cabs} for loc, cabs in instance.empty_schedule().items()}
+    costs = {}
+    required = defaultdict(int)
+    # Shift columns run over the month, (week - 1) * len(SHIFT_IDS) + the shift's bit.
+    shifts = len(SHIFT_IDS)
+    doctors, columns = len(instance.doctors), WEEKS * shifts
+    open_slots = np.ones((len(instance.cabinets), columns), dtype=bool)
+    available = np.hstack([instance.availability(week) for week in range(1, WEEKS + 1)])
+
+    for d, doctor in enumerate(instance.doctors):
+        for week in range(1, WEEKS + 1):
+            for loc, cab, (day, shift) in instance.required_shifts[d][week - 1]:
+                if cab in schedule.get(loc, {}) and schedule[loc][cab][(week, day, shift)] is None:
+                    schedule[loc][cab][(week, day, shift)] = doctor
+                    required[(doctor, week)] += 1
+                    column = (week - 1) * shifts + SHIFT_BITS[(day, shift)]
+                    available[d, column] = False
+                    open_slots[instance.cabinet_ids[(loc, cab)], column] = False
 
-                if doctor in deleted_shifts and shift in deleted_shifts[doctor]:
-                    shifts_to_change.add((current_location, current_cab, shift))
-                    continue
+    expected_flow = 0
+    extra_capacity = {}
+    capacity = np.zeros(doctors, dtype=np.int64)
+    for d, doctor in enumerate(instance.doctors):
+        taken = sum(required[(doctor, week)] for week in range(1, WEEKS + 1))
+        min_shifts = max(instance.min_shifts[d] - taken, 0)
+        expected_flow += min_shifts
+        extra_capacity[doctor] = max(instance.max_shifts[d] - taken, 0) - min_shifts
+        capacity[d] = min_shifts
+        for week in range(1, WEEKS + 1):
+            costs[(doctor, week)] = instance.costs[doctor]
+
+    # Every doctor's nodes in a row: the doctor, then per week its (doctor, week) node followed
+    # by the doctor shifts of that week.
+    slot_ids = _number(open_slots, 2)
+    used = open_slots.any(axis=1)
+    cabinet_ids = _number(used, 2 + np.count_nonzero(open_slots))
+    weekly = available.reshape(doctors, WEEKS, shifts)
+    block = np.concatenate((np.ones((doctors, 1), dtype=bool),
+                            np.concatenate((np.ones((doctors, WEEKS, 1), dtype=bool), weekly), axis=2).reshape(doctors, -1)), axis=1)
+    block_ids = _number(block, 2 + np.count_nonzero(open_slots) + np.count_nonzero(used))
+    doctor_ids = block_ids[:, 0]
+    week_ids = block_ids[:, 1:].reshape(doctors, WEEKS, shifts + 1)[:, :, 0]
+    shift_ids = block_ids[:, 1:].reshape(doctors, WEEKS, shifts + 1)[:, :, 1:].reshape(doctors, columns)
+
+    names, types = ['S', 'T'], ['source', 'sink']
+    slot_cabinet, slot_column = np.nonzero(open_slots)
+    for c, column in zip(slot_cabinet.tolist(), slot_column.tolist()):
+        names.append(instance.cabinets[c] + ((column // shifts + 1,) + SHIFT_IDS[column % shifts],))
+        types.append('loc_cab_shift')
+    for c in np.flatnonzero(used).tolist():
+        names.append(instance.cabinets[c])
+        types.append('cabinet')
+    for d, column in zip(*(index.tolist() for index in np.nonzero(block))):
+        if column == 0:
+            names.append(instance.doctors[d])
+            types.append(None)
+            continue
+        week, column = divmod(column - 1, shifts + 1)
+        key = (instance.doctors[d], week + 1)
+        if column == 0:
+            names.append(key)
+            types.append('doctor')
+        else:
+            names.append((key, (week + 1,) + SHIFT_IDS[column - 1]))
+            types.append('doctor_shift')
+
+    shift_doctor, shift_column = np.nonzero(available)
+    doctor, cabinet, column = _assignment_arcs(instance, available, open_slots[instance.eligible_cabinet])
+    tails = np.concatenate((slot_ids[slot_cabinet, slot_column], cabinet_ids[used], np.zeros(doctors, dtype=np.int64), np.repeat(doctor_ids, WEEKS),
+                            week_ids[shift_doctor, shift_column // shifts], shift_ids[doctor, column]))
+    heads = np.concatenate((cabinet_ids[slot_cabinet], np.ones(np.count_nonzero(used), dtype=np.int64), doctor_ids, week_ids.reshape(-1),
+                            shift_ids[shift_doctor, shift_column], slot_ids[cabinet, column]))
+    capacities = np.concatenate((np.ones(len(slot_cabinet), dtype=np.int64), open_slots.sum(axis=1)[used], capacity, weekly.sum(axis=2).reshape(-1),
+                                 np.ones(len(shift_doctor) + len(doctor), dtype=np.int64)))
+    network = FlowNetwork.from_arrays(names, types, tails, heads, capacities)
+
+    return network, costs, schedule, required, expected_flow, extra_capacity
+
+
+def _split_month(schedule):
+    # The solver fills slots with its (doctor, week) keys, required shifts hold plain names.
+    weeks = {}
+    for loc, cabs in schedule.items():
+        for cab, slots in cabs.items():
+            for (week, day, shift), doctor in slots.items():
+                if isinstance(doctor, tuple):
+                    doctor = doctor[0]
+                weeks.setdefault(week, {}).setdefault(loc, {}).setdefault(cab, {})[(day, shift)] = doctor
+    return [WeekSchedule.from_dict(week, weeks[week]) for week in sorted(weeks)]
+
+
+def generate_joint_monthly_schedule(instance: ProblemInstance, output_path=None, engine: str = 'dijkstra', format: str = 'jsonl', control: SolveControl = None):
+    # One build and two solves for the month instead of four of each: monthly MinShifts first,
+    # then topping up to MaxShifts on the same locked residual network and potentials, as a
+    # week does. The doctor penalty of week w starts where the week-by-week run would bring an
+    # idle doctor: 4 * 1.2 ** (w - 1) unless the doctor is Fine. Cabinet penalties count the
+    # whole month. No week state is saved, so a later change of one week rebuilds that week.
+    # The month's solver stats go on week 1.
+    if engine not in ('dijkstra', 'bellman_ford'):
+        raise ValueError(f"Engine {engine} cannot solve the joint month, use dijkstra or bellman_ford")
+
+    stats = {'joint necessary': SolveStats(), 'joint preference': SolveStats()}
+
+    stats['joint necessary'].start()
+    network, costs, schedule, required, expected_flow, extra_capacity = build_month_network(instance)
+    stats['joint necessary'].stop('build_time')
 
-                if doctor not in current_schedule:
-                    current_schedule[doctor] = set()
-                
-                current_schedule[doctor].add((current_location, current_cab, shift))
-                necessary_set.add((current_location, current_cab, shift))
-    
-    with open(loc_cabs_path, 'r', encoding='utf-8') as f:
-        loc_cabs_data = json.load(f)
-        loc_cabs_dict = {}
+    doctor_penalty = {}
+    for doctor, fine in zip(instance.doctors, instance.fine):
+        for week in range(1, WEEKS + 1):
+            doctor_penalty[(doctor, week)] = (0 if fine else 4 * 1.2 ** (week - 1)) + required[(doctor, week)]
+    cabinet_penalty = defaultdict(int)
+    for loc, cabs in schedule.items():
+        for cab, slots in cabs.items():
+            cabinet_penalty[(loc, cab)] += sum(doctor is not None for doctor in slots.values())
+    potential = [0] * len(network)
+
+    if control is not None:
+        control.begin(None, 'joint necessary', expected_flow)
+    flow, _, schedule = min_cost_max_flow(network, costs, doctor_penalty, cabinet_penalty, {}, schedule, 'S', 'T', engine=engine, potential=potential,
+                                          stats=stats['joint necessary'], control=control)
+    if flow != expected_flow:
+        print(f"Warning: Expected flow {expected_flow}, but got {flow}. Not all doctors may be assigned their minimum shifts.")
+    else:
+        print('Minimum requirements satisfied')
 
-        for elem in loc_cabs_data:
-            loc = elem['location']
-            cabinets = elem['room']
-            spec = elem['specialization']
-            if not loc in loc_cabs_dict:
-                loc_cabs_dict[loc] = {}
+    stats['joint preference'].start()
+    network.lock_flow()
+    source = network.ids['S']
+    for doctor, extra in extra_capacity.items():
+        a = network.arc(source, network.ids[doctor])
+        network.residual[a] += extra
+        network.capacity[a] += extra
+    stats['joint preference'].stop('build_time')
+
+    if control is not None:
+        control.begin(None, 'joint preference', _remaining_flow(network))
+    _, _, schedule = min_cost_max_flow(network, costs, doctor_penalty, cabinet_penalty, {}, schedule, 'S', 'T', engine=engine, potential=potential,
+                                       stats=stats['joint preference'], control=control)
+
+    schedules = _split_month(schedule)
+    schedules[0].stats = stats
+    for result in schedules:
+        result.truncated = control is not None and control.truncated
+        if output_path is not None:
+            out_res = os.path.join(output_path, f"week_{result.week}.{format}")
+            result.write(out_res)
+            if os.path.exists(state_path(out_res)):
+                os.remove(state_path(out_res))
+        if control is not None:
+            control.week_done(result)
+
+    if control is not None and control.truncated:
+        print('Joint monthly schedule stopped early')
+    else:
+        print('Generated joint monthly schedule')
+    return schedules
 
-            loc_cabs_dict[loc][spec] = split_data(cabinets)
 
-    costs = {}
-    days, shifts = range(1, 8), range(1, 3)
-    all_shift_ids = [(d, s) for d, s in itertools.product(days, shifts)]
-    G = nx.DiGraph()
+def rebuild_weekly_schedule(instance, week, current_schedule, shifts_to_change, necessary_set, deleted_shifts, engine='dijkstra', stats=None, control=None):
+    if stats is not None:
+        stats.start()
     source, sink = 'S', 'T'
-    G.add_node(source, type='source')
-    G.add_node(sink, type='sink')
     cabinet_penalty = defaultdict(int)
     doctor_penalty = {}
-    schedule = {}
-
-    for loc in loc_cabs_dict:
-        for spec in loc_cabs_dict[loc]:
-            for cab in loc_cabs_dict[loc][spec]:
-                cabinet_penalty[(loc, cab)] = 0
-                for shift in all_shift_ids:
-                    schedule.setdefault(loc, {}).setdefault(cab, {})
-                    schedule[loc][cab][shift] = None
-
-                    if (loc, cab, shift) in shifts_to_change or (loc, cab, shift) in necessary_set:
-                        G.add_node((loc, cab, shift), type='loc_cab_shift')
-                        G.add_edge((loc, cab, shift), sink, capacity=1)
-
-    doctors = {row['Doctor']: int(row['Fine']) for _, row in df.iterrows()}
-    for doc, fine in doctors.items():
+    schedule = instance.empty_schedule()
+
+    # Only the freed slots and the kept ones get a node; a doctor may move to a freed slot or
+    # stay in a slot of their own.
+    changing = np.zeros((len(instance.cabinets), len(SHIFT_IDS)), dtype=bool)
+    kept = np.zeros_like(changing)
+    for loc, cab in instance.cabinets:
+        cabinet_penalty[(loc, cab)] = 0
+    for slots, mask in ((shifts_to_change, changing), (necessary_set, kept)):
+        for loc, cab, shift in slots:
+            if (loc, cab) in instance.cabinet_ids and shift in SHIFT_BITS:
+                mask[instance.cabinet_ids[(loc, cab)], SHIFT_BITS[shift]] = True
+
+    for doc, fine in zip(instance.doctors, instance.fine):
         doctor_penalty[doc] = len(current_schedule.get(doc, set())) / 2
         doctor_penalty[doc] += 4 if not fine else 0
 
-    for _, row in df.iterrows():
-
-        doctor = row['Doctor']
-        costs[doctor] = {}
+    available = instance.availability(week)
+    allowed = changing[instance.eligible_cabinet]
+    first = np.searchsorted(instance.eligible_doctor, np.arange(len(instance.doctors)))
+    capacity = np.zeros(len(instance.doctors), dtype=np.int64)
 
-        specs = split_data(row['Specialization'])
-        locs = split_data(row['Cabinets'])
+    for d, doctor in enumerate(instance.doctors):
 
-        max_shifts = distribute_evenly(int(row['MaxShifts']) if pd.notna(row['MaxShifts']) else 4 * len(all_shift_ids))[week - 1]
+        max_shifts = instance.weekly_max(d, week)
 
         if doctor in deleted_shifts:
             max_shifts = len(current_schedule.get(doctor, set()))
+            for shift in deleted_shifts[doctor]:
+                if shift in SHIFT_BITS:
+                    available[d, SHIFT_BITS[shift]] = False
+
+        capacity[d] = max_shifts
+
+        if doctor in current_schedule:
+            position = {cabinet: first[d] + i for i, (cabinet, _) in enumerate(instance.eligible[d])}
+            for loc, cab, shift in current_schedule[doctor]:
+                pair = position.get(instance.cabinet_ids.get((loc, cab)))
+                if pair is not None and shift in SHIFT_BITS:
+                    allowed[pair, SHIFT_BITS[shift]] = True
+
+    network = _shift_network(instance, changing | kept, available, capacity, allowed)
+    if stats is not None:
+        stats.stop('build_time')
+
+    flow, _, schedule = min_cost_max_flow(network, instance.costs, doctor_penalty, cabinet_penalty, current_schedule, schedule, source, sink, engine=engine, stats=stats, control=control)
+    return flow, schedule
+
+
+def repair_weekly_schedule(instance, state, week, current_schedule, shifts_to_change, deleted_shifts, engine='dijkstra', stats=None, control=None):
+    # Every assignment that was not deleted stays where it is, so only the freed slots are routed:
+    # a replacement is a doctor under MaxShifts who is free at that shift, and the candidates are
+    # read off the arcs into the freed slot in the saved week network (the network of the part
+    # it is in, for a week solved in parts). Costs and penalties are the ones
+    # rebuild_weekly_schedule would use, so the repaired week costs the same as a rebuilt one.
+    # It is not always the same schedule: ties between equally good doctors are broken by a
+    # noise that follows arc numbering (see ArcCosts), and the two networks number arcs
+    # differently.
+    if stats is not None:
+        stats.start()
+    networks = _state_networks(state)
+    busy = {(doctor, shift) for doctor, slots in current_schedule.items() for _, _, shift in slots}
+
+    network = FlowNetwork()
+    source, sink = 'S', 'T'
+    network.add_node(source, type='source')
+    network.add_node(sink, type='sink')
+    cabinet_penalty = defaultdict(int)
+    doctor_penalty = {}
+    spare = {}
+    gathered = defaultdict(int)
+    schedule = instance.empty_schedule()
+
+    for d, doctor in enumerate(instance.doctors):
+        count = len(current_schedule.get(doctor, set()))
+        doctor_penalty[doctor] = count / 2 + (4 if not instance.fine[d] else 0) + count
+        spare[doctor] = 0 if doctor in deleted_shifts else instance.weekly_max(d, week) - count
+        for loc, cab, shift in current_schedule.get(doctor, set()):
+            cabinet_penalty[(loc, cab)] += 1
+            schedule[loc][cab][shift] = doctor
+
+    for slot in sorted(shifts_to_change):
+        network.add_node(slot, type='loc_cab_shift')
+        network.add_node(slot[:2], type='cabinet')
+        network.add_edge(slot, slot[:2], capacity=1)
+        gathered[slot[:2]] += 1
+        network.add_edge(slot[:2], sink, capacity=gathered[slot[:2]])
+
+        week_network = next((network for network, _ in networks if slot in network.ids), None)
+        if week_network is None:
+            continue
+        node = week_network.ids[slot]
 
-        forbidden = set(split_data(row['ForbiddenShifts'])) if pd.notna(row['ForbiddenShifts']) else set()
-        forbidden = set(tuple(map(int, data.split('.')[1:])) for data in forbidden if data[0] == str(week))
-
-        G.add_node(doctor, type='doctor')
-        G.add_edge(source, doctor, capacity=max_shifts)
-
-        for shift in all_shift_ids:
-            if shift in forbidden or (doctor in deleted_shifts and shift in deleted_shifts[doctor]):
+        for a in range(week_network.first[node], week_network.first[node + 1]):
+            if week_network.kind[a] != UNASSIGN:
                 continue
-            G.add_node((doctor, shift), type='doctor_shift')
-            G.add_edge(doctor, (doctor, shift), capacity=1)
 
-        for i, loc in enumerate(locs):
+            doctor, shift = week_network.names[week_network.head[a]]
+            if spare[doctor] <= 0 or (doctor, shift) in busy or shift in deleted_shifts.get(doctor, ()):
+                continue
 
-            if loc not in costs:
-                costs[loc] = {}
+            network.add_node(doctor, type='doctor')
+            network.add_edge(source, doctor, capacity=spare[doctor])
+            network.add_node((doctor, shift), type='doctor_shift')
+            network.add_edge(doctor, (doctor, shift), capacity=1)
+            network.add_edge((doctor, shift), slot, capacity=1)
+
+    network.freeze()
+    # S and T are in every part; whichever part's potentials they take, every path from S to T
+    # is shifted by the same amount.
+    known = {}
+    for week_network, week_potential in reversed(networks):
+        known.update(zip(week_network.names, week_potential))
+    potential = [known.get(name, 0) for name in network.names]
+    if stats is not None:
+        stats.stop('build_time')
+
+    flow, _, schedule = min_cost_max_flow(network, instance.costs, doctor_penalty, cabinet_penalty, {}, schedule, source, sink, engine=engine, potential=potential, stats=stats, control=control)
+    return flow + len(busy), schedule
+
+
+def change_weekly_schedule(input_csv_path: str, loc_cabs_path: str, weekly_schedule_path: str, deleted_shifts: dict, engine: str = 'dijkstra', instance: ProblemInstance = None, incremental: bool = True, schedule: WeekSchedule = None,
+                           control: SolveControl = None, state: dict = None, vacated: set = None) -> WeekSchedule:
+    # The week comes either as a file (jsonl, txt or xlsx, rewritten in place) or as a
+    # WeekSchedule; with both, the file is only used to find the saved week state. A state held
+    # in memory (see week_state) can be passed instead; its schedule is updated in place.
+    # vacated are (loc, cab, shift) slots already emptied in the schedule that are filled again
+    # along with the deleted ones, without holding anything against the doctors who left them.
+    instance = instance or ProblemInstance.from_files(input_csv_path, loc_cabs_path)
+    if schedule is None:
+        schedule = WeekSchedule.read(weekly_schedule_path)
+        output_path = weekly_schedule_path
+    else:
+        output_path = None
+    week = schedule.week
 
-            costs[doctor][loc] = costs[loc][doctor] = 5*i + 1
+    current_schedule = {}
+    shifts_to_change = set()
+    necessary_set = set()
+    listed = schedule.assignments()
+    exp_flow = 0
 
-            for spec in specs:
-                if loc in loc_cabs_dict and spec in loc_cabs_dict[loc]:
-                    for cab in loc_cabs_dict[loc][spec]:
-                        for shift in all_shift_ids:
-                            if shift in forbidden or (doctor in deleted_shifts and shift in deleted_shifts[doctor]):
-                                continue
+    for current_location, current_cab, shift, doctor in schedule.rows():
+        if doctor is None:
+            continue
 
-                            if (loc, cab, shift) in shifts_to_change:
-                                G.add_edge((doctor, shift), (loc, cab, shift), capacity=1)
+        exp_flow += 1
 
-                            if doctor in current_schedule and (loc, cab, shift) in current_schedule[doctor]:
-                                G.add_edge((doctor, shift), (loc, cab, shift), capacity=1)
+        if doctor in deleted_shifts and shift in deleted_shifts[doctor]:
+            shifts_to_change.add((current_location, current_cab, shift))
+            continue
 
-    flow, _, schedule = min_cost_max_flow(G, costs, doctor_penalty, cabinet_penalty, current_schedule, schedule, source, sink)
+        if doctor not in current_schedule:
+            current_schedule[doctor] = set()
+
+        current_schedule[doctor].add((current_location, current_cab, shift))
+        necessary_set.add((current_location, current_cab, shift))
+
+    for slot in vacated or ():
+        exp_flow += 1
+        shifts_to_change.add(slot)
+
+    path = state_path(weekly_schedule_path) if weekly_schedule_path else None
+    held = state
+    if state is not None:
+        state = state if incremental and _state_matches(state, week, instance) else None
+    elif incremental and path:
+        state = load_week_state(path, week, instance)
+
+    stats = SolveStats()
+    repairable = state is not None
+    if repairable and reverse_schedule_dict(state['schedule']) != listed:
+        print("Warning: Saved week state does not match the schedule file, rebuilding the week.")
+        repairable = False
+    if repairable and any(not any(slot in network.ids for network, _ in _state_networks(state)) for slot in shifts_to_change):
+        # A slot the reduced week network left out (a required or a forced one, or one merged
+        # with other cabinets) has no candidates to read off it.
+        repairable = False
+    phase = 'repair' if repairable else 'rebuild'
+
+    if control is not None:
+        control.begin(week, phase, exp_flow)
+    if repairable:
+        flow, schedule = repair_weekly_schedule(instance, state, week, current_schedule, shifts_to_change, deleted_shifts, engine, stats, control)
+    else:
+        flow, schedule = rebuild_weekly_schedule(instance, week, current_schedule, shifts_to_change, necessary_set, deleted_shifts, engine, stats, control)
 
     if flow < exp_flow:
         print(f"Warning: Expected flow {exp_flow}, but got {flow}. Not all shifts have a suitable replacement.")
 
-    with open(weekly_schedule_path, "w", encoding="utf-8") as f:
-        for loc in sorted(schedule.keys()):
-            f.write(f"Локація: {loc}\n")
-            f.write("="*40 + "\n")
-            
-            for cab in sorted(schedule[loc].keys()):
-                f.write(f"Кабінет: {cab}\n")
-                f.write("-"*30 + "\n")
-                
-                for shift in all_shift_ids:
-                    assigned = schedule[loc][cab].get(shift, "Немає лікаря")
-                    f.write(f"{shift} - {assigned}\n")
-                
-                f.write("-"*30 + "\n")
+    result = WeekSchedule.from_dict(week, schedule)
+    result.stats = {phase: stats}
+    result.truncated = control is not None and control.truncated
+    if output_path is not None:
+        result.write(output_path)
+    if held is not None:
+        held['schedule'] = schedule
+    elif state is not None:
+        save_week_state(path, week, instance, schedule, state['network'], state['potential'])
+    if control is not None:
+        control.week_done(result)
+
+    return result
 
 
 if __name__ == "__main__":
@@ -390,5 +961,5 @@ if __name__ == "__main__":
     loc_cabs_path = "./data/new_data/rooms_locations_updated.json"
     output_path = "./result/"
     week_path = "./result/week_1.txt"
-    generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, output_path)
+    generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, output_path, format='txt')
         
\ No newline at end of file
@@ -0,0 +1,332 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from algo_flow import build_week_network, calculate_necessary_allocations, generate_preference_schedule_from_csv, \
+    generate_monthly_schedule_from_csv, change_weekly_schedule
+from instance_generator import generate_instance, write_instance
+from maximum_flow_impl import min_cost_max_flow
+from problem_instance import ProblemInstance, parse_loc_cabs
+from solve_cache import SolveCache
+from solver_stats import SolveStats
+from week_schedule import WeekSchedule
+
+BENCHMARKS = ['min_cost_max_flow', 'calculate_necessary_allocations', 'generate_preference_schedule_from_csv',
+              'generate_monthly_schedule_from_csv', 'generate_monthly_schedule_cached', 'generate_monthly_schedule_joint', 'change_weekly_schedule',
+              'change_weekly_schedule_full']
+
+
+def _initial_penalty(instance):
+    return {doctor: 4 if not fine else 0 for doctor, fine in zip(instance.doctors, instance.fine)}
+
+
+def _deleted_shifts(schedule, count=3):
+    deleted = {}
+    for _, _, shift, doctor in schedule.rows():
+        if doctor is not None and doctor not in deleted:
+            deleted[doctor] = [shift]
+            if len(deleted) == count:
+                break
+    return deleted
+
+
+def _flow_network(instance):
+    # Week 1 with every doctor open up to the weekly maximum, solved in one go.
+    network, necessary_shifts, schedule, _, extra_capacity = build_week_network(instance, 1)
+    source = network.ids['S']
+    for doctor, extra in extra_capacity.items():
+        network.residual[network.arc(source, network.ids[doctor])] += extra
+    return network, necessary_shifts, schedule
+
+
+def _cases(workdir, input_csv_path, loc_cabs_path, instance, engine):
+    # Every case is (setup, run): setup is not timed and hands its result to run.
+    def flow_setup():
+        return _flow_network(instance)
+
+    def flow_run(args):
+        network, necessary_shifts, schedule = args
+        min_cost_max_flow(network, instance.costs, _initial_penalty(instance), defaultdict(int), necessary_shifts, schedule, 'S', 'T', engine=engine)
+
+    def necessary_setup():
+        network, necessary_shifts, schedule, expected_flow, _ = build_week_network(instance, 1)
+        return network, necessary_shifts, schedule, expected_flow
+
+    def necessary_run(args):
+        network, necessary_shifts, schedule, expected_flow = args
+        calculate_necessary_allocations(network, instance.costs, necessary_shifts, schedule, expected_flow, _initial_penalty(instance),
+                                        defaultdict(int), [0] * len(network), engine=engine)
+
+    def preference_run(_):
+        generate_preference_schedule_from_csv(input_csv_path, loc_cabs_path, None, _initial_penalty(instance), 1, engine=engine)
+
+    def monthly_run(_):
+        generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, workdir, engine=engine)
+
+    def cached_setup():
+        # A regeneration with every week already in the cache.
+        cache = SolveCache(os.path.join(workdir, 'cache'))
+        if not cache.stats()['entries']:
+            generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, None, engine=engine, cache=cache)
+        return cache
+
+    def cached_run(cache):
+        generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, workdir, engine=engine, cache=cache)
+
+    def joint_run(_):
+        generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, None, engine=engine, joint=True)
+
+    def change_setup():
+        # The repair rewrites the week and its saved state, so both start from a copy every time.
+        # A week without a saved state is rebuilt by the incremental run too.
+        week_path, state = os.path.join(workdir, 'week_1.jsonl'), os.path.join(workdir, 'week_1.state')
+        if not os.path.exists(state + '.orig'):
+            generate_monthly_schedule_from_csv(input_csv_path, loc_cabs_path, workdir, engine=engine)
+            if os.path.exists(state):
+                shutil.copy(state, state + '.orig')
+        if os.path.exists(state + '.orig'):
+            shutil.copy(state + '.orig', state)
+        schedule = WeekSchedule.read(week_path)
+        change_path = os.path.join(workdir, 'week_1_temp.jsonl')
+        schedule.write(change_path)
+        return change_path, _deleted_shifts(schedule)
+
+    def change_run(incremental):
+        def run(args):
+            change_path, deleted = args
+            change_weekly_schedule(input_csv_path, loc_cabs_path, change_path, deleted, engine=engine, incremental=incremental)
+        return run
+
+    return {
+        'min_cost_max_flow': (flow_setup, flow_run),
+        'calculate_necessary_allocations': (necessary_setup, necessary_run),
+        'generate_preference_schedule_from_csv': (lambda: None, preference_run),
+        'generate_monthly_schedule_from_csv': (lambda: None, monthly_run),
+        'generate_monthly_schedule_cached': (cached_setup, cached_run),
+        'generate_monthly_schedule_joint': (lambda: None, joint_run),
+        'change_weekly_schedule': (change_setup, change_run(True)),
+        'change_weekly_schedule_full': (change_setup, change_run(False)),
+    }
+
+
+def _measure(setup, run, repeat, memory):
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            args = setup()
+            start = time.perf_counter()
+            run(args)
+            times.append(time.perf_counter() - start)
+
+        peak = None
+        if memory:
+            args = setup()
+            tracemalloc.start()
+            run(args)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return min(times), peak
+
+
+def _instance_size(doctors, sites=1):
+    # Locations grow with the staff so the number of cabinets keeps pace with the doctors;
+    # sites splits them into that many independent parts.
+    return {'doctors': doctors, 'locations': max(2, math.ceil(doctors / 20 / sites)), 'specializations': 5, 'cabinets_per_spec': 2, 'sites': sites}
+
+
+def run_benchmarks(sizes, benchmarks=None, repeat=3, memory=True, engine='dijkstra', seed=0, sites=1):
+    benchmarks = benchmarks or BENCHMARKS
+    results = []
+
+    for doctors in sizes:
+        params = _instance_size(doctors, sites)
+        rows, loc_cabs_data = generate_instance(seed=seed, **params)
+        instance = ProblemInstance(rows, parse_loc_cabs(loc_cabs_data))
+
+        with tempfile.TemporaryDirectory() as workdir:
+            input_csv_path, loc_cabs_path = os.path.join(workdir, 'doctors.csv'), os.path.join(workdir, 'rooms.json')
+            write_instance(rows, loc_cabs_data, input_csv_path, loc_cabs_path)
+            cases = _cases(workdir, input_csv_path, loc_cabs_path, instance, engine)
+
+            for name in benchmarks:
+                seconds, peak = _measure(*cases[name], repeat, memory)
+                results.append({'benchmark': name, 'size': doctors, 'cabinets': len(instance.cabinets), 'seconds': seconds, 'peak_bytes': peak})
+                print(f"{name:<40} {doctors:>5} doctors {seconds:>9.4f} s" + (f" {peak / 2**20:>8.1f} MiB" if peak is not None else ''))
+
+    return {
+        'meta': {'engine': engine, 'seed': seed, 'sites': sites, 'repeat': repeat, 'python': platform.python_version(), 'platform': platform.platform(),
+                 'date': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+        'scaling': scaling(results),
+    }
+
+
+def compare_engines(sizes, engines, repeat=3, seed=0):
+    # min_cost_max_flow on the same week under every engine: time, flow and the cost of the
+    # schedule it ends with, all priced the same way, so approximate engines show their gap.
+    from decomposition import convex_objective
+
+    results = []
+    for doctors in sizes:
+        rows, loc_cabs_data = generate_instance(seed=seed, **_instance_size(doctors))
+        instance = ProblemInstance(rows, parse_loc_cabs(loc_cabs_data))
+        for engine in engines:
+            times = []
+            for _ in range(repeat):
+                network, necessary_shifts, schedule = _flow_network(instance)
+                penalty = _initial_penalty(instance)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    flow, _, schedule = min_cost_max_flow(network, instance.costs, penalty, defaultdict(int), necessary_shifts, schedule,
+                                                          'S', 'T', engine=engine, seed=seed)
+                times.append(time.perf_counter() - start)
+
+            stats = SolveStats()
+            if engine == 'decomposed':
+                # One more run, not timed, to compare with an exact solve of the same network.
+                network, necessary_shifts, reference = _flow_network(instance)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    min_cost_max_flow(network, instance.costs, _initial_penalty(instance), defaultdict(int), necessary_shifts, reference,
+                                      'S', 'T', engine=engine, seed=seed, stats=stats, compare=True)
+
+            doctor_count, cabinet_count, base_cost = defaultdict(int), defaultdict(int), 0
+            for loc in schedule:
+                for cab in schedule[loc]:
+                    for doctor in schedule[loc][cab].values():
+                        if doctor is not None:
+                            doctor_count[doctor] += 1
+                            cabinet_count[(loc, cab)] += 1
+                            base_cost += instance.costs[doctor][loc]
+            cost = convex_objective(doctor_count, cabinet_count, base_cost, _initial_penalty(instance), defaultdict(int))
+
+            results.append({'engine': engine, 'size': doctors, 'seconds': min(times), 'flow': flow, 'cost': cost})
+            print(f"{engine:<14} {doctors:>5} doctors {min(times):>9.4f} s  flow {flow:>6}  cost {cost:>12.1f}")
+            if stats.report is not None:
+                print(f"{'':<14} {stats.report}")
+    return results
+
+
+def scaling(results):
+    # Exponent k of seconds ~ size ** k, from a least-squares fit on the log-log curve.
+    series = defaultdict(list)
+    for result in results:
+        if result['seconds'] > 0:
+            series[result['benchmark']].append((math.log(result['size']), math.log(result['seconds'])))
+
+    exponents = {}
+    for name, points in series.items():
+        if len(points) < 2:
+            continue
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        spread = sum((x - mean_x) ** 2 for x, _ in points)
+        if spread:
+            exponents[name] = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+    return exponents
+
+
+def compare(report, baseline, tolerance=0.2):
+    previous = {(r['benchmark'], r['size']): r for r in baseline['results']}
+    regressions = []
+
+    for result in report['results']:
+        old = previous.get((result['benchmark'], result['size']))
+        if old is None or not old['seconds']:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        marker = ''
+        if ratio > 1 + tolerance:
+            marker = '  <-- slower'
+            regressions.append((result['benchmark'], result['size'], ratio))
+        print(f"{result['benchmark']:<40} {result['size']:>5} doctors {old['seconds']:>9.4f} -> {result['seconds']:>9.4f} s  x{ratio:.2f}{marker}")
+
+    return regressions
+
+
+def import_times(modules=('customtkinter', 'solve_control', 'algo_flow', 'week_schedule', 'openpyxl')):
+    # Cold import of each module in a fresh interpreter, so one does not pay for another's
+    # dependencies; a module that is not installed is reported as None.
+    times = {}
+    for module in modules:
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        times[module] = float(result.stdout) if result.returncode == 0 else None
+    return times
+
+
+def startup(command=None, repeat=5):
+    # Wall clock from launch until the app exits on its own, with SCHEDULE_STARTUP_BENCHMARK
+    # making it close once the window is shown ('window') or once the solver is preloaded
+    # ('ready'). command is the bundled executable, or main.py under this interpreter.
+    command = command or [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')]
+    results = {}
+    for stage in ('window', 'ready'):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, env={**os.environ, 'SCHEDULE_STARTUP_BENCHMARK': stage}, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=300)
+            times.append(time.perf_counter() - start)
+        results[stage] = {'min': min(times), 'median': sorted(times)[len(times) // 2]}
+        print(f"startup until {stage:<6} {results[stage]['min']:>9.4f} s min {results[stage]['median']:>9.4f} s median")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the scheduler on synthetic clinics')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 20, 40, 80])
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run for peak memory')
+    parser.add_argument('--engine', default='dijkstra')
+    parser.add_argument('--engines', nargs='+', default=None,
+                        help='compare min_cost_max_flow under these engines instead (e.g. dijkstra convex decomposed)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sites', type=int, default=1, help='clinics made of this many independent sites')
+    parser.add_argument('--output', default=None, help='JSON report')
+    parser.add_argument('--baseline', default=None, help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--startup', nargs='*', default=None,
+                        help='time the app start instead, optionally of a given command (e.g. dist/ScheduleManager.exe)')
+    args = parser.parse_args()
+
+    if args.startup is not None:
+        for module, seconds in import_times().items():
+            print(f"import {module:<34} " + (f"{seconds:>9.4f} s" if seconds is not None else "not installed"))
+        startup(args.startup or None, args.repeat)
+        raise SystemExit(0)
+
+    if args.engines:
+        results = compare_engines(args.sizes, args.engines, args.repeat, args.seed)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        raise SystemExit(0)
+
+    report = run_benchmarks(args.sizes, args.benchmarks, args.repeat, not args.no_memory, args.engine, args.seed, args.sites)
+
+    for name, exponent in report['scaling'].items():
+        print(f"{name:<40} time ~ size^{exponent:.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(1)
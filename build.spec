@@ -11,7 +11,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['pandas'],  # not used anywhere, keeps the onefile archive small to unpack
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -0,0 +1,177 @@
+import copy
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import networkx as nx
+
+from maximum_flow_impl import PENALTY_MULTIPLIER, COST_SCALE, _complete_flow, _slice_arcs, _solve_convex
+
+# The pool slices are solved in when the caller does not pass one: started on first use and kept
+# for every later solve of this process, so a month of solves starts its workers once. A forked
+# child does not own the pool it inherited and starts its own.
+_pool, _pool_key = None, None
+
+
+class SliceReport:
+    def __init__(self, flow, cost, rounds, monolithic_flow=None, monolithic_cost=None):
+        self.flow = flow
+        self.cost = cost
+        self.rounds = rounds
+        self.monolithic_flow = monolithic_flow
+        self.monolithic_cost = monolithic_cost
+
+    @property
+    def gap(self):
+        if self.monolithic_cost is None or self.flow != self.monolithic_flow:
+            return None
+        return (self.cost - self.monolithic_cost) / max(abs(self.monolithic_cost), 1e-9)
+
+    def __str__(self):
+        text = f"Shift decomposition: flow {self.flow}, cost {self.cost:.2f} after {self.rounds} rounds"
+        if self.monolithic_cost is not None:
+            text += f"; monolithic flow {self.monolithic_flow}, cost {self.monolithic_cost:.2f}"
+            if self.gap is not None:
+                text += f", gap {self.gap:.2%}"
+        return text
+
+
+def convex_objective(counts_by_doctor, counts_by_cabinet, base_cost, doctor_penalty, cabinet_penalty):
+    # The k-th assignment of a doctor (or cabinet) is priced at penalty + k, so n of them add up to
+    # n * penalty + n * (n - 1) / 2 whatever order they were made in.
+    total = base_cost
+    for d, n in counts_by_doctor.items():
+        total += (n * doctor_penalty[d] + n * (n - 1) / 2) * PENALTY_MULTIPLIER
+    for c, n in counts_by_cabinet.items():
+        total += (n * cabinet_penalty[c] + n * (n - 1) / 2) * PENALTY_MULTIPLIER
+    return total
+
+
+def _assign_slice(edges):
+    # One shift: a min-cost matching of doctor shifts to cabinet shifts where only edges with a
+    # negative price are worth taking; the bypass lets every doctor shift stay idle for free.
+    H = nx.DiGraph()
+    people = {p for p, _, _ in edges}
+    H.add_node('s', demand=-len(people))
+    H.add_node('t', demand=len(people))
+    H.add_edge('s', 't', capacity=len(people), weight=0)
+
+    for p in people:
+        H.add_edge('s', ('p', p), capacity=1, weight=0)
+    for p, o, weight in edges:
+        H.add_edge(('p', p), ('o', o), capacity=1, weight=weight)
+        H.add_edge(('o', o), 't', capacity=1, weight=0)
+
+    _, flow = nx.network_simplex(H)
+    return [i for i, (p, o, _) in enumerate(edges) if flow[('p', p)][('o', o)]]
+
+
+def _within_capacity(network, selection, weight, capacity):
+    # Rounding: a doctor picked by more slices than their capacity keeps the cheapest picks.
+    chosen, load = [], defaultdict(int)
+    for a in sorted(selection, key=lambda a: weight[a]):
+        d = network.doctor[a]
+        if load[d] < capacity[d]:
+            load[d] += 1
+            chosen.append(a)
+    return chosen
+
+
+def _assignment_counts(network, arcs):
+    doctors, cabinets = defaultdict(int), defaultdict(int)
+    for a in arcs:
+        doctors[network.doctor[a]] += 1
+        cabinets[network.cabinet[a]] += 1
+    return doctors, cabinets, sum(network.base[a] for a in arcs)
+
+
+def _slice_pool(workers):
+    global _pool, _pool_key
+    key = (os.getpid(), workers)
+    if _pool is None or _pool_key != key:
+        if _pool is not None and _pool_key[0] == key[0]:
+            _pool.shutdown()
+        _pool, _pool_key = ProcessPoolExecutor(max_workers=workers), key
+    return _pool
+
+
+def solve_by_shift(network, doctor_penalty, cabinet_penalty, assigned, source, sink, workers=None, rounds=12, compare=False, seed=0, pool=None, fixed=0):
+    # Shifts only interact through the doctor capacities on source -> doctor and through the
+    # doctor/cabinet penalties, so every shift is solved on its own with those couplings priced:
+    # penalties at their marginal value for the current load, capacities by Lagrange multipliers
+    # updated with a subgradient step. The best rounded solution is then topped up to a maximum
+    # flow on the full network. compare also solves a copy of the network exactly, for the
+    # report's gap; fixed is the flow already placed before the solve (pre-assigned shifts),
+    # which the report counts in both flows.
+    initial_doctors, initial_cabinets = list(doctor_penalty), list(cabinet_penalty)
+
+    monolithic_flow = monolithic_cost = None
+    if compare:
+        reference = copy.deepcopy(network)
+        monolithic_flow, monolithic_cost = _solve_convex(reference, list(doctor_penalty), list(cabinet_penalty), {}, source, sink)
+
+    slices, capacity, source_arc, shift_arc, sink_arc, doctor_node = _slice_arcs(network, source, sink)
+    base, head, doctor, cabinet = network.base, network.head, network.doctor, network.cabinet
+
+    longest = max((base[a] for arcs in slices.values() for a in arcs), default=0)
+    longest += (max(doctor_penalty, default=0) + max(cabinet_penalty, default=0) + 2 * len(slices)) * PENALTY_MULTIPLIER
+    reward = 2 * longest + 1
+
+    multiplier = defaultdict(float)
+    doctor_load, cabinet_load = defaultdict(float), defaultdict(float)
+    best, best_key, previous = [], None, None
+    shifts = sorted(slices)
+    round_number = 0
+
+    workers = workers or os.cpu_count() or 1
+    executor = None
+    if len(shifts) > 1:
+        executor = pool if pool is not None else _slice_pool(workers) if workers > 1 else None
+
+    for round_number in range(1, rounds + 1):
+        weight = {}
+        candidates, payloads = [], []
+        for shift in shifts:
+            arcs, edges = [], []
+            for a in slices[shift]:
+                d, c = doctor[a], cabinet[a]
+                price = base[a] - reward + multiplier[d] \
+                    + (doctor_penalty[d] + doctor_load[d]) * PENALTY_MULTIPLIER \
+                    + (cabinet_penalty[c] + cabinet_load[c]) * PENALTY_MULTIPLIER
+                weight[a] = price
+                if price < 0:
+                    arcs.append(a)
+                    edges.append((network.tail(a), head[a], round(price * COST_SCALE)))
+            candidates.append(arcs)
+            payloads.append(edges)
+
+        picked = executor.map(_assign_slice, payloads) if executor else map(_assign_slice, payloads)
+        selection = [arcs[i] for arcs, indices in zip(candidates, picked) for i in indices]
+
+        doctor_count, cabinet_count, _ = _assignment_counts(network, selection)
+        # Damped update of the loads the penalties are priced at, so prices settle rather than
+        # flip between two extremes from one round to the next.
+        for load, count in ((doctor_load, doctor_count), (cabinet_load, cabinet_count)):
+            for key in set(load) | set(count):
+                load[key] = (load[key] + count[key]) / 2 if round_number > 1 else count[key]
+
+        chosen = _within_capacity(network, selection, weight, capacity)
+        key = (-len(chosen), convex_objective(*_assignment_counts(network, chosen), doctor_penalty, cabinet_penalty))
+        if best_key is None or key < best_key:
+            best, best_key = chosen, key
+
+        if selection == previous:
+            break
+        previous = selection
+
+        step = longest / (round_number + 1)
+        for d in set(multiplier) | set(doctor_count):
+            multiplier[d] = max(0.0, multiplier[d] + step * (doctor_count[d] - capacity[d]) / max(capacity[d], 1))
+
+    # Whatever the rounding had to drop is recovered on the rest of the network.
+    max_flow, min_cost = _complete_flow(network, best, doctor_penalty, cabinet_penalty, assigned, source, sink, (source_arc, shift_arc, sink_arc, doctor_node), seed)
+
+    final = [a for arcs in slices.values() for a in arcs if network.residual[network.reverse[a]] > 0]
+    objective = convex_objective(*_assignment_counts(network, final), initial_doctors, initial_cabinets)
+
+    report = SliceReport(fixed + max_flow, objective, round_number, None if monolithic_flow is None else fixed + monolithic_flow, monolithic_cost)
+    return max_flow, min_cost, report
@@ -0,0 +1,233 @@
+from array import array
+import numpy as np
+
+SOURCE, SINK, DOCTOR, DOCTOR_SHIFT, LOC_CAB_SHIFT, CABINET = range(6)
+NODE_TYPES = {'source': SOURCE, 'sink': SINK, 'doctor': DOCTOR, 'doctor_shift': DOCTOR_SHIFT, 'loc_cab_shift': LOC_CAB_SHIFT,
+              'cabinet': CABINET}
+
+# Arc kinds: an assignment arc goes doctor_shift -> loc_cab_shift, an unassignment arc is the
+# way back; every other arc is free.
+NEUTRAL, ASSIGN, UNASSIGN = 0, 1, -1
+# Arc charges: the arc into a doctor node carries that doctor's penalty and the arc from a
+# cabinet node (which gathers the cabinet's shifts) into the sink its cabinet's; the way back
+# of either has the negated charge.
+DOCTOR_CHARGE, CABINET_CHARGE = 1, 2
+# The arrays of a frozen network, with their typecodes, as saved() hands them out.
+SAVED_ARRAYS = (('node_type', 'b'), ('first', 'i'), ('head', 'i'), ('residual', 'i'), ('capacity', 'i'), ('forward', 'B'), ('reverse', 'i'),
+                ('kind', 'b'), ('base', 'd'), ('charge', 'b'), ('doctor', 'i'), ('cabinet', 'i'))
+
+
+def _to_array(typecode, values):
+    buffer = array(typecode)
+    buffer.frombytes(np.ascontiguousarray(values, dtype=np.dtype(typecode)).tobytes())
+    return buffer
+
+
+class FlowNetwork:
+    # Residual network with nodes interned to dense integer ids. While it is being built it
+    # accepts names like nx.DiGraph does; freeze() lays the arcs out CSR-style so that the
+    # arcs leaving node u are first[u]..first[u + 1] - 1 and reverse[a] is the paired arc of a.
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.node_type = array('b')
+        self.doctors = []
+        self.doctor_ids = {}
+        self.cabinets = []
+        self.cabinet_ids = {}
+        # How many concrete cabinets each of cabinets stands for, when a builder merged some;
+        # None when every one is a single cabinet.
+        self.cabinet_size = None
+        self._edges = {}
+        self.first = None
+
+    @classmethod
+    def from_networkx(cls, G):
+        network = cls()
+        for node, node_type in G.nodes(data='type'):
+            network.add_node(node, node_type)
+        for u, v, data in G.edges(data=True):
+            network.add_edge(u, v, capacity=data.get('capacity', 1))
+        return network
+
+    @classmethod
+    def from_arrays(cls, names, node_types, tails, heads, capacity):
+        # The whole network at once, for builders that already have it as arrays: node names in id
+        # order with their types, and every edge as (tail id, head id, capacity). Same layout as
+        # add_node/add_edge followed by freeze(), given the same node order and edge order.
+        network = cls()
+        network.names = list(names)
+        network.ids = {name: node for node, name in enumerate(network.names)}
+        network.node_type = _to_array('b', [NODE_TYPES.get(node_type, -1) for node_type in node_types])
+        network._edges = None
+        return network._layout(np.asarray(tails, dtype=np.int64), np.asarray(heads, dtype=np.int64), np.asarray(capacity, dtype=np.int64))
+
+    @classmethod
+    def from_saved(cls, arrays, names, doctors, cabinets, cabinet_size=None):
+        # A frozen network back from what saved() gave.
+        network = cls()
+        network.names = list(names)
+        network.ids = {name: node for node, name in enumerate(network.names)}
+        network.doctors, network.cabinets = list(doctors), list(cabinets)
+        network.doctor_ids = {name: index for index, name in enumerate(network.doctors)}
+        network.cabinet_ids = {name: index for index, name in enumerate(network.cabinets)}
+        network.cabinet_size = cabinet_size
+        network._edges = None
+        for field, typecode in SAVED_ARRAYS:
+            setattr(network, field, _to_array(typecode, arrays[field]))
+        network.forward = bytearray(network.forward)
+        return network
+
+    def saved(self):
+        # A frozen network as NumPy arrays (see SAVED_ARRAYS) and plain lists, to be stored
+        # without pickle: (arrays, names, doctors, cabinets, cabinet_size).
+        arrays = {field: np.frombuffer(getattr(self, field), dtype=np.dtype(typecode)) for field, typecode in SAVED_ARRAYS}
+        return arrays, self.names, self.doctors, self.cabinets, self.cabinet_size
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_node(self, name, type=None):
+        node = self.ids.get(name)
+        if node is None:
+            node = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.node_type.append(NODE_TYPES.get(type, -1))
+        elif type is not None:
+            self.node_type[node] = NODE_TYPES[type]
+        return node
+
+    def add_edge(self, u, v, capacity=1):
+        self._edges[(self.add_node(u), self.add_node(v))] = capacity
+
+    def _intern_doctor(self, name):
+        index = self.doctor_ids.get(name)
+        if index is None:
+            index = self.doctor_ids[name] = len(self.doctors)
+            self.doctors.append(name)
+        return index
+
+    def _intern_cabinet(self, name):
+        index = self.cabinet_ids.get(name)
+        if index is None:
+            index = self.cabinet_ids[name] = len(self.cabinets)
+            self.cabinets.append(name)
+        return index
+
+    def freeze(self):
+        if self.first is not None:
+            return self
+
+        m = len(self._edges)
+        tails = np.fromiter((u for u, _ in self._edges), dtype=np.int64, count=m)
+        heads = np.fromiter((v for _, v in self._edges), dtype=np.int64, count=m)
+        caps = np.fromiter(self._edges.values(), dtype=np.int64, count=m)
+        self._edges = None
+        return self._layout(tails, heads, caps)
+
+    def _layout(self, tails, heads, caps):
+        n, m = len(self.names), len(tails)
+        arc_tail = np.concatenate((tails, heads))
+        arc_head = np.concatenate((heads, tails))
+        arc_cap = np.concatenate((caps, np.zeros(m, dtype=np.int64)))
+        paired = np.concatenate((np.arange(m, 2 * m), np.arange(m)))
+
+        order = np.argsort(arc_tail, kind='stable')
+        position = np.empty(2 * m, dtype=np.int64)
+        position[order] = np.arange(2 * m)
+
+        node_type = np.frombuffer(self.node_type, dtype=np.int8)
+        tail_type, head_type = node_type[arc_tail[order]], node_type[arc_head[order]]
+        kind = np.where((tail_type == DOCTOR_SHIFT) & (head_type == LOC_CAB_SHIFT), ASSIGN,
+                        np.where((tail_type == LOC_CAB_SHIFT) & (head_type == DOCTOR_SHIFT), UNASSIGN, NEUTRAL))
+
+        self.first = _to_array('i', np.concatenate(([0], np.cumsum(np.bincount(arc_tail, minlength=n)))))
+        self.head = _to_array('i', arc_head[order])
+        self.residual = _to_array('i', arc_cap[order])
+        self.capacity = _to_array('i', arc_cap[order])
+        self.forward = bytearray((order < m).astype(np.uint8).tobytes())
+        self.reverse = _to_array('i', position[paired[order]])
+        self.kind = _to_array('b', kind)
+        self.base = array('d', bytes(8 * 2 * m))
+
+        # Doctors and cabinets are interned in the order their first assignment arc comes, looking
+        # each doctor shift and cabinet shift node up once rather than once per arc.
+        arcs = np.flatnonzero(kind != NEUTRAL)
+        forward = kind[arcs] == ASSIGN
+        doctor_shift = np.where(forward, arc_tail[order][arcs], arc_head[order][arcs])
+        cabinet_shift = np.where(forward, arc_head[order][arcs], arc_tail[order][arcs])
+        doctor, cabinet = np.zeros(2 * m, dtype=np.int64), np.zeros(2 * m, dtype=np.int64)
+        for values, nodes, intern, key in ((doctor, doctor_shift, self._intern_doctor, lambda name: name[0]),
+                                           (cabinet, cabinet_shift, self._intern_cabinet, lambda name: name[:2])):
+            unique, seen, index = np.unique(nodes, return_index=True, return_inverse=True)
+            interned = np.zeros(len(unique), dtype=np.int64)
+            for i in np.argsort(seen, kind='stable').tolist():
+                interned[i] = intern(key(self.names[unique[i]]))
+            values[arcs] = interned[index]
+
+        # A doctor or cabinet without assignment arcs still has its penalty arcs, so it is
+        # interned after the others.
+        charge = np.zeros(2 * m, dtype=np.int8)
+        reverse = position[paired[order]]
+        forward = order < m
+        doctor_in = np.flatnonzero(forward & (head_type == DOCTOR))
+        cabinet_out = np.flatnonzero(forward & (tail_type == CABINET) & (head_type == SINK))
+        for arcs, nodes, sign, values, intern in ((doctor_in, arc_head[order][doctor_in], DOCTOR_CHARGE, doctor, self._intern_doctor),
+                                                  (cabinet_out, arc_tail[order][cabinet_out], CABINET_CHARGE, cabinet, self._intern_cabinet)):
+            charge[arcs] = sign
+            charge[reverse[arcs]] = -sign
+            values[arcs] = values[reverse[arcs]] = [intern(self.names[node]) for node in nodes.tolist()]
+        self.charge = _to_array('b', charge)
+        self.doctor = _to_array('i', doctor)
+        self.cabinet = _to_array('i', cabinet)
+
+        return self
+
+    def penalty_arcs(self):
+        # Charged arcs grouped by doctor and by cabinet (CSR again), i.e. the arcs whose cost
+        # moves when that doctor's or cabinet's penalty does.
+        if getattr(self, '_penalty_arcs', None) is None:
+            charge = np.abs(np.frombuffer(self.charge, dtype=np.int8))
+            index = []
+            for owner, count, kind in ((self.doctor, len(self.doctors), DOCTOR_CHARGE), (self.cabinet, len(self.cabinets), CABINET_CHARGE)):
+                arcs = np.flatnonzero(charge == kind)
+                keys = np.frombuffer(owner, dtype=np.int32)[arcs]
+                order = np.argsort(keys, kind='stable')
+                first = np.concatenate(([0], np.cumsum(np.bincount(keys, minlength=count))))
+                index.append((_to_array('i', first), _to_array('i', arcs[order])))
+            self._penalty_arcs = tuple(index)
+        return self._penalty_arcs
+
+    def set_costs(self, costs):
+        # costs[doctor][location] is looked up once per doctor and cabinet pair that has arcs.
+        arcs = np.flatnonzero(np.frombuffer(self.kind, dtype=np.int8) != NEUTRAL)
+        if not len(arcs):
+            return
+        pairs = np.frombuffer(self.doctor, dtype=np.int32)[arcs].astype(np.int64) * len(self.cabinets) + np.frombuffer(self.cabinet, dtype=np.int32)[arcs]
+        unique, index = np.unique(pairs, return_inverse=True)
+        values = np.array([costs[self.doctors[pair // len(self.cabinets)]][self.cabinets[pair % len(self.cabinets)][0]] for pair in unique.tolist()],
+                          dtype=np.float64)
+        np.frombuffer(self.base, dtype=np.float64)[arcs] = values[index]
+
+    def lock_flow(self):
+        # Keeps the flow already pushed but closes every way back, so a later solve on the same
+        # network can only add to it.
+        residual, reverse, forward = self.residual, self.reverse, self.forward
+        for a in range(len(self.head)):
+            if forward[a] and residual[reverse[a]] > 0:
+                residual[reverse[a]] = 0
+
+    def tail(self, a):
+        return self.head[self.reverse[a]]
+
+    def arc(self, u, v):
+        if u is None or v is None:
+            return -1
+        for a in range(self.first[u], self.first[u + 1]):
+            if self.head[a] == v and self.forward[a]:
+                return a
+        return -1
+
+    def number_of_edges(self):
+        return len(self.head) // 2
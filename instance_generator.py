@@ -0,0 +1,95 @@
+import argparse
+import json
+import random
+
+from problem_instance import ProblemInstance, SHIFT_IDS, WEEKS, parse_loc_cabs, write_doctors
+
+COLUMNS = ['Doctor', 'Cabinets', 'MinShifts', 'MaxShifts', 'ForbiddenShifts', 'RequiredShifts', 'Specialization', 'Fine']
+
+
+def generate_instance(doctors=50, locations=3, specializations=5, cabinets_per_spec=2, forbidden_density=0.1,
+                      required_density=0.02, fine_ratio=0.3, min_ratio=0.3, seed=0, sites=1):
+    # A clinic shaped like the real data: every location offers most specializations with a few
+    # rooms each, doctors have one or two specializations and rank one to three locations.
+    # With sites > 1 the doctors are split over that many sites of locations each and only rank
+    # locations of their own site, so the clinic falls apart into independent parts.
+    rng = random.Random(seed)
+    location_names = [f"Локація {i + 1}" for i in range(locations * sites)]
+    spec_names = [f"Спеціалізація {j + 1}" for j in range(specializations)]
+
+    loc_cabs_data = []
+    offered = {}
+    for i, loc in enumerate(location_names):
+        specs = [spec for spec in spec_names if rng.random() < 0.75] or [rng.choice(spec_names)]
+        offered[loc] = {}
+        for j, spec in enumerate(specs):
+            rooms = [f"{i + 1}{spec_names.index(spec) + 1:02d}-{k + 1}" for k in range(max(1, cabinets_per_spec + rng.randint(-1, 1)))]
+            offered[loc][spec] = rooms
+            loc_cabs_data.append({'location': loc, 'specialization': spec, 'room': ', '.join(rooms)})
+
+    rows = []
+    taken = set()
+    for n in range(doctors):
+        site = location_names[n * sites // doctors * locations:][:locations]
+        specs = rng.sample(spec_names, min(len(spec_names), rng.choice((1, 1, 2))))
+        locs = rng.sample(site, min(len(site), rng.choice((1, 2, 2, 3))))
+        max_shifts = rng.randint(8, 40) if rng.random() < 0.8 else None
+        min_shifts = rng.randint(1, (max_shifts or 40) // 3) if rng.random() < min_ratio else 0
+
+        forbidden = [(week, shift) for week in range(1, WEEKS + 1) for shift in SHIFT_IDS if rng.random() < forbidden_density]
+
+        required = []
+        rooms = [(loc, cab) for loc in locs for spec in specs for cab in offered[loc].get(spec, [])]
+        for week in range(1, WEEKS + 1):
+            for shift in SHIFT_IDS:
+                if not rooms or (week, shift) in forbidden or rng.random() >= required_density:
+                    continue
+                loc, cab = rng.choice(rooms)
+                if (loc, cab, week, shift) not in taken:
+                    taken.add((loc, cab, week, shift))
+                    required.append(f"{loc}|{cab}|{week}.{shift[0]}.{shift[1]}")
+
+        rows.append({
+            'Doctor': f"Лікар {n + 1}",
+            'Cabinets': ', '.join(locs),
+            'MinShifts': min_shifts,
+            'MaxShifts': max_shifts,
+            'ForbiddenShifts': ', '.join(f"{week}.{d}.{s}" for week, (d, s) in forbidden) or None,
+            'RequiredShifts': ', '.join(required) or None,
+            'Specialization': ', '.join(specs),
+            'Fine': int(rng.random() < fine_ratio),
+        })
+
+    return rows, loc_cabs_data
+
+
+def generate_problem_instance(**kwargs):
+    rows, loc_cabs_data = generate_instance(**kwargs)
+    return ProblemInstance(rows, parse_loc_cabs(loc_cabs_data))
+
+
+def write_instance(rows, loc_cabs_data, input_csv_path, loc_cabs_path):
+    write_doctors(rows, input_csv_path, COLUMNS)
+    with open(loc_cabs_path, 'w', encoding='utf-8') as f:
+        json.dump(loc_cabs_data, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Генерація синтетичних даних для розкладу')
+    parser.add_argument('input_csv')
+    parser.add_argument('loc_cabs')
+    parser.add_argument('--doctors', type=int, default=50)
+    parser.add_argument('--locations', type=int, default=3)
+    parser.add_argument('--specializations', type=int, default=5)
+    parser.add_argument('--cabinets-per-spec', type=int, default=2)
+    parser.add_argument('--forbidden-density', type=float, default=0.1)
+    parser.add_argument('--required-density', type=float, default=0.02)
+    parser.add_argument('--fine-ratio', type=float, default=0.3)
+    parser.add_argument('--min-ratio', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sites', type=int, default=1, help='кількість незалежних філій по --locations локацій')
+    args = parser.parse_args()
+
+    rows, loc_cabs_data = generate_instance(args.doctors, args.locations, args.specializations, args.cabinets_per_spec,
+                                          args.forbidden_density, args.required_density, args.fine_ratio, args.min_ratio, args.seed, args.sites)
+    write_instance(rows, loc_cabs_data, args.input_csv, args.loc_cabs)
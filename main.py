@@ -1,20 +1,22 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-from algo_flow import generate_monthly_schedule_from_csv, generate_preference_schedule_from_csv, change_weekly_schedule
+import multiprocessing
 import os
 import sys
-import json
-import openpyxl
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font, Border, Side
-from collections import defaultdict
 import threading
-import time
-import traceback
 
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
+# Generating and modifying run as jobs in worker processes (schedule_jobs), so the window never
+# waits on the solver and several clinics can be queued at once. The solver (numpy) and openpyxl
+# are only imported in the workers: preload() starts them on a background thread once the window
+# is up. SCHEDULE_STARTUP_BENCHMARK=window closes the app as soon as the window is shown, =ready
+# once the workers are ready; benchmark.py --startup times both.
+STARTUP_BENCHMARK = os.environ.get("SCHEDULE_STARTUP_BENCHMARK")
+POLL_MS = 100
+
+
 def resource_path(relative_path):
     if hasattr(sys, '_MEIPASS'):
         return os.path.join(sys._MEIPASS, relative_path)
@@ -24,7 +26,7 @@ class ScheduleApp(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.title("Schedule Management App")
-        self.geometry("600x650")
+        self.geometry("600x820")
 
         self.input_csv_one = None
         self.input_csv_two = None
@@ -64,11 +66,39 @@ class ScheduleApp(ctk.CTk):
         self.modify_btn = ctk.CTkButton(weekly_frame, text="Apply Changes to Weekly Schedule", command=self.modify_weekly_schedule, fg_color="#4CAF50")
         self.modify_btn.pack(pady=10, fill="x")
 
-        self.spinner_label = ctk.CTkLabel(self.main_frame, text="")
-        self.spinner_label.pack(pady=5)
+        self.jobs_frame = ctk.CTkScrollableFrame(self.main_frame, label_text="Jobs", height=160)
+        self.jobs_frame.pack(pady=10, padx=10, fill="both", expand=True)
+        self.job_queue = None
+        self.job_rows = {}
+        self.workers_ready = threading.Event()
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.after_idle(self.preload)
 
-        self.status_label = ctk.CTkLabel(self.main_frame, text="")
-        self.status_label.pack()
+    def preload(self):
+        if STARTUP_BENCHMARK == "window":
+            self.after(0, self.destroy)
+            return
+
+        # Tk may only be called from the main thread: the warm-up thread just sets
+        # workers_ready, which poll_jobs checks.
+        job_queue = self.get_job_queue()
+        def run():
+            job_queue.warm()
+            self.workers_ready.set()
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_job_queue(self):
+        if self.job_queue is None:
+            from schedule_jobs import JobQueue
+            self.job_queue = JobQueue()
+            self.after(POLL_MS, self.poll_jobs)
+        return self.job_queue
+
+    def close(self):
+        if self.job_queue is not None:
+            self.job_queue.shutdown()
+        self.destroy()
 
     def select_csv_one(self):
         self.input_csv_one = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
@@ -90,21 +120,62 @@ class ScheduleApp(ctk.CTk):
         if self.deleted_shifts_file:
             self.deleted_shifts_btn.configure(text=f"Shifts: {os.path.basename(self.deleted_shifts_file)}")
 
-    def start_spinner(self, text):
-        self.spinner_running = True
-        self.spinner_label.configure(text=text)
-        def animate():
-            frames = ["⏳", "🕐", "🕑", "🕒", "🕓", "🕔", "🕕", "🕖", "🕗", "🕘", "🕙", "🕚"]
-            i = 0
-            while self.spinner_running:
-                self.spinner_label.configure(text=f"{frames[i % len(frames)]} {text}")
-                i += 1
-                time.sleep(0.2)
-        threading.Thread(target=animate, daemon=True).start()
-
-    def stop_spinner(self):
-        self.spinner_running = False
-        self.spinner_label.configure(text="")
+    def submit_job(self, kind, title, params, steps):
+        # steps is the number of solves in the job (two phases per week), so the bar moves
+        # evenly across all of them.
+        job_id = self.get_job_queue().submit(kind, params)
+
+        row = ctk.CTkFrame(self.jobs_frame)
+        row.pack(pady=2, fill="x")
+        label = ctk.CTkLabel(row, text=f"#{job_id} {title}: queued", anchor="w")
+        label.pack(side="left", padx=5, fill="x", expand=True)
+        cancel_btn = ctk.CTkButton(row, text="Cancel", width=70, fg_color="#E53935", command=lambda: self.cancel_job(job_id))
+        cancel_btn.pack(side="right", padx=5)
+        progress_bar = ctk.CTkProgressBar(row, width=120)
+        progress_bar.set(0)
+        progress_bar.pack(side="right", padx=5)
+
+        self.job_rows[job_id] = {"title": title, "steps": steps, "label": label, "progress_bar": progress_bar, "cancel_btn": cancel_btn}
+
+    def cancel_job(self, job_id):
+        self.job_queue.cancel(job_id)
+        self.job_rows[job_id]["cancel_btn"].configure(state="disabled")
+
+    def poll_jobs(self):
+        if STARTUP_BENCHMARK == "ready" and self.workers_ready.is_set():
+            self.close()
+            return
+        for job_id, kind, payload in self.job_queue.poll():
+            if job_id in self.job_rows:
+                self.show_job(self.job_rows[job_id], job_id, kind, payload)
+        self.after(POLL_MS, self.poll_jobs)
+
+    def show_job(self, row, job_id, kind, payload):
+        steps = row["steps"]
+        if kind == "started":
+            text = "running"
+        elif kind == "progress":
+            week, phase, flow, expected = payload["week"], payload["phase"], payload["flow"], payload["expected"]
+            index = (week - 1) * 2 + (phase in ('preference', 'cached')) if steps > 1 else 0
+            row["progress_bar"].set((index + (min(flow / expected, 1) if expected else 1)) / steps)
+            text = f"week {week}, {phase}: {flow}/{expected}"
+        elif kind == "week":
+            row["progress_bar"].set(min(payload["week"] * 2 / steps, 1))
+            text = f"week {payload['week']} ready, {payload['assigned']} assigned, {payload['empty']} empty"
+        elif kind == "done":
+            row["cancel_btn"].configure(state="disabled")
+            if payload["truncated"]:
+                text = f"cancelled after {payload['weeks']} week(s)"
+            else:
+                row["progress_bar"].set(1)
+                text = f"done in {payload['seconds']:.1f}s, saved to {payload['output']}"
+        else:
+            row["cancel_btn"].configure(state="disabled")
+            text = f"failed: {payload['error']}"
+            if payload["traceback"]:
+                print("❌ Exception occurred:\n", payload["traceback"])
+            messagebox.showerror("Job Failed", f"{row['title']}\n\n{payload['traceback'] or payload['error']}")
+        row["label"].configure(text=f"#{job_id} {row['title']}: {text}")
 
     def generate_monthly_schedule(self):
         if not self.input_csv_one:
@@ -117,173 +188,19 @@ class ScheduleApp(ctk.CTk):
         if not output_dir:
             return
 
-        self.gen_month_btn.configure(state="disabled")
-        self.csv_btn.configure(state="disabled")
-        self.weekly_csv_btn.configure(state="disabled")
-        self.modify_btn.configure(state="disabled")
-        self.weekly_file_btn.configure(state="disabled")
-        self.deleted_shifts_btn.configure(state="disabled")
-        self.start_spinner("Generating weekly schedules...")
-
-        def run():
-            try:
-                generate_monthly_schedule_from_csv(self.input_csv_one,
-                    self.input_json, output_dir)
-
-                for week in range(1, 5):
-                    rows = []
-                    with open(os.path.join(output_dir, f"week_{week}.txt"), "r", encoding="utf-8") as f:
-                        location, room = None, None
-                        for line in f:
-                            line = line.strip()
-                            if line.startswith("Локація:"):
-                                location = line.split("Локація:")[1].strip()
-                            elif line.startswith("Кабінет:"):
-                                room = line.split("Кабінет:")[1].strip()
-                            elif line.startswith("(") and ")" in line:
-                                try:
-                                    part, doctor = line.split(") - ")
-                                    day, shift = eval(part + ")")
-                                    rows.append((week, location, room, day, shift, doctor if doctor != "None" else ""))
-                                except:
-                                    pass
-
-                    wb = Workbook()
-                    ws = wb.active
-                    ws.title = f"Week {week}"
-                    ws.append(["Week", "Location", "Room", "Day", "Shift", "Doctor"])
-                    for row in rows:
-                        ws.append(row)
-
-                    output_file = os.path.join(output_dir, f"week_{week}.xlsx")
-                    wb.save(output_file)
-
-                messagebox.showinfo("Success", f"All weekly schedules saved to:\n{output_dir}")
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-            finally:
-                self.stop_spinner()
-                self.gen_month_btn.configure(state="normal")
-                self.csv_btn.configure(state="normal")
-                self.weekly_csv_btn.configure(state="normal")
-                self.modify_btn.configure(state="normal")
-                self.weekly_file_btn.configure(state="normal")
-                self.deleted_shifts_btn.configure(state="normal")
-
-        threading.Thread(target=run).start()
+        params = {"input_csv": self.input_csv_one, "loc_cabs": self.input_json, "output_dir": output_dir, "format": "xlsx"}
+        self.submit_job("generate", f"Generate {os.path.basename(self.input_csv_one)}", params, 8)
 
     def modify_weekly_schedule(self):
         if not all([self.input_csv_two, self.input_json, self.weekly_schedule_file, self.deleted_shifts_file]):
             messagebox.showerror("Error", "Please select all required files (CSV, weekly schedule, deleted shifts).")
             return
 
-        self.gen_month_btn.configure(state="disabled")
-        self.csv_btn.configure(state="disabled")
-        self.weekly_csv_btn.configure(state="disabled")
-        self.modify_btn.configure(state="disabled")
-        self.weekly_file_btn.configure(state="disabled")
-        self.deleted_shifts_btn.configure(state="disabled")
-        self.start_spinner("Modifying weekly schedule...")
-
-        def run():
-            try:
-                # 1. Convert XLSX to TXT
-                temp_txt = self.weekly_schedule_file.replace(".xlsx", "_temp.txt")
-                wb = openpyxl.load_workbook(self.weekly_schedule_file)
-                ws = wb.active
-
-                with open(temp_txt, "w", encoding="utf-8") as f:
-                    last_loc, last_room = None, None
-                    for row in ws.iter_rows(min_row=2, values_only=True):
-                        _, location, room, day, shift, doctor = row
-
-                        # New location block
-                        if location != last_loc:
-                            f.write(f"Локація: {location}\n")
-                            f.write("=" * 40 + "\n")
-                            last_loc = location
-                            last_room = None  # reset room tracking
-
-                        # New cabinet block
-                        if room != last_room :
-                            if last_room != None:
-                                f.write("-" * 30 + "\n")
-                            f.write(f"Кабінет: {room}\n")
-                            f.write("-" * 30 + "\n")
-                            last_room = room
-
-                        # Write shift
-                        f.write(f"({day}, {shift}) - {doctor if doctor else 'None'}\n")
-
-                    f.write("-" * 30 + "\n")  # optional footer for last room
-
-                deleted_shifts = defaultdict(set)
-
-                wb_deleted = openpyxl.load_workbook(self.deleted_shifts_file)
-                ws_deleted = wb_deleted.active
-
-                for row in ws_deleted.iter_rows(min_row=2, values_only=True):  # skip header
-                    doctor, shift_str = row
-                    if doctor and shift_str:
-                        try:
-                            parts = shift_str.strip().split(".")
-                            if len(parts) == 2:
-                                day, shift = map(int, parts)
-                                deleted_shifts[doctor.strip()].add((day, shift))
-                        except Exception as e:
-                            print(f"⚠️ Could not parse shift '{shift_str}' for doctor '{doctor}': {e}")
-
-                print(deleted_shifts)
-
-                change_weekly_schedule(
-                    self.input_csv_two,
-                    self.input_json,
-                    temp_txt,
-                    deleted_shifts
-                )
-
-                rows = []
-                with open(temp_txt, "r", encoding="utf-8") as f:
-                    location, room = None, None
-                    for line in f:
-                        line = line.strip()
-                        if line.startswith("Локація:"):
-                            location = line.split("Локація:")[1].strip()
-                        elif line.startswith("Кабінет:"):
-                            room = line.split("Кабінет:")[1].strip()
-                        elif line.startswith("(") and ")" in line:
-                            try:
-                                part, doctor = line.split(") - ")
-                                day, shift = eval(part + ")")
-                                rows.append((None, location, room, day, shift, doctor if doctor != "None" else ""))
-                            except:
-                                pass
-
-                wb_out = openpyxl.Workbook()
-                ws_out = wb_out.active
-                ws_out.title = "Weekly Schedule"
-                ws_out.append(["Week", "Location", "Room", "Day", "Shift", "Doctor"])
-                for row in rows:
-                    ws_out.append(row)
-                wb_out.save(self.weekly_schedule_file)
-
-                os.remove(temp_txt)
-                messagebox.showinfo("Success", f"Weekly schedule updated:\n{self.weekly_schedule_file}")
-            except Exception as e:
-                traceback_str = traceback.format_exc()
-                print("❌ Exception occurred:\n", traceback_str)
-                messagebox.showerror("Modification Failed", traceback_str)
-            finally:
-                self.stop_spinner()
-                self.gen_month_btn.configure(state="normal")
-                self.csv_btn.configure(state="normal")
-                self.weekly_csv_btn.configure(state="normal")
-                self.modify_btn.configure(state="normal")
-                self.weekly_file_btn.configure(state="normal")
-                self.deleted_shifts_btn.configure(state="normal")
-
-        threading.Thread(target=run).start()
+        params = {"input_csv": self.input_csv_two, "loc_cabs": self.input_json, "week_file": self.weekly_schedule_file,
+                  "deleted_shifts": self.deleted_shifts_file}
+        self.submit_job("modify", f"Modify {os.path.basename(self.weekly_schedule_file)}", params, 1)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = ScheduleApp()
     app.mainloop()
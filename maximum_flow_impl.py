@@ -1,139 +1,614 @@
-from collections import defaultdict
-import networkx as nx
-import random
+from collections import defaultdict, deque
+from array import array
+import numpy as np
+import heapq
+import time
+from flow_network import FlowNetwork, NEUTRAL, ASSIGN, UNASSIGN, DOCTOR, LOC_CAB_SHIFT, CABINET, DOCTOR_CHARGE, CABINET_CHARGE
 EPSILON = 1e-5
 PENALTY_MULTIPLIER = 1.5
+COST_SCALE = 10 ** 6
+
+def _arc_cost(network, a, doctor_penalty, cabinet_penalty):
+    # An assignment arc costs its location cost. A doctor's penalty is paid on the arc into the
+    # doctor and a cabinet's on the arc from its cabinet node into the sink, the penalty as it
+    # stands for the next shift; the ways back give the last shift's penalty back. A path that moves a doctor from
+    # one slot to another thus costs that doctor nothing, and the k-th shift costs
+    # (penalty + k) * PENALTY_MULTIPLIER whichever order the shifts come in.
+    kind, charge = network.kind[a], network.charge[a]
+    if kind == ASSIGN:
+        return network.base[a]
+    if kind == UNASSIGN:
+        return -network.base[a]
+    if charge == DOCTOR_CHARGE:
+        return doctor_penalty[network.doctor[a]] * PENALTY_MULTIPLIER
+    if charge == -DOCTOR_CHARGE:
+        return -(doctor_penalty[network.doctor[a]] - 1) * PENALTY_MULTIPLIER
+    if charge:
+        cabinet = network.cabinet[a]
+        size = network.cabinet_size[cabinet] if network.cabinet_size is not None else 1
+        if charge == CABINET_CHARGE:
+            return cabinet_penalty[cabinet] / size * PENALTY_MULTIPLIER
+        return -(cabinet_penalty[cabinet] - 1) / size * PENALTY_MULTIPLIER
+    return 0
+
+
+class ArcCosts:
+    # Cost of every residual arc (see _arc_cost), computed once per solve. After an augmentation
+    # only the charged arcs of the doctors and cabinets whose penalty moved are recomputed. Ties
+    # are broken by a perturbation in [0, EPSILON) drawn once per arc from the seed, so runs are
+    # reproducible.
+    # The penalty of a cabinet that stands for several (see FlowNetwork.cabinet_size) counts
+    # the shifts of all of them, so it is priced per cabinet: their average load.
+
+    def __init__(self, network, doctor_penalty, cabinet_penalty, seed=0):
+        self.network = network
+        self.doctor_penalty = doctor_penalty
+        self.cabinet_penalty = cabinet_penalty
+        self.cabinet_size = network.cabinet_size or [1] * len(network.cabinets)
+
+        kind = np.frombuffer(network.kind, dtype=np.int8)
+        charge = np.frombuffer(network.charge, dtype=np.int8)
+        base = np.frombuffer(network.base, dtype=np.float64)
+        cost = np.where(kind == ASSIGN, base, np.where(kind == UNASSIGN, -base, 0.0))
+        for penalty, owner, size, sign in ((doctor_penalty, network.doctor, None, DOCTOR_CHARGE), (cabinet_penalty, network.cabinet, self.cabinet_size, CABINET_CHARGE)):
+            if not len(penalty):
+                continue
+            penalty = np.asarray(penalty, dtype=np.float64)[np.frombuffer(owner, dtype=np.int32)]
+            scale = PENALTY_MULTIPLIER / (np.asarray(size, dtype=np.float64)[np.frombuffer(owner, dtype=np.int32)] if size is not None else 1)
+            cost = np.where(charge == sign, penalty * scale, np.where(charge == -sign, -(penalty - 1) * scale, cost))
+
+        noise = np.random.default_rng(seed).uniform(0, EPSILON, len(kind))
+
+        self.noise = array('d', noise.tobytes())
+        self.cost = array('d', (cost + noise).tobytes())
+
+    def refresh(self, doctors, cabinets):
+        (doctor_first, doctor_arcs), (cabinet_first, cabinet_arcs) = self.network.penalty_arcs()
+        charge, cost, noise = self.network.charge, self.cost, self.noise
+
+        for first, arcs, owners, penalty, size in ((doctor_first, doctor_arcs, doctors, self.doctor_penalty, None),
+                                                   (cabinet_first, cabinet_arcs, cabinets, self.cabinet_penalty, self.cabinet_size)):
+            for owner in owners:
+                scale = PENALTY_MULTIPLIER / (size[owner] if size is not None else 1)
+                for i in range(first[owner], first[owner + 1]):
+                    a = arcs[i]
+                    cost[a] = (penalty[owner] if charge[a] > 0 else 1 - penalty[owner]) * scale + noise[a]
+
+
+def _path_to(network, parent, sink):
+    path = []
+    current_node = sink
+    while parent[current_node] != -1:
+        a = parent[current_node]
+        path.append(a)
+        current_node = network.tail(a)
+
+    path.reverse()
+    return path
 
-def bellman_ford(G, residual, costs, doctor_penalty, cabinet_penalty, source, sink):
-    dist = {node: float('inf') for node in residual}
+
+def bellman_ford(network, costs, source, sink, stats=None):
+    first, head, residual, cost = network.first, network.head, network.residual, costs.cost
+
+    n = len(network)
+    dist = [float('inf')] * n
     dist[source] = 0
-    parent = {node: None for node in residual}
+    parent = [-1] * n
 
-    for _ in range(len(residual) - 1):
-        for u in residual:
-            for v in residual[u]:
-                if not residual[u][v]:
-                    continue 
+    for _ in range(n - 1):
+        for u in range(n):
+            for a in range(first[u], first[u + 1]):
+                if residual[a] <= 0:
+                    continue
 
-                doctor, loc, cab, cost = None, None, None, 0
+                v = head[a]
+                if dist[u] + cost[a] < dist[v]:
+                    dist[v] = dist[u] + cost[a]
+                    parent[v] = a
 
-                if G.nodes[u].get('type') == 'doctor_shift' and G.nodes[v].get('type') == 'loc_cab_shift':
-                    doctor = u[0]
-                    loc = v[0]
-                    cab = v[1]
+    if stats is not None:
+        stats.relaxation_passes += max(n - 1, 0)
+        stats.edges_scanned += max(n - 1, 0) * len(head)
 
-                    cost = costs[doctor][loc]
-                    costs[loc][doctor] = cost
-                    cost += (doctor_penalty[doctor] + cabinet_penalty.get((loc, cab), 0)) * PENALTY_MULTIPLIER
+    if dist[sink] == float('inf'):
+        return None, None
+
+    return dist[sink], _path_to(network, parent, sink)
 
-                elif G.nodes[u].get('type') == 'loc_cab_shift' and G.nodes[v].get('type') == 'doctor_shift':
-                    doctor = v[0]
-                    loc = u[0]
-                    
-                    cost = -costs[loc][doctor]
 
-                
-                cost += random.uniform(0, EPSILON)
+def dijkstra(network, costs, potential, source, sink, stats=None):
+    # Shortest paths on reduced costs cost(u, v) + potential[u] - potential[v]. Penalties move
+    # after every augmentation, so a reduced cost can dip below zero; a node is then simply
+    # pushed again instead of assuming it is settled on the first pop. As in bellman_ford, a node
+    # stops being improved after len(network) updates so a negative cycle cannot loop forever.
+    first, head, residual, cost = network.first, network.head, network.residual, costs.cost
 
-                if dist[u] + cost < dist[v]:
-                    dist[v] = dist[u] + cost
-                    parent[v] = u
+    n = len(network)
+    dist = [float('inf')] * n
+    dist[source] = 0
+    parent = [-1] * n
+    updates = [0] * n
+    heap = [(0, source)]
+    scanned = 0
+
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+
+        pu = potential[u]
+        scanned += first[u + 1] - first[u]
+        for a in range(first[u], first[u + 1]):
+            if residual[a] <= 0:
+                continue
+
+            v = head[a]
+            nd = d + cost[a] + pu - potential[v]
+            if nd < dist[v] and updates[v] < n:
+                updates[v] += 1
+                dist[v] = nd
+                parent[v] = a
+                heapq.heappush(heap, (nd, v))
+
+    if stats is not None:
+        stats.relaxation_passes += 1
+        stats.edges_scanned += scanned
 
     if dist[sink] == float('inf'):
         return None, None
 
-    path = []
-    current_node = sink
-    while current_node is not None:
-        path.append(current_node)
-        current_node = parent[current_node]
+    bound = dist[sink]
+    for node in range(n):
+        potential[node] += dist[node] if dist[node] != float('inf') else bound
 
-    path.reverse()
-    return dist[sink], path
+    return dist, parent
 
 
-def min_cost_max_flow(G: nx.DiGraph, costs, doctor_penalty, cabinet_penalty, necessary_shifts, schedule, source: str, sink: str):
-    residual = defaultdict(lambda: defaultdict(int))
+def _disjoint_shortest_paths(network, costs, potential, dist, parent, source, sink):
+    # The first path comes straight from the shortest path tree; further paths are searched in the
+    # admissible subgraph (zero reduced cost w.r.t. the updated potentials) and must not share a
+    # doctor or cabinet with earlier ones, so the penalties they are priced with stay untouched.
+    first, head, residual, kind = network.first, network.head, network.residual, network.kind
 
-    
+    path = _path_to(network, parent, sink)
+    yield path
 
-    for u, v, data in G.edges(data=True):
-        residual[u][v] = data.get('capacity', 1)
-        residual[v][u] = 0
+    used = bytearray(len(network))
+    touched_doctors = bytearray(len(network.doctors))
+    touched_cabinets = bytearray(len(network.cabinets))
+    for a in path:
+        used[head[a]] = 1
+        if kind[a] == UNASSIGN:
+            return
+        if kind[a] == ASSIGN:
+            touched_doctors[network.doctor[a]] = 1
+            touched_cabinets[network.cabinet[a]] = 1
 
-    max_flow = 0
-    min_cost = 0
+    # Arc costs carry a tie-breaking perturbation below EPSILON, so anything within that band of
+    # a zero reduced cost is on a path as short as the shortest one.
+    tolerance = EPSILON
 
-    for doctor in necessary_shifts:
-        for location, cab, shift in necessary_shifts[doctor]:
-            residual[source][doctor] -= 1
-            residual[doctor][(doctor, shift)] -= 1
-            residual[(doctor, shift)][(location, cab, shift)] -= 1
-            residual[(location, cab, shift)][sink] -= 1
+    while True:
+        stack = [(source, first[source])]
+        arcs = []
+        found = False
+
+        while stack and not found:
+            u, a = stack.pop()
+            end = first[u + 1]
+            while a < end:
+                v = head[a]
+                if residual[a] > 0 and dist[v] != float('inf') and (v == sink or not used[v]):
+                    k = kind[a]
+                    if k == UNASSIGN or (k == ASSIGN and (touched_doctors[network.doctor[a]] or touched_cabinets[network.cabinet[a]])):
+                        a += 1
+                        continue
+
+                    reduced = costs.cost[a] + potential[u] - potential[v]
+                    if reduced <= tolerance:
+                        break
+                a += 1
+
+            if a == end:
+                if arcs:
+                    arcs.pop()
+                continue
+
+            stack.append((u, a + 1))
+            arcs.append(a)
+            if v == sink:
+                found = True
+            else:
+                used[v] = 1
+                stack.append((v, first[v]))
+
+        if not found:
+            return
+
+        for a in arcs:
+            if kind[a] == ASSIGN:
+                touched_doctors[network.doctor[a]] = 1
+                touched_cabinets[network.cabinet[a]] = 1
+
+        yield arcs
+
+
+def _augment(network, path, doctor_penalty, cabinet_penalty, assigned, costs=None):
+    residual, reverse, kind = network.residual, network.reverse, network.kind
+
+    path_flow = min(residual[a] for a in path)
+
+    # The whole path is priced before any penalty moves, as the search priced it.
+    path_cost = sum(_arc_cost(network, a, doctor_penalty, cabinet_penalty) for a in path) * path_flow
+    doctors, cabinets = set(), set()
+    for a in path:
+        residual[a] -= path_flow
+        residual[reverse[a]] += path_flow
+
+        if kind[a] == ASSIGN:
+            assigned[network.head[a]] = network.doctor[a]
+            doctor_penalty[network.doctor[a]] += 1
+            cabinet_penalty[network.cabinet[a]] += 1
+
+        elif kind[a] == UNASSIGN:
+            if assigned.get(network.tail(a)) == network.doctor[a]:
+                assigned[network.tail(a)] = None
+            doctor_penalty[network.doctor[a]] -= 1
+            cabinet_penalty[network.cabinet[a]] -= 1
+
+        if kind[a] != NEUTRAL:
+            doctors.add(network.doctor[a])
+            cabinets.add(network.cabinet[a])
+
+    if costs is not None:
+        costs.refresh(doctors, cabinets)
+
+    return path_flow, path_cost
+
+
+def _successive_shortest_paths(network, doctor_penalty, cabinet_penalty, assigned, source, sink, seed=0, potential=None, stats=None, control=None):
+    costs = ArcCosts(network, doctor_penalty, cabinet_penalty, seed)
+    if potential is None:
+        potential = [0] * len(network)
+    max_flow, min_cost = 0, 0
 
-            cabinet_penalty[(location, cab)] += 1
+    while True:
+        started = time.perf_counter()
+        dist, parent = dijkstra(network, costs, potential, source, sink, stats)
+        searched = time.perf_counter()
 
-            schedule[location][cab][shift] = doctor
+        if dist is None:
+            if stats is not None:
+                stats.shortest_path_time += searched - started
+            break
 
-        doctor_penalty[doctor] += len(necessary_shifts[doctor])
-        max_flow += len(necessary_shifts[doctor])
+        augmentations, batch_flow = 0, 0
+        for path in _disjoint_shortest_paths(network, costs, potential, dist, parent, source, sink):
+            path_flow, path_cost = _augment(network, path, doctor_penalty, cabinet_penalty, assigned, costs)
+            batch_flow += path_flow
+            min_cost += path_cost
+            augmentations += 1
+        max_flow += batch_flow
+
+        if stats is not None:
+            stats.shortest_path_time += searched - started
+            stats.augment_time += time.perf_counter() - searched
+            stats.augmentations += augmentations
+
+        # Every augmentation leaves a feasible flow, so stopping here only gives up on the rest.
+        if control is not None:
+            control.advance(batch_flow)
+            if control.should_stop():
+                break
+
+    return max_flow, min_cost
+
+
+def _convex_network(network, doctor_penalty, cabinet_penalty, source, sink):
+    # Every doctor and cabinet penalty grows by one per assignment, so the k-th unit through
+    # source -> doctor costs (penalty + k) * PENALTY_MULTIPLIER, and likewise through a cabinet
+    # node into the sink. Spelling those steps out as parallel unit arcs gives an ordinary
+    # convex-cost network whose optimum does not depend on the order flow is pushed in.
+    head, residual, kind, forward = network.head, network.residual, network.kind, network.forward
+    node_type, names = network.node_type, network.names
+
+    def scaled(cost):
+        return round(cost * COST_SCALE)
+
+    # networkx is only needed by this engine, so it is not loaded for the default one.
+    import networkx as nx
+
+    H = nx.MultiDiGraph()
+    H.add_nodes_from(range(len(network)))
+    longest = 0
+
+    for u in range(len(network)):
+        for a in range(network.first[u], network.first[u + 1]):
+            if not forward[a] or residual[a] <= 0:
+                continue
+
+            v = head[a]
+            if u == source and node_type[v] == DOCTOR and names[v] in network.doctor_ids:
+                penalty = doctor_penalty[network.doctor_ids[names[v]]]
+                for k in range(residual[a]):
+                    H.add_edge(u, v, key=k, capacity=1, weight=scaled((penalty + k) * PENALTY_MULTIPLIER), arc=a)
+                longest = max(longest, (penalty + residual[a]) * PENALTY_MULTIPLIER)
+
+            elif v == sink and node_type[u] == CABINET and names[u] in network.cabinet_ids:
+                cabinet = network.cabinet_ids[names[u]]
+                penalty, size = cabinet_penalty[cabinet], network.cabinet_size[cabinet] if network.cabinet_size is not None else 1
+                for k in range(residual[a]):
+                    H.add_edge(u, v, key=k, capacity=1, weight=scaled((penalty + k) / size * PENALTY_MULTIPLIER), arc=a)
+                longest = max(longest, (penalty + residual[a]) / size * PENALTY_MULTIPLIER)
+
+            else:
+                H.add_edge(u, v, capacity=residual[a], weight=scaled(network.base[a]) if kind[a] == ASSIGN else 0, arc=a)
+                if kind[a] == ASSIGN:
+                    longest = max(longest, network.base[a])
+
+    # A bypass arc priced above any augmenting path makes "push as much as possible, then as
+    # cheaply as possible" a single min-cost flow with fixed demands.
+    supply = sum(data['capacity'] for _, _, data in H.out_edges(source, data=True))
+    H.add_edge(source, sink, key='bypass', capacity=supply, weight=scaled(3 * longest + 1) * (len(network) + 1))
+    H.nodes[source]['demand'] = -supply
+    H.nodes[sink]['demand'] = supply
+
+    return H
+
+
+def _solve_convex(network, doctor_penalty, cabinet_penalty, assigned, source, sink):
+    import networkx as nx
+
+    H = _convex_network(network, doctor_penalty, cabinet_penalty, source, sink)
+    _, flow_dict = nx.network_simplex(H)
+
+    flow = defaultdict(int)
+    for u, v, key, data in H.edges(keys=True, data=True):
+        if 'arc' in data:
+            flow[data['arc']] += flow_dict[u][v][key]
+
+    # The charged arcs are priced before the assignments move the penalties: f units through one
+    # cost f times its first unit plus the steps the penalty takes on the way.
+    max_flow, min_cost = 0, 0
+    for a, f in flow.items():
+        if f and network.charge[a] > 0:
+            step = 1 if network.charge[a] == DOCTOR_CHARGE or network.cabinet_size is None else 1 / network.cabinet_size[network.cabinet[a]]
+            min_cost += f * _arc_cost(network, a, doctor_penalty, cabinet_penalty) + f * (f - 1) / 2 * step * PENALTY_MULTIPLIER
+
+    for a, f in flow.items():
+        if not f:
+            continue
+
+        if network.kind[a] == ASSIGN:
+            _, cost = _augment(network, [a], doctor_penalty, cabinet_penalty, assigned)
+            min_cost += cost
+        else:
+            network.residual[a] -= f
+            network.residual[network.reverse[a]] += f
+
+        if network.tail(a) == source:
+            max_flow += f
+
+    return max_flow, min_cost
+
+
+def _slice_arcs(network, source, sink):
+    names, node_type, head, residual = network.names, network.node_type, network.head, network.residual
+
+    source_arc, shift_arc, sink_arc = {}, {}, {}
+    for u in range(len(network)):
+        for a in range(network.first[u], network.first[u + 1]):
+            if not network.forward[a]:
+                continue
+            if u == source and node_type[head[a]] == DOCTOR:
+                source_arc[head[a]] = a
+            elif node_type[u] == DOCTOR:
+                shift_arc[head[a]] = a
+            elif node_type[u] == LOC_CAB_SHIFT and node_type[head[a]] == CABINET:
+                sink_arc[u] = a
+            elif head[a] == sink and node_type[u] == CABINET:
+                sink_arc[u] = a
+    # The way from a cabinet shift into the sink, through its cabinet node.
+    sink_arc = {u: (a, sink_arc[head[a]]) for u, a in sink_arc.items() if node_type[u] == LOC_CAB_SHIFT and head[a] in sink_arc}
+
+    capacity = defaultdict(int)
+    doctor_node = {}
+    for node, a in source_arc.items():
+        if names[node] in network.doctor_ids:
+            d = network.doctor_ids[names[node]]
+            capacity[d] = max(residual[a], 0)
+            doctor_node[d] = node
+
+    slices = defaultdict(list)
+    for a in range(len(head)):
+        if network.kind[a] != ASSIGN or not network.forward[a] or residual[a] <= 0:
+            continue
+        ds, lcs, d = network.tail(a), head[a], network.doctor[a]
+        if d not in doctor_node or not capacity[d] or ds not in shift_arc or lcs not in sink_arc:
+            continue
+        if residual[shift_arc[ds]] <= 0 or any(residual[b] <= 0 for b in sink_arc[lcs]):
+            continue
+        slices[names[lcs][2]].append(a)
+
+    return slices, capacity, source_arc, shift_arc, sink_arc, doctor_node
+
+
+def _breadth_first_paths(network, source, sink):
+    first, head, residual = network.first, network.head, network.residual
 
     while True:
-        _, path = bellman_ford(G, residual, costs, doctor_penalty, cabinet_penalty, source, sink)
+        parent = [-1] * len(network)
+        seen = bytearray(len(network))
+        seen[source] = 1
+        queue = deque([source])
+
+        while queue and not seen[sink]:
+            u = queue.popleft()
+            for a in range(first[u], first[u + 1]):
+                v = head[a]
+                if residual[a] > 0 and not seen[v]:
+                    seen[v] = 1
+                    parent[v] = a
+                    queue.append(v)
+
+        if not seen[sink]:
+            return
+
+        yield _path_to(network, parent, sink)
+
+
+def _complete_flow(network, picks, doctor_penalty, cabinet_penalty, assigned, source, sink, arcs, seed=0, stats=None):
+    # Pushes picked assignment arcs and turns them into a maximum flow. Whatever the picks left
+    # over is recovered on the rest of the network, first with the picks held fixed (no negative
+    # cycles, so shortest paths stay cheap), then with them released so that reassigning a pick
+    # can still open a way to a maximum flow.
+    source_arc, shift_arc, sink_arc, doctor_node = arcs
+    head, doctor = network.head, network.doctor
+
+    max_flow, min_cost = 0, 0
+    locked = defaultdict(int)
+    for a in picks:
+        path = [source_arc[doctor_node[doctor[a]]], shift_arc[network.tail(a)], a, *sink_arc[head[a]]]
+        path_flow, path_cost = _augment(network, path, doctor_penalty, cabinet_penalty, assigned)
+        max_flow += path_flow
+        min_cost += path_cost
+        for b in path:
+            locked[network.reverse[b]] += path_flow
+            network.residual[network.reverse[b]] -= path_flow
+
+    path_flow, path_cost = _successive_shortest_paths(network, doctor_penalty, cabinet_penalty, assigned, source, sink, seed, stats=stats)
+    max_flow += path_flow
+    min_cost += path_cost
+
+    for r, amount in locked.items():
+        network.residual[r] += amount
+    for path in _breadth_first_paths(network, source, sink):
+        path_flow, path_cost = _augment(network, path, doctor_penalty, cabinet_penalty, assigned)
+        max_flow += path_flow
+        min_cost += path_cost
 
-        if path is None:
-            break
+    return max_flow, min_cost
 
-        path_flow = float('inf')
-        for i in range(len(path) - 1):
-            u, v = path[i], path[i + 1]
-            path_flow = min(path_flow, residual[u][v])
-    
 
-        for i in range(len(path) - 1):
-            u, v = path[i], path[i + 1]
-            residual[u][v] -= path_flow
-            residual[v][u] += path_flow
+def _run_engine(engine, network, doctor_values, cabinet_values, assigned, s, t, seed, potential, stats, control, fixed=0, compare=False):
+    # The flow and cost engine adds on top of the pre-assigned shifts (fixed of them).
+    max_flow, min_cost = 0, 0
 
-            doctor, loc, cab, shift, cost = None, None, None, None, 0
-            reversed = False
-    
-            if G.nodes[u].get('type') == 'doctor_shift' and G.nodes[v].get('type') == 'loc_cab_shift':
-                doctor = u[0]
-                loc, cab, shift = v
+    if engine == 'dijkstra':
+        path_flow, path_cost = _successive_shortest_paths(network, doctor_values, cabinet_values, assigned, s, t, seed, potential, stats, control)
+        max_flow += path_flow
+        min_cost += path_cost
 
-            elif G.nodes[u].get('type') == 'loc_cab_shift' and G.nodes[v].get('type') == 'doctor_shift':
-                doctor = v[0]
-                loc, cab, shift = u
-                reversed = True
+    elif engine == 'bellman_ford':
+        costs = ArcCosts(network, doctor_values, cabinet_values, seed)
 
-            if doctor is not None and loc is not None:
-                # print(f"Processing doctor: {doctor}, loc: {loc}, cab: {cab}, shift: {shift}, reversed: {reversed}")
-                # print(costs[loc])
-                # print(costs[doctor][loc], costs[loc][doctor], doctor_penalty[doctor], cabinet_penalty.get((loc, cab), 0))
+        while True:
+            started = time.perf_counter()
+            _, path = bellman_ford(network, costs, s, t, stats)
+            searched = time.perf_counter()
 
-                if not reversed:
-                    cost = costs[doctor][loc]
-                    cost += (doctor_penalty[doctor] + cabinet_penalty.get((loc, cab), 0)) * PENALTY_MULTIPLIER
+            if path is None:
+                if stats is not None:
+                    stats.shortest_path_time += searched - started
+                break
 
-                    schedule[loc][cab][shift] = doctor
-                
-                else:
-                    cost = -costs[loc][doctor]
+            path_flow, path_cost = _augment(network, path, doctor_values, cabinet_values, assigned, costs)
+            max_flow += path_flow
+            min_cost += path_cost
 
-                    schedule[loc][cab][shift] = None
+            if stats is not None:
+                stats.shortest_path_time += searched - started
+                stats.augment_time += time.perf_counter() - searched
+                stats.augmentations += 1
 
-                doctor_penalty[doctor] += 1 if not reversed else -1
-                cabinet_penalty[(loc, cab)] += 1 if not reversed else -1
+            if control is not None:
+                control.advance(path_flow)
+                if control.should_stop():
+                    break
 
+    elif engine == 'convex':
+        path_flow, path_cost = _solve_convex(network, doctor_values, cabinet_values, assigned, s, t)
+        max_flow += path_flow
+        min_cost += path_cost
+        if control is not None:
+            control.advance(path_flow)
 
-            min_cost += cost * path_flow
+    elif engine == 'decomposed':
+        from decomposition import solve_by_shift
 
+        path_flow, path_cost, report = solve_by_shift(network, doctor_values, cabinet_values, assigned, s, t, compare=compare, seed=seed, fixed=fixed)
         max_flow += path_flow
+        min_cost += path_cost
+        if stats is not None:
+            stats.report = report
+        if control is not None:
+            control.advance(path_flow)
 
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    return max_flow, min_cost
 
-    return max_flow, min_cost, schedule
 
+def min_cost_max_flow(G: FlowNetwork, costs, doctor_penalty, cabinet_penalty, necessary_shifts, schedule, source: str, sink: str, engine: str = 'dijkstra', seed: int = 0, potential=None, stats=None, control=None,
+                      compare: bool = False):
+    # compare: the decomposed engine also solves the network exactly and reports its gap (slow,
+    # for benchmarks).
+    if stats is not None:
+        stats.start()
+    network = G if isinstance(G, FlowNetwork) else FlowNetwork.from_networkx(G)
+    network.freeze()
+    network.set_costs(costs)
+    ids, residual = network.ids, network.residual
 
-    
+    max_flow = 0
+    min_cost = 0
+
+    # Pre-assigned shifts are taken out of the residual network without opening the way back,
+    # so the solver can never undo them. A slot left out of the network takes nothing from its
+    # cabinet's way into the sink, which only counts the slots that are in it.
+    for doctor in necessary_shifts:
+        for location, cab, shift in necessary_shifts[doctor]:
+            steps = [(source, doctor), (doctor, (doctor, shift)), ((doctor, shift), (location, cab, shift))]
+            if network.arc(ids.get((location, cab, shift)), ids.get((location, cab))) != -1:
+                steps += [((location, cab, shift), (location, cab)), ((location, cab), sink)]
+            for u, v in steps:
+                a = network.arc(ids.get(u), ids.get(v))
+                if a != -1:
+                    residual[a] -= 1
+
+            cabinet_penalty[(location, cab)] += 1
 
+            schedule[location][cab][shift] = doctor
+
+        doctor_penalty[doctor] += len(necessary_shifts[doctor])
+        max_flow += len(necessary_shifts[doctor])
+
+    doctor_values = [doctor_penalty.get(doctor, 0) for doctor in network.doctors]
+    cabinet_values = [cabinet_penalty.get(cabinet, 0) for cabinet in network.cabinets]
+    assigned = {}
+    s, t = ids[source], ids[sink]
+
+    if control is not None:
+        control.advance(max_flow)
+
+    # A control already cancelled or out of time (should_stop marks it truncated) keeps the
+    # engine from starting: only the pre-assigned shifts stay.
+    if control is None or not control.should_stop():
+        path_flow, path_cost = _run_engine(engine, network, doctor_values, cabinet_values, assigned, s, t, seed, potential, stats, control, max_flow, compare)
+        max_flow += path_flow
+        min_cost += path_cost
+
+    for doctor, value in zip(network.doctors, doctor_values):
+        doctor_penalty[doctor] = value
+    for cabinet, value in zip(network.cabinets, cabinet_values):
+        cabinet_penalty[cabinet] = value
+    for node, doctor in assigned.items():
+        loc, cab, shift = network.names[node]
+        schedule[loc][cab][shift] = network.doctors[doctor] if doctor is not None else None
+
+    if stats is not None:
+        stats.nodes, stats.edges, stats.flow = len(network), network.number_of_edges(), max_flow
+        stats.stop()
+
+    return max_flow, min_cost, schedule
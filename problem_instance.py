@@ -0,0 +1,279 @@
+import csv
+import itertools
+import json
+from collections import defaultdict
+
+import numpy as np
+
+WEEKS = 4
+SHIFT_IDS = [(d, s) for d, s in itertools.product(range(1, 8), range(1, 3))]
+SHIFT_BITS = {shift: bit for bit, shift in enumerate(SHIFT_IDS)}
+
+
+def split_data(data_str, delim=','):
+    return [elem.strip() for elem in data_str.split(delim)]
+
+
+def distribute_evenly(number, parts = 4):
+    if not number:
+        return [0] * parts
+
+    result = [number // parts] * parts
+    for i in range(number % parts):
+        result[i] += 1
+    return result
+
+
+def present(value):
+    # Empty cells come out of csv as '' and out of generated rows as None (or NaN from a
+    # spreadsheet export), all of which mean "not set".
+    return value is not None and value == value and str(value).strip() != ''
+
+
+def read_doctors(input_csv_path):
+    with open(input_csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def write_doctors(rows, input_csv_path, columns):
+    with open(input_csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({column: row[column] if present(row[column]) else '' for column in columns})
+
+
+def read_loc_cabs(loc_cabs_path):
+    with open(loc_cabs_path, 'r', encoding='utf-8') as f:
+        return parse_loc_cabs(json.load(f))
+
+
+def parse_loc_cabs(loc_cabs_data):
+    loc_cabs_dict = {}
+    for elem in loc_cabs_data:
+        loc = elem['location']
+        if not loc in loc_cabs_dict:
+            loc_cabs_dict[loc] = {}
+
+        loc_cabs_dict[loc][elem['specialization']] = split_data(elem['room'])
+
+    return loc_cabs_dict
+
+
+def shift_mask(shifts):
+    mask = 0
+    for shift in shifts:
+        if shift in SHIFT_BITS:
+            mask |= 1 << SHIFT_BITS[shift]
+    return mask
+
+
+def mask_shifts(mask):
+    return [shift for bit, shift in enumerate(SHIFT_IDS) if mask >> bit & 1]
+
+
+class ProblemInstance:
+    # The clinic's doctors (rows as read_doctors gives them) and rooms parsed once. Doctors, locations and cabinets are interned to
+    # dense ids; for every doctor and week the forbidden and required shifts are kept as 14-bit
+    # masks over SHIFT_IDS, and eligible[d] lists (cabinet id, preference cost) in the order the
+    # graph builders add the assignment arcs.
+
+    def __init__(self, rows, loc_cabs_dict):
+        self.loc_cabs_dict = loc_cabs_dict
+
+        self.locations = list(loc_cabs_dict)
+        self.location_ids = {loc: i for i, loc in enumerate(self.locations)}
+        self.cabinets = []
+        self.cabinet_ids = {}
+        for loc in loc_cabs_dict:
+            for spec in loc_cabs_dict[loc]:
+                for cab in loc_cabs_dict[loc][spec]:
+                    if (loc, cab) not in self.cabinet_ids:
+                        self.cabinet_ids[(loc, cab)] = len(self.cabinets)
+                        self.cabinets.append((loc, cab))
+
+        self.doctors = []
+        self.doctor_ids = {}
+        self.fine = []
+        self.min_shifts = []
+        self.max_shifts = []
+        self.forbidden = []
+        self.required = []
+        self.required_shifts = []
+        self.costs = {}
+        self.eligible = []
+
+        for row in rows:
+            doctor = row['Doctor']
+            if doctor in self.doctor_ids:
+                print(f"Warning: doctor {doctor} is listed more than once, the last row is used")
+                d = self.doctor_ids[doctor]
+            else:
+                d = self.doctor_ids[doctor] = len(self.doctors)
+                self.doctors.append(doctor)
+                for column in (self.fine, self.min_shifts, self.max_shifts, self.forbidden, self.required, self.required_shifts, self.eligible):
+                    column.append(None)
+
+            self.fine[d] = int(float(row['Fine']))
+            self.min_shifts[d] = int(float(row['MinShifts'])) if present(row['MinShifts']) else 0
+            self.max_shifts[d] = int(float(row['MaxShifts'])) if present(row['MaxShifts']) else WEEKS * len(SHIFT_IDS)
+
+            forbidden = [set() for _ in range(WEEKS)]
+            for data in split_data(row['ForbiddenShifts']) if present(row['ForbiddenShifts']) else []:
+                week, shift = int(data[0]), tuple(map(int, data.split('.')[1:]))
+                if 1 <= week <= WEEKS:
+                    forbidden[week - 1].add(shift)
+            self.forbidden[d] = [shift_mask(shifts) for shifts in forbidden]
+
+            required = [set() for _ in range(WEEKS)]
+            for data in split_data(row['RequiredShifts']) if present(row['RequiredShifts']) else []:
+                if not data:
+                    continue
+                data = data.split('|')
+                week = int(data[2][0])
+                if 1 <= week <= WEEKS:
+                    required[week - 1].add((data[0], data[1], tuple(map(int, data[2][2:].split('.')))))
+            self.required_shifts[d] = required
+            self.required[d] = [shift_mask(shift for _, _, shift in shifts) for shifts in required]
+
+            self.costs[doctor] = {}
+            specs = split_data(row['Specialization'])
+            eligible = {}
+            for i, loc in enumerate(split_data(row['Cabinets'])):
+                self.costs[doctor][loc] = 5*i + 1
+                for spec in specs:
+                    if loc in loc_cabs_dict and spec in loc_cabs_dict[loc]:
+                        for cab in loc_cabs_dict[loc][spec]:
+                            eligible.setdefault(self.cabinet_ids[(loc, cab)], None)
+            self.eligible[d] = [(c, self.costs[doctor][self.cabinets[c][0]]) for c in eligible]
+
+        self._flatten_eligible()
+
+    def _flatten_eligible(self):
+        # The doctor x cabinet eligibility, sparse: eligible flattened into parallel arrays of
+        # doctor and cabinet ids, doctor by doctor and in eligible order.
+        self.eligible_doctor = np.array([d for d, cabinets in enumerate(self.eligible) for _ in cabinets], dtype=np.int64)
+        self.eligible_cabinet = np.array([c for cabinets in self.eligible for c, _ in cabinets], dtype=np.int64)
+
+    @classmethod
+    def from_files(cls, input_csv_path, loc_cabs_path):
+        return cls(read_doctors(input_csv_path), read_loc_cabs(loc_cabs_path))
+
+    def components(self):
+        # Groups of doctors and cabinets that share nothing: no doctor of one group is eligible
+        # for (or has a required shift in) a cabinet of another, in any week. Returned as
+        # (doctor ids, cabinet ids), largest group first; groups without doctors or without
+        # cabinets are left out, as nothing in them can be assigned.
+        doctors = len(self.doctors)
+        parent = list(range(doctors + len(self.cabinets)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for d in range(doctors):
+            linked = [c for c, _ in self.eligible[d]]
+            linked += [self.cabinet_ids[(loc, cab)] for shifts in self.required_shifts[d] for loc, cab, _ in shifts if (loc, cab) in self.cabinet_ids]
+            for c in linked:
+                parent[find(doctors + c)] = find(d)
+
+        groups = {}
+        for x in range(len(parent)):
+            group = groups.setdefault(find(x), ([], []))
+            if x < doctors:
+                group[0].append(x)
+            else:
+                group[1].append(x - doctors)
+        return sorted((group for group in groups.values() if group[0] and group[1]), key=lambda group: -len(group[0]) - len(group[1]))
+
+    def subset(self, doctors, cabinets):
+        # The clinic cut down to some doctor and cabinet ids (a group from components()), as an
+        # instance of its own with ids renumbered in the same order.
+        part = type(self).__new__(type(self))
+        kept = {c: i for i, c in enumerate(cabinets)}
+        part.cabinets = [self.cabinets[c] for c in cabinets]
+        part.cabinet_ids = {cabinet: i for i, cabinet in enumerate(part.cabinets)}
+        part.loc_cabs_dict = {}
+        for loc, specs in self.loc_cabs_dict.items():
+            for spec, cabs in specs.items():
+                cabs = [cab for cab in cabs if (loc, cab) in part.cabinet_ids]
+                if cabs:
+                    part.loc_cabs_dict.setdefault(loc, {})[spec] = cabs
+        part.locations = list(part.loc_cabs_dict)
+        part.location_ids = {loc: i for i, loc in enumerate(part.locations)}
+
+        part.doctors = [self.doctors[d] for d in doctors]
+        part.doctor_ids = {doctor: i for i, doctor in enumerate(part.doctors)}
+        for column in ('fine', 'min_shifts', 'max_shifts', 'forbidden', 'required', 'required_shifts'):
+            setattr(part, column, [getattr(self, column)[d] for d in doctors])
+        part.costs = {doctor: self.costs[doctor] for doctor in part.doctors}
+        part.eligible = [[(kept[c], cost) for c, cost in self.eligible[d] if c in kept] for d in doctors]
+        part._flatten_eligible()
+        return part
+
+    def aggregated(self):
+        # Cabinets of one location that exactly the same doctors are eligible for cannot be told
+        # apart by the solver: the cost is the doctor's cost of the location. The clinic with every
+        # such group merged into one cabinet, named by its cabinets joined with ', ' (a cabinet on
+        # its own keeps its name); members[c] are the ids of the cabinets merged into cabinet c
+        # and merged[c] the cabinet that cabinet c of this instance went into.
+        # Doctors are shared with this instance, required shifts still name single cabinets.
+        doctors = defaultdict(list)
+        for d, c in zip(self.eligible_doctor.tolist(), self.eligible_cabinet.tolist()):
+            doctors[c].append(d)
+        groups = {}
+        for c, (loc, _) in enumerate(self.cabinets):
+            groups.setdefault((loc, tuple(doctors[c])), []).append(c)
+
+        part = type(self).__new__(type(self))
+        part.members = list(groups.values())
+        part.cabinets = [(self.cabinets[members[0]][0], ', '.join(self.cabinets[c][1] for c in members)) for members in part.members]
+        part.cabinet_ids = {cabinet: i for i, cabinet in enumerate(part.cabinets)}
+        part.merged = [0] * len(self.cabinets)
+        for i, members in enumerate(part.members):
+            for c in members:
+                part.merged[c] = i
+        part.loc_cabs_dict = {loc: {spec: list(dict.fromkeys(part.cabinets[part.merged[self.cabinet_ids[(loc, cab)]]][1] for cab in cabs))
+                                    for spec, cabs in specs.items()} for loc, specs in self.loc_cabs_dict.items()}
+        part.locations, part.location_ids = self.locations, self.location_ids
+
+        part.doctors, part.doctor_ids = self.doctors, self.doctor_ids
+        for column in ('fine', 'min_shifts', 'max_shifts', 'forbidden', 'required', 'required_shifts', 'costs'):
+            setattr(part, column, getattr(self, column))
+        part.eligible = [list({part.merged[c]: cost for c, cost in cabinets}.items()) for cabinets in self.eligible]
+        part._flatten_eligible()
+        return part
+
+    def weekly_min(self, d, week):
+        return distribute_evenly(self.min_shifts[d])[week - 1]
+
+    def weekly_max(self, d, week):
+        return distribute_evenly(self.max_shifts[d])[week - 1]
+
+    def available_shifts(self, d, week):
+        forbidden = self.forbidden[d][week - 1]
+        return [shift for bit, shift in enumerate(SHIFT_IDS) if not forbidden >> bit & 1]
+
+    def forbid(self, d, week, shifts, forbidden=True):
+        # Edits of a loaded clinic, as the schedule service gets them: shifts a doctor can no
+        # longer (or, with forbidden=False, can again) work in a week, and a new required shift.
+        mask = shift_mask(shifts)
+        masks = self.forbidden[d]
+        masks[week - 1] = masks[week - 1] | mask if forbidden else masks[week - 1] & ~mask
+
+    def require(self, d, week, loc, cab, shift):
+        self.required_shifts[d][week - 1].add((loc, cab, shift))
+        self.required[d][week - 1] |= shift_mask([shift])
+
+    def availability(self, week):
+        # doctors x SHIFT_IDS, True where the shift is not forbidden that week.
+        forbidden = np.array([masks[week - 1] for masks in self.forbidden], dtype=np.int64).reshape(-1, 1)
+        return (forbidden >> np.arange(len(SHIFT_IDS)) & 1) == 0
+
+    def empty_schedule(self):
+        schedule = {}
+        for loc, cab in self.cabinets:
+            schedule.setdefault(loc, {})[cab] = {shift: None for shift in SHIFT_IDS}
+        return schedule
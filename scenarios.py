@@ -0,0 +1,146 @@
+import argparse
+import copy
+import csv
+import json
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from algo_flow import generate_monthly_schedule
+from problem_instance import ProblemInstance, present, read_doctors, read_loc_cabs, split_data
+
+# A scenario is a dict of overrides on top of the clinic's base data, e.g.
+#   {"name": "Без кабінету 12", "fine": {"Костюк О. В.": 1}, "min_shifts": {...}, "max_shifts": {...},
+#    "remove_cabinets": [{"location": "...", "cabinet": "12"}]}
+# The base CSV and rooms file are parsed once and handed to every worker process.
+
+_base = None
+
+
+def _init_worker(rows, loc_cabs_dict):
+    global _base
+    _base = (rows, loc_cabs_dict)
+
+
+def apply_scenario(rows, loc_cabs_dict, scenario):
+    rows = [dict(row) for row in rows]
+    loc_cabs_dict = copy.deepcopy(loc_cabs_dict)
+
+    for column, key in (('Fine', 'fine'), ('MinShifts', 'min_shifts'), ('MaxShifts', 'max_shifts')):
+        for doctor, value in scenario.get(key, {}).items():
+            matching = [row for row in rows if row['Doctor'] == doctor]
+            if not matching:
+                print(f"Warning: scenario {scenario.get('name')} refers to unknown doctor {doctor}")
+                continue
+            for row in matching:
+                row[column] = value
+
+    removed = set()
+    for room in scenario.get('remove_cabinets', []):
+        removed.add((room['location'], str(room['cabinet'])))
+        for spec, cabs in loc_cabs_dict.get(room['location'], {}).items():
+            loc_cabs_dict[room['location']][spec] = [cab for cab in cabs if cab != str(room['cabinet'])]
+
+    # A required shift in a removed cabinet can no longer be worked and is dropped.
+    for row in rows:
+        if not removed or not present(row.get('RequiredShifts')):
+            continue
+        kept = []
+        for data in split_data(row['RequiredShifts']):
+            if tuple(data.split('|')[:2]) in removed:
+                print(f"Warning: scenario {scenario.get('name')} removes the cabinet of required shift {data} of {row['Doctor']}")
+            elif data:
+                kept.append(data)
+        row['RequiredShifts'] = ', '.join(kept)
+
+    return rows, loc_cabs_dict
+
+
+def evaluate_month(instance, schedules):
+    # Objective is the location preference cost of what was assigned (5 * rank + 1 per shift, as
+    # in the solver); unmet minimums count the monthly MinShifts that were not reached.
+    load = defaultdict(int)
+    objective = 0
+
+    for schedule in schedules:
+        for doctor, shifts in schedule.assignments().items():
+            load[doctor] += len(shifts)
+            objective += sum(instance.costs[doctor].get(loc, 1) for loc, _, _ in shifts)
+
+    unmet = sum(max(0, minimum - load[doctor]) for doctor, minimum in zip(instance.doctors, instance.min_shifts))
+
+    return {'objective': objective, 'unmet_minimums': unmet, 'load': {doctor: load[doctor] for doctor in instance.doctors}}
+
+
+def _run_scenario(scenario, engine):
+    # Runs in a worker of the scenario pool, so the clinic's parts are solved in this process. A
+    # scenario that fails is reported with its error instead of taking the others down with it.
+    try:
+        instance = ProblemInstance(*apply_scenario(*_base, scenario))
+        schedules = generate_monthly_schedule(instance, None, engine=engine, workers=1)
+        result = evaluate_month(instance, schedules)
+    except Exception as e:
+        print(f"Warning: scenario {scenario.get('name')} failed: {e!r}")
+        result = {'objective': None, 'unmet_minimums': None, 'load': {}, 'error': repr(e)}
+    result['name'] = scenario.get('name', '')
+    return result
+
+
+def run_scenarios(input_csv_path: str, loc_cabs_path: str, scenarios: list, workers=None, engine: str = 'dijkstra'):
+    rows = read_doctors(input_csv_path)
+    loc_cabs_dict = read_loc_cabs(loc_cabs_path)
+    scenarios = [{'name': 'Базовий'}] + [s for s in scenarios if s.get('name') != 'Базовий']
+
+    workers = min(workers or os.cpu_count() or 1, len(scenarios))
+    if workers <= 1:
+        _init_worker(rows, loc_cabs_dict)
+        return [_run_scenario(scenario, engine) for scenario in scenarios]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rows, loc_cabs_dict)) as executor:
+        return list(executor.map(_run_scenario, scenarios, [engine] * len(scenarios)))
+
+
+def format_comparison(results):
+    doctors = sorted({doctor for result in results for doctor in result['load']})
+    header = ['Сценарій', 'Вартість', 'Невиконані мінімуми'] + doctors
+    rows = [[r['name'], f"{r['objective']}", f"{r['unmet_minimums']}"] + [str(r['load'].get(d, 0)) for d in doctors] if 'error' not in r
+            else [r['name'], f"помилка: {r['error']}", ''] + [''] * len(doctors) for r in results]
+
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = [' | '.join(cell.ljust(w) for cell, w in zip(header, widths))]
+    lines.append('-+-'.join('-' * w for w in widths))
+    lines += [' | '.join(cell.ljust(w) for cell, w in zip(row, widths)) for row in rows]
+    return '\n'.join(lines)
+
+
+def write_comparison(results, output_path):
+    doctors = sorted({doctor for result in results for doctor in result['load']})
+    with open(output_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Scenario', 'Objective', 'UnmetMinimums'] + doctors + ['Error'])
+        for r in results:
+            if 'error' in r:
+                writer.writerow([r['name'], '', ''] + [''] * len(doctors) + [r['error']])
+            else:
+                writer.writerow([r['name'], r['objective'], r['unmet_minimums']] + [r['load'].get(d, 0) for d in doctors] + [''])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Порівняння сценаріїв розкладу на місяць')
+    parser.add_argument('input_csv')
+    parser.add_argument('loc_cabs')
+    parser.add_argument('scenarios', help='JSON файл зі списком сценаріїв')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--engine', default='dijkstra')
+    parser.add_argument('--output', default=None, help='CSV файл для таблиці порівняння')
+    args = parser.parse_args()
+
+    with open(args.scenarios, 'r', encoding='utf-8') as f:
+        scenarios = json.load(f)
+
+    results = run_scenarios(args.input_csv, args.loc_cabs, scenarios, workers=args.workers, engine=args.engine)
+    print(format_comparison(results))
+    if args.output:
+        write_comparison(results, args.output)
@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from algo_flow import generate_monthly_schedule, change_weekly_schedule
+from problem_instance import ProblemInstance
+from scenarios import evaluate_month
+from solve_cache import SolveCache, DEFAULT_DIRECTORY
+from solve_control import SolveControl
+from week_schedule import write_month_xlsx
+
+# Headless entry point: no GUI modules are imported here, so it runs from cron or over ssh.
+# The manifest is a JSON list of clinics, e.g.
+#   [{"name": "Філія 1", "input_csv": "...", "loc_cabs": "...", "output_dir": "..."},
+#    {"name": "Філія 2", "input_csv": "...", "loc_cabs": "...", "output_dir": "...",
+#     "repair": {"week_file": "week_2.jsonl", "deleted_shifts": {"Костюк О. В.": [[1, 1]]}}}]
+# A clinic without "repair" gets its month generated into output_dir; with it, the given week
+# (relative to output_dir) is repaired in place. Every clinic gets summary.json in output_dir.
+# With --cache, generated weeks go through a SolveCache that all workers share; --aggregate
+# solves generated weeks with interchangeable cabinets merged.
+
+
+def _summarize(instance, schedules):
+    summary = evaluate_month(instance, schedules)
+    summary['weeks'] = [schedule.week for schedule in schedules]
+    summary['assigned'] = sum(doctor is not None for schedule in schedules for doctor in schedule.doctors)
+    summary['empty'] = sum(doctor is None for schedule in schedules for doctor in schedule.doctors)
+    summary['truncated'] = any(schedule.truncated for schedule in schedules)
+    summary['stats'] = {schedule.week: {phase: stats.as_dict() for phase, stats in schedule.stats.items()} for schedule in schedules}
+    return summary
+
+
+def run_clinic(clinic, engine='dijkstra', format='jsonl', budget=None, joint=False, cache_dir=None, workers=None, aggregate=False):
+    started = time.perf_counter()
+    output_dir = clinic['output_dir']
+    summary = {'name': clinic.get('name', output_dir), 'mode': 'repair' if 'repair' in clinic else 'generate'}
+
+    # The solver prints its warnings as it goes; they go to stderr so stdout stays the JSON summary.
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            summary.update(_run(clinic, output_dir, engine, format, budget, joint, cache_dir, workers, aggregate))
+        summary['status'] = 'ok'
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = f"{type(e).__name__}: {e}"
+        summary['traceback'] = traceback.format_exc()
+
+    summary['seconds'] = time.perf_counter() - started
+    if os.path.isdir(output_dir):
+        with open(os.path.join(output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def _run(clinic, output_dir, engine, format, budget, joint, cache_dir, workers, aggregate):
+    os.makedirs(output_dir, exist_ok=True)
+    instance = ProblemInstance.from_files(clinic['input_csv'], clinic['loc_cabs'])
+    control = SolveControl(budget=budget) if budget is not None else None
+    cache = SolveCache(cache_dir) if cache_dir else None
+
+    if 'repair' in clinic:
+        repair = clinic['repair']
+        deleted_shifts = {doctor: [tuple(shift) for shift in shifts] for doctor, shifts in repair['deleted_shifts'].items()}
+        week_file = os.path.join(output_dir, repair['week_file'])
+        schedules = [change_weekly_schedule(clinic['input_csv'], clinic['loc_cabs'], week_file, deleted_shifts,
+                                            engine=engine, instance=instance, control=control)]
+    else:
+        schedules = generate_monthly_schedule(instance, output_dir, engine=engine, format=format, control=control, joint=joint, cache=cache,
+                                              workers=workers, aggregate=aggregate)
+        if clinic.get('month_xlsx'):
+            write_month_xlsx(schedules, os.path.join(output_dir, 'month.xlsx'))
+
+    summary = _summarize(instance, schedules)
+    if cache is not None:
+        summary['cache'] = cache.stats()
+    return summary
+
+
+def run_manifest(clinics: list, workers=None, engine: str = 'dijkstra', format: str = 'jsonl', budget=None, joint: bool = False, cache_dir: str = None,
+                 aggregate: bool = False):
+    # Clinics are independent, so each one is a task for the pool; summaries come back in
+    # manifest order whatever order they finish in. A clinic run in the pool solves its own
+    # independent parts in its process rather than starting a pool of its own.
+    workers = min(workers or os.cpu_count() or 1, len(clinics)) if clinics else 1
+    if workers <= 1:
+        return [run_clinic(clinic, engine, format, budget, joint, cache_dir, aggregate=aggregate) for clinic in clinics]
+
+    summaries = [None] * len(clinics)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_clinic, clinic, engine, format, budget, joint, cache_dir, 1, aggregate): i for i, clinic in enumerate(clinics)}
+        for future in as_completed(futures):
+            summary = summaries[futures[future]] = future.result()
+            print(f"{summary['name']}: {summary['status']} in {summary['seconds']:.1f}s", file=sys.stderr)
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Розклад для багатьох клінік без графічного інтерфейсу')
+    parser.add_argument('manifest', help='JSON файл зі списком клінік')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--engine', default='dijkstra')
+    parser.add_argument('--format', choices=['jsonl', 'txt', 'xlsx'], default='jsonl')
+    parser.add_argument('--budget', type=float, default=None, help='секунд на одну клініку')
+    parser.add_argument('--joint', action='store_true', help='розв\'язувати весь місяць однією задачею')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_DIRECTORY, default=None,
+                        help='кешувати розв\'язані тижні (у вказаній папці або у стандартній)')
+    parser.add_argument('--aggregate', action='store_true', help='об\'єднувати взаємозамінні кабінети під час розв\'язування')
+    parser.add_argument('--output', default=None, help='JSON файл зі зведенням по всіх клініках')
+    args = parser.parse_args()
+
+    with open(args.manifest, 'r', encoding='utf-8') as f:
+        clinics = json.load(f)
+
+    summaries = run_manifest(clinics, workers=args.workers, engine=args.engine, format=args.format, budget=args.budget, joint=args.joint,
+                             cache_dir=args.cache, aggregate=args.aggregate)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summaries, f, ensure_ascii=False, indent=2)
+    print(json.dumps(summaries, ensure_ascii=False, indent=2))
+
+    if any(summary['status'] != 'ok' for summary in summaries):
+        raise SystemExit(1)
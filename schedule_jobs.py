@@ -0,0 +1,199 @@
+import importlib
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from solve_control import SolveControl
+
+# Generation and modification jobs for the GUI, run in worker processes so a long solve never
+# holds the GIL of the process running the Tk mainloop. Workers put (job id, kind, payload)
+# events on one queue: 'started', 'progress' (at most every PROGRESS_INTERVAL seconds),
+# 'week' as each week is finished and written, then 'done' or 'failed'. The window drains it
+# with poll() from its own loop, so no Tk call is ever made off the main thread.
+# Cancelling sets the job's flag in a shared array, checked by its SolveControl on every
+# augmentation, so a running job stops like a cancelled in-process solve.
+JOB_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+JOB_SLOTS = 1024
+PROGRESS_INTERVAL = 0.1
+WORKER_MODULES = ("algo_flow", "week_schedule", "openpyxl", "solve_cache")
+
+_events = None
+_flags = None
+
+
+def _init_worker(events, flags):
+    global _events, _flags
+    _events, _flags = events, flags
+
+
+def _warm():
+    for name in WORKER_MODULES:
+        importlib.import_module(name)
+    return os.getpid()
+
+
+class JobControl(SolveControl):
+    # SolveControl of a job in a worker: progress and finished weeks go to the event queue,
+    # cancel comes from the job's flag.
+
+    def __init__(self, job_id):
+        super().__init__(callback=self._progress, on_week=self._week)
+        self.job_id = job_id
+        self.sent = 0
+
+    def _progress(self, week, phase, flow, expected):
+        now = time.monotonic()
+        if now - self.sent >= PROGRESS_INTERVAL or flow >= expected:
+            self.sent = now
+            _events.put((self.job_id, 'progress', {'week': week, 'phase': phase, 'flow': flow, 'expected': expected}))
+
+    def _week(self, schedule):
+        assigned = sum(doctor is not None for doctor in schedule.doctors)
+        _events.put((self.job_id, 'week', {'week': schedule.week, 'assigned': assigned, 'empty': len(schedule.doctors) - assigned,
+                                           'truncated': schedule.truncated}))
+
+    def should_stop(self):
+        if _flags[self.job_id % JOB_SLOTS]:
+            self.cancelled = True
+        return super().should_stop()
+
+
+def read_deleted_shifts(path):
+    # The deleted shifts workbook: a header row, then doctor and "day.shift" per row.
+    import openpyxl
+
+    deleted_shifts = defaultdict(set)
+    wb_deleted = openpyxl.load_workbook(path, read_only=True)
+    ws_deleted = wb_deleted.active
+
+    for row in ws_deleted.iter_rows(min_row=2, values_only=True):
+        doctor, shift_str = row[:2]
+        if doctor and shift_str:
+            try:
+                parts = str(shift_str).strip().split(".")
+                if len(parts) == 2:
+                    day, shift = map(int, parts)
+                    deleted_shifts[doctor.strip()].add((day, shift))
+            except Exception as e:
+                print(f"⚠️ Could not parse shift '{shift_str}' for doctor '{doctor}': {e}")
+    wb_deleted.close()
+    return deleted_shifts
+
+
+def _generate(params, control):
+    from algo_flow import generate_monthly_schedule
+    from problem_instance import ProblemInstance
+    from solve_cache import SolveCache
+    from week_schedule import write_month_xlsx
+
+    output_dir = params['output_dir']
+    instance = ProblemInstance.from_files(params['input_csv'], params['loc_cabs'])
+    cache = SolveCache() if params.get('cache', True) else None
+    schedules = generate_monthly_schedule(instance, output_dir, engine=params.get('engine', 'dijkstra'), format=params.get('format', 'xlsx'),
+                                          control=control, cache=cache)
+    if params.get('month_xlsx', True):
+        write_month_xlsx(schedules, os.path.join(output_dir, "month.xlsx"))
+    return {'weeks': len(schedules), 'output': output_dir}
+
+
+def _modify(params, control):
+    from algo_flow import change_weekly_schedule
+
+    deleted_shifts = read_deleted_shifts(params['deleted_shifts'])
+    change_weekly_schedule(params['input_csv'], params['loc_cabs'], params['week_file'], deleted_shifts,
+                           engine=params.get('engine', 'dijkstra'), control=control)
+    return {'weeks': 1, 'output': params['week_file']}
+
+
+JOBS = {'generate': _generate, 'modify': _modify}
+
+
+def _run_job(job_id, kind, params):
+    _events.put((job_id, 'started', {'pid': os.getpid()}))
+    control = JobControl(job_id)
+    started = time.perf_counter()
+    try:
+        result = JOBS[kind](params, control)
+    except Exception as e:
+        _events.put((job_id, 'failed', {'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}))
+        return
+    result.update(truncated=control.truncated, seconds=time.perf_counter() - started)
+    _events.put((job_id, 'done', result))
+
+
+class JobQueue:
+    # Jobs go to a pool of worker processes in submission order; up to workers of them run at
+    # once and the rest wait their turn. The pool is started on the first submit (or warm()).
+
+    def __init__(self, workers=None):
+        self.workers = workers or JOB_WORKERS
+        context = multiprocessing.get_context()
+        self.events = context.Queue()
+        self.flags = context.RawArray('b', JOB_SLOTS)
+        self.local = queue.SimpleQueue()
+        self.executor = None
+        self.futures = {}
+        self.next_id = 1
+
+    def _pool(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.events, self.flags))
+        return self.executor
+
+    def warm(self):
+        # Starts every worker and has it import the solver; returns once all of them are ready.
+        futures = [self._pool().submit(_warm) for _ in range(self.workers)]
+        return [future.result() for future in futures]
+
+    def submit(self, kind, params):
+        if kind not in JOBS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = self.next_id
+        self.next_id += 1
+        self.flags[job_id % JOB_SLOTS] = 0
+        future = self._pool().submit(_run_job, job_id, kind, params)
+        self.futures[job_id] = future
+        future.add_done_callback(lambda future: self._finished(job_id, future))
+        return job_id
+
+    def _finished(self, job_id, future):
+        # Runs on the pool's thread. A job that ran reports its own outcome; this only covers
+        # jobs cancelled before they started and workers that died.
+        if future.cancelled():
+            self.local.put((job_id, 'done', {'weeks': 0, 'output': None, 'truncated': True, 'seconds': 0}))
+        elif future.exception() is not None:
+            error = future.exception()
+            self.local.put((job_id, 'failed', {'error': f"{type(error).__name__}: {error}", 'traceback': None}))
+
+    def cancel(self, job_id):
+        self.flags[job_id % JOB_SLOTS] = 1
+        future = self.futures.get(job_id)
+        if future is not None:
+            future.cancel()
+
+    def poll(self):
+        events = []
+        for source in (self.events, self.local):
+            while True:
+                try:
+                    events.append(source.get_nowait())
+                except queue.Empty:
+                    break
+        for job_id, kind, _ in events:
+            if kind in ('done', 'failed'):
+                self.futures.pop(job_id, None)
+        return events
+
+    def running(self):
+        return [job_id for job_id, future in self.futures.items() if not future.done()]
+
+    def shutdown(self):
+        for job_id in list(self.futures):
+            self.cancel(job_id)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
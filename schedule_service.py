@@ -0,0 +1,382 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Long-running scheduler for one clinic, spoken to in JSON-RPC 2.0 with one message per line,
+# over stdin/stdout or a local socket (--port on 127.0.0.1, --socket for a unix socket). The
+# clinic, its four weeks and their solved week networks stay in memory in a worker process, so
+# the event loop keeps answering while a solve runs. Methods:
+#   load {input_csv, loc_cabs}    generate {engine}    get {week}    save {output_dir, format}
+#   stats                         shutdown
+#   cancel {week, doctor, shifts: [[day, shift], ...]}
+#   availability {week, doctor, forbid: [[day, shift], ...], allow: [[day, shift], ...]}
+#   require {week, doctor, location, cabinet, day, shift}
+# The last three are events: they are answered at once and queued. Events that come within
+# --coalesce seconds of each other are applied together, with one repair per week touched,
+# and the changed slots are pushed to every client as a schedule_updated notification:
+#   {"jsonrpc": "2.0", "method": "schedule_updated", "params": {"batch": 3, "events": 5,
+#    "weeks": {"2": [[location, cabinet, day, shift, old doctor, new doctor], ...]}, "latency": 0.08}}
+
+COALESCE_SECONDS = 0.05
+# A steady stream of events still gets a repair at least this often.
+MAX_DELAY_SECONDS = 1.0
+EVENTS = ('cancel', 'availability', 'require')
+METHODS = ('load', 'generate', 'get', 'save', 'stats', 'shutdown') + EVENTS
+
+# The worker process's side: the loaded clinic, its weeks and their week states.
+_session = {}
+
+
+def _init_worker():
+    # The solver prints its warnings; stdout may be the JSON-RPC channel.
+    sys.stdout = sys.stderr
+
+
+def _rows(schedule):
+    return [[loc, cab, day, shift, doctor] for loc, cab, (day, shift), doctor in schedule.rows()]
+
+
+def _load(input_csv, loc_cabs):
+    from problem_instance import ProblemInstance
+
+    instance = ProblemInstance.from_files(input_csv, loc_cabs)
+    _session.clear()
+    _session.update(instance=instance, schedules={}, states={}, engine='dijkstra')
+    return {'doctors': instance.doctors, 'cabinets': [list(cabinet) for cabinet in instance.cabinets]}
+
+
+def _generate(engine):
+    from algo_flow import generate_monthly_schedule
+
+    states = {}
+    schedules = generate_monthly_schedule(_session['instance'], engine=engine, states=states)
+    _session.update(schedules={schedule.week: schedule for schedule in schedules}, states=states, engine=engine)
+    return {schedule.week: _rows(schedule) for schedule in schedules}
+
+
+def _apply(events):
+    # One batch of events: edits go into the clinic first, then in every week touched the
+    # required shifts are placed (taking the slot from whoever held it, and leaving the slot the
+    # doctor held at that time), then one change_weekly_schedule fills every shift freed in it
+    # along with those slots; the doctor who was moved out is free to take one of them. A week
+    # whose doctors' availability changed gets a fresh week network, which is all a repair
+    # needs (the candidate arcs, zero potentials).
+    from algo_flow import build_week_network, change_weekly_schedule, week_state
+
+    instance, schedules, states = _session['instance'], _session['schedules'], _session['states']
+    if not schedules:
+        raise RuntimeError("No schedule yet, call generate first")
+
+    deleted = defaultdict(lambda: defaultdict(list))
+    placed = defaultdict(dict)
+    edited = set()
+
+    for event in events:
+        week, doctor = event['week'], event['doctor']
+        d = instance.doctor_ids[doctor]
+        held = schedules[week].assignments().get(doctor, set())
+
+        if event['type'] == 'cancel':
+            freed = [tuple(shift) for shift in event['shifts']]
+        elif event['type'] == 'availability':
+            freed = [tuple(shift) for shift in event.get('forbid', ())]
+            instance.forbid(d, week, freed)
+            instance.forbid(d, week, [tuple(shift) for shift in event.get('allow', ())], forbidden=False)
+            edited.add(week)
+        else:
+            required = (event['location'], event['cabinet'], (event['day'], event['shift']))
+            instance.require(d, week, *required)
+            edited.add(week)
+            # The doctor works that shift after all; whatever else they hold then is left when
+            # the required slot is placed.
+            freed = []
+            if required[2] in deleted[week][doctor]:
+                deleted[week][doctor].remove(required[2])
+
+        for shift in freed:
+            pending = [slot for slot, holder in placed[week].items() if holder == doctor and slot[2] == shift]
+            # A required slot not placed yet is dropped, and so is what the doctor held then.
+            for slot in pending:
+                del placed[week][slot]
+            if shift not in deleted[week][doctor] and any(held_shift == shift for _, _, held_shift in held):
+                deleted[week][doctor].append(shift)
+        if event['type'] == 'require':
+            placed[week][required] = doctor
+
+    if edited:
+        for week, state in states.items():
+            network = build_week_network(instance, week)[0] if week in edited else state['network']
+            potential = [0] * len(network) if week in edited else state['potential']
+            states[week] = week_state(week, instance, state['schedule'], network, potential)
+
+    updates = {}
+    for week in sorted(set(deleted) | set(placed)):
+        schedule = schedules[week]
+        previous = list(schedule.doctors)
+
+        vacated = set()
+        for (loc, cab, shift), doctor in placed[week].items():
+            for i, (row_loc, row_cab, row_shift, holder) in enumerate(schedule.rows()):
+                if row_shift != shift:
+                    continue
+                if (row_loc, row_cab) == (loc, cab):
+                    schedule.doctors[i] = doctor
+                    vacated.discard((loc, cab, shift))
+                elif holder == doctor:
+                    schedule.doctors[i] = None
+                    vacated.add((row_loc, row_cab, shift))
+        if placed[week] and week in states:
+            states[week]['schedule'] = schedule.to_dict()
+
+        shifts = {doctor: shifts for doctor, shifts in deleted[week].items() if shifts}
+        if shifts or vacated:
+            schedule = change_weekly_schedule(None, None, None, shifts, engine=_session['engine'], instance=instance, schedule=schedule, state=states.get(week),
+                                              vacated=vacated)
+
+        changes = [[loc, cab, day, shift, old, new] for (loc, cab, (day, shift), new), old in zip(schedule.rows(), previous) if old != new]
+        schedules[week] = schedule
+        updates[week] = {'changes': changes, 'rows': _rows(schedule)}
+
+    return updates
+
+
+def _save(output_dir, format):
+    from algo_flow import save_week_state, state_path
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for week, schedule in sorted(_session['schedules'].items()):
+        path = os.path.join(output_dir, f"week_{week}.{format}")
+        schedule.write(path)
+        state = _session['states'].get(week)
+        if state is not None:
+            save_week_state(state_path(path), week, _session['instance'], state['schedule'], state['network'], state['potential'])
+        paths.append(path)
+    return paths
+
+
+class ScheduleService:
+    # The event loop's side: answers requests, queues events and hands every job to the one
+    # worker process in turn. weeks mirrors the worker's schedules as rows, so get never waits
+    # for a solve.
+
+    def __init__(self, coalesce=COALESCE_SECONDS, max_delay=MAX_DELAY_SECONDS):
+        self.coalesce = coalesce
+        self.max_delay = max_delay
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker)
+        self.lock = asyncio.Lock()
+        self.wake = asyncio.Event()
+        self.stopped = asyncio.Event()
+        self.clients = set()
+        self.tasks = set()
+        self.doctors = set()
+        self.weeks = {}
+        self.pending = []
+        self.first_event = None
+        self.stats = {'events': 0, 'batches': 0, 'failed_batches': 0, 'weeks_repaired': 0, 'last_latency': None, 'worker_seconds': 0.0}
+
+    async def _call(self, function, *args):
+        async with self.lock:
+            started = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            finally:
+                self.stats['worker_seconds'] += time.perf_counter() - started
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def notify(self, method, params):
+        for send in list(self.clients):
+            send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    async def respond(self, line, send):
+        try:
+            message = json.loads(line)
+        except ValueError as e:
+            send({'jsonrpc': '2.0', 'id': None, 'error': {'code': -32700, 'message': f"Parse error: {e}"}})
+            return
+
+        id, method, params = message.get('id'), message.get('method'), message.get('params') or {}
+        try:
+            if method not in METHODS:
+                reply = {'jsonrpc': '2.0', 'id': id, 'error': {'code': -32601, 'message': f"Unknown method: {method}"}}
+            else:
+                handler = getattr(self, 'rpc_' + method)
+                result = await (handler(*params) if isinstance(params, list) else handler(**params))
+                reply = {'jsonrpc': '2.0', 'id': id, 'result': result}
+        except (TypeError, ValueError) as e:
+            reply = {'jsonrpc': '2.0', 'id': id, 'error': {'code': -32602, 'message': str(e)}}
+        except Exception as e:
+            reply = {'jsonrpc': '2.0', 'id': id, 'error': {'code': -32000, 'message': f"{type(e).__name__}: {e}", 'data': traceback.format_exc()}}
+
+        if id is not None:
+            send(reply)
+
+    async def rpc_load(self, input_csv, loc_cabs):
+        info = await self._call(_load, input_csv, loc_cabs)
+        self.doctors = set(info['doctors'])
+        self.weeks = {}
+        return {'doctors': len(info['doctors']), 'cabinets': len(info['cabinets'])}
+
+    async def rpc_generate(self, engine='dijkstra'):
+        started = time.perf_counter()
+        weeks = await self._call(_generate, engine)
+        self.weeks = dict(weeks)
+        return {'weeks': weeks, 'seconds': time.perf_counter() - started}
+
+    async def rpc_get(self, week=None):
+        if week is None:
+            return self.weeks
+        if week not in self.weeks:
+            raise ValueError(f"No week {week}")
+        return self.weeks[week]
+
+    async def rpc_save(self, output_dir, format='jsonl'):
+        return await self._call(_save, output_dir, format)
+
+    async def rpc_stats(self):
+        return dict(self.stats, pending=len(self.pending))
+
+    async def rpc_shutdown(self):
+        self.stopped.set()
+        return True
+
+    async def rpc_cancel(self, week, doctor, shifts):
+        return self._queue({'type': 'cancel', 'week': week, 'doctor': doctor, 'shifts': shifts})
+
+    async def rpc_availability(self, week, doctor, forbid=(), allow=()):
+        return self._queue({'type': 'availability', 'week': week, 'doctor': doctor, 'forbid': list(forbid), 'allow': list(allow)})
+
+    async def rpc_require(self, week, doctor, location, cabinet, day, shift):
+        return self._queue({'type': 'require', 'week': week, 'doctor': doctor, 'location': location, 'cabinet': cabinet, 'day': day, 'shift': shift})
+
+    def _queue(self, event):
+        if event['week'] not in self.weeks:
+            raise ValueError(f"No week {event['week']}, call generate first")
+        if event['doctor'] not in self.doctors:
+            raise ValueError(f"Unknown doctor: {event['doctor']}")
+        self.pending.append(event)
+        self.stats['events'] += 1
+        if self.first_event is None:
+            self.first_event = time.monotonic()
+        self.wake.set()
+        return {'queued': len(self.pending)}
+
+    async def process_events(self):
+        # Waits for a quiet spell of self.coalesce seconds (or self.max_delay since the first
+        # event of the batch) and applies everything queued by then in one worker call.
+        while True:
+            await self.wake.wait()
+            while True:
+                self.wake.clear()
+                left = self.first_event + self.max_delay - time.monotonic()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), max(min(self.coalesce, left), 0))
+                except asyncio.TimeoutError:
+                    break
+
+            events, self.pending = self.pending, []
+            first, self.first_event = self.first_event, None
+            self.stats['batches'] += 1
+            try:
+                updates = await self._call(_apply, events)
+            except Exception as e:
+                self.stats['failed_batches'] += 1
+                self.notify('schedule_failed', {'batch': self.stats['batches'], 'events': len(events), 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+            for week, update in updates.items():
+                self.weeks[week] = update['rows']
+            self.stats['weeks_repaired'] += len(updates)
+            self.stats['last_latency'] = time.monotonic() - first
+            self.notify('schedule_updated', {'batch': self.stats['batches'], 'events': len(events),
+                                             'weeks': {week: update['changes'] for week, update in updates.items()},
+                                             'latency': self.stats['last_latency']})
+
+    async def connection(self, reader, writer):
+        def send(message):
+            writer.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+
+        self.clients.add(send)
+        try:
+            while line := await reader.readline():
+                self.spawn(self.respond(line, send))
+        finally:
+            self.clients.discard(send)
+            writer.close()
+
+    async def serve_stdio(self):
+        # stdin is read on a daemon thread (asyncio cannot watch a console on every platform);
+        # end of input stops the service.
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+
+        def read():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+            loop.call_soon_threadsafe(lines.put_nowait, None)
+
+        def send(message):
+            sys.stdout.write(json.dumps(message, ensure_ascii=False) + '\n')
+            sys.stdout.flush()
+
+        self.clients.add(send)
+        threading.Thread(target=read, daemon=True).start()
+        while (line := await lines.get()) is not None:
+            if line.strip():
+                self.spawn(self.respond(line, send))
+        self.stopped.set()
+
+
+async def serve(args):
+    service = ScheduleService(args.coalesce, args.max_delay)
+    events = asyncio.create_task(service.process_events())
+    server = None
+    try:
+        if args.input_csv and args.loc_cabs:
+            await service.rpc_load(args.input_csv, args.loc_cabs)
+            if args.generate:
+                await service.rpc_generate(args.engine)
+
+        if args.port is not None:
+            server = await asyncio.start_server(service.connection, '127.0.0.1', args.port)
+            print(f"Listening on 127.0.0.1:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+        elif args.socket:
+            server = await asyncio.start_unix_server(service.connection, args.socket)
+            print(f"Listening on {args.socket}", file=sys.stderr)
+        else:
+            service.spawn(service.serve_stdio())
+
+        await service.stopped.wait()
+    finally:
+        if server is not None:
+            server.close()
+        events.cancel()
+        service.executor.shutdown(cancel_futures=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сервіс розкладу: JSON-RPC через stdin/stdout або локальний сокет')
+    parser.add_argument('input_csv', nargs='?', default=None)
+    parser.add_argument('loc_cabs', nargs='?', default=None)
+    parser.add_argument('--generate', action='store_true', help='одразу згенерувати місяць')
+    parser.add_argument('--engine', default='dijkstra')
+    parser.add_argument('--port', type=int, default=None, help='TCP порт на 127.0.0.1 (0 - будь-який вільний)')
+    parser.add_argument('--socket', default=None, help='шлях до unix сокета')
+    parser.add_argument('--coalesce', type=float, default=COALESCE_SECONDS, help='секунд тиші, після яких події обробляються разом')
+    parser.add_argument('--max-delay', type=float, default=MAX_DELAY_SECONDS)
+    args = parser.parse_args()
+
+    asyncio.run(serve(args))
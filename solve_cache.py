@@ -0,0 +1,124 @@
+import argparse
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump when a change to the solver changes its results, so entries from before are not reused.
+CACHE_VERSION = 2
+DEFAULT_DIRECTORY = os.environ.get('SCHEDULE_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'doctor_schedule')
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+
+def week_key(instance, week, doctor_penalty, engine, reduce=True, aggregate=False):
+    # Everything one week's solve depends on: that week's slice of the doctors (weekly min and
+    # max, forbidden and required shifts), their location costs and eligible cabinets, the
+    # cabinets, the engine, whether the network is reduced and its cabinets merged and the
+    # penalties coming in from the weeks before. Parsed values, so
+    # the same clinic written differently (column order, blanks, NaN) gives the same key, and
+    # an edit to another week's shifts does not touch this one.
+    d = range(len(instance.doctors))
+    content = (CACHE_VERSION, engine, reduce, aggregate, week, instance.doctors, instance.cabinets,
+               [instance.weekly_min(i, week) for i in d], [instance.weekly_max(i, week) for i in d],
+               [instance.forbidden[i][week - 1] for i in d], [sorted(instance.required_shifts[i][week - 1]) for i in d],
+               instance.costs, instance.eligible, sorted(doctor_penalty.items()))
+    return hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+
+
+class SolveCache:
+    # Solved weeks on disk, one pickle per key in directory. A hit refreshes the entry's mtime and
+    # put() drops the least recently used entries once the directory grows past max_bytes.
+    # Entries are written to a temporary file and renamed, so processes can share a directory.
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self._path(key))
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self.stores += 1
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.pickle'):
+                    try:
+                        stat = os.stat(os.path.join(self.directory, name))
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, name in self._entries():
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {'directory': self.directory, 'entries': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else None,
+                'stores': self.stores, 'evictions': self.evictions}
+
+    def __str__(self):
+        stats = self.stats()
+        return (f"{stats['entries']} entries, {stats['bytes'] / 2**20:.1f} of {stats['max_bytes'] / 2**20:.0f} MiB, "
+                f"{stats['hits']} hits, {stats['misses']} misses, {stats['stores']} stored, {stats['evictions']} evicted")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Кеш розв\'язаних тижнів')
+    parser.add_argument('--directory', default=None)
+    parser.add_argument('--clear', action='store_true', help='видалити всі записи')
+    args = parser.parse_args()
+
+    cache = SolveCache(args.directory)
+    if args.clear:
+        cache.clear()
+    print(f"{cache.directory}: {cache}")
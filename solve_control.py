@@ -0,0 +1,44 @@
+import time
+
+
+class SolveControl:
+    # Passed to the solver entry points to follow and steer a run. callback(week, phase, flow,
+    # expected) is called as flow is pushed (week is None for a joint monthly solve); cancel() (from any thread) or an exhausted wall-clock
+    # budget in seconds makes the solver stop after the current augmentation, keeping the
+    # feasible flow found so far, and sets truncated. on_week(schedule) gets every WeekSchedule
+    # as soon as it is finished and written, before the next week starts.
+
+    def __init__(self, callback=None, budget=None, on_week=None):
+        self.callback = callback
+        self.on_week = on_week
+        self.deadline = time.monotonic() + budget if budget is not None else None
+        self.cancelled = False
+        self.truncated = False
+        self.week = None
+        self.phase = None
+        self.flow = 0
+        self.expected = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def begin(self, week, phase, expected):
+        self.week, self.phase, self.expected, self.flow = week, phase, expected, 0
+        self.report()
+
+    def report(self):
+        if self.callback is not None:
+            self.callback(self.week, self.phase, self.flow, self.expected)
+
+    def advance(self, flow):
+        self.flow += flow
+        self.report()
+
+    def week_done(self, schedule):
+        if self.on_week is not None:
+            self.on_week(schedule)
+
+    def should_stop(self):
+        if self.cancelled or (self.deadline is not None and time.monotonic() >= self.deadline):
+            self.truncated = True
+        return self.truncated
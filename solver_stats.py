@@ -0,0 +1,79 @@
+import time
+import tracemalloc
+
+
+class SolveStats:
+    # Counters for one solve (one phase of one week). min_cost_max_flow fills in the flow side,
+    # the graph builders in algo_flow add build_time and, for a reduced network, how many nodes
+    # and edges were pruned and how many shifts were fixed outside the solver (required ones
+    # and forced ones) and how many cabinet shifts went into merged ones; peak_memory is only
+    # known while tracemalloc is tracing. report is what an engine has to say about its solve
+    # beyond the counters (the decomposed engine's SliceReport), shown after them.
+    FIELDS = ('build_time', 'nodes', 'edges', 'augmentations', 'relaxation_passes', 'edges_scanned',
+              'shortest_path_time', 'augment_time', 'solve_time', 'flow', 'pruned_nodes', 'pruned_edges', 'fixed_shifts', 'forced_shifts',
+              'merged_slots', 'peak_memory')
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        self.peak_memory = None
+        self.report = None
+        self._started = None
+
+    def start(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self._started = time.perf_counter()
+
+    def stop(self, field='solve_time'):
+        setattr(self, field, getattr(self, field) + time.perf_counter() - self._started)
+        if tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+
+    def add(self, other):
+        for field in self.FIELDS:
+            if field == 'peak_memory':
+                if other.peak_memory is not None:
+                    self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+            else:
+                setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __str__(self):
+        text = (f"build {self.build_time:.3f}s, solve {self.solve_time:.3f}s "
+                f"(shortest paths {self.shortest_path_time:.3f}s, augment {self.augment_time:.3f}s), "
+                f"{self.nodes} nodes, {self.edges} edges, flow {self.flow}, {self.augmentations} augmentations, "
+                f"{self.relaxation_passes} passes, {self.edges_scanned} edges scanned")
+        if self.pruned_nodes or self.pruned_edges or self.fixed_shifts:
+            full_nodes, full_edges = self.nodes + self.pruned_nodes, self.edges + self.pruned_edges
+            text += (f", pruned {self.pruned_nodes} of {full_nodes} nodes ({self.pruned_nodes / max(full_nodes, 1):.0%}) and "
+                     f"{self.pruned_edges} of {full_edges} edges ({self.pruned_edges / max(full_edges, 1):.0%}), "
+                     f"{self.fixed_shifts} shifts fixed ({self.forced_shifts} forced)")
+            if self.merged_slots:
+                text += f", {self.merged_slots} cabinet shifts merged"
+        if self.peak_memory is not None:
+            text += f", peak {self.peak_memory / 2**20:.1f} MiB"
+        if self.report is not None:
+            text += f"; {self.report}"
+        return text
+
+
+def month_stats(schedules):
+    # {week: {phase: SolveStats}} plus the per-phase totals over the month under 'total'.
+    report = {'total': {}}
+    for schedule in schedules:
+        report[schedule.week] = schedule.stats
+        for phase, stats in schedule.stats.items():
+            report['total'].setdefault(phase, SolveStats()).add(stats)
+    return report
+
+
+def format_month_stats(schedules):
+    lines = []
+    for week, phases in month_stats(schedules).items():
+        for phase, stats in phases.items():
+            lines.append(f"{'Month' if week == 'total' else f'Week {week}'} {phase}: {stats}")
+    return '\n'.join(lines)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from problem_instance import ProblemInstance
+
+DOCTORS_CSV = os.path.join(ROOT, 'data', 'loc_data_simplified.csv')
+ROOMS_JSON = os.path.join(ROOT, 'data', 'rooms_locations_updated.json')
+
+
+@pytest.fixture
+def instance():
+    # The clinic shipped in data/.
+    return ProblemInstance.from_files(DOCTORS_CSV, ROOMS_JSON)
+
+
+
+def doctor_row(doctor, cabinets='L', min_shifts=0, max_shifts='', forbidden='', required='', specialization='S', fine=1):
+    # One row of the doctors csv, as read_doctors gives it, for clinics built in a test.
+    return {'Doctor': doctor, 'Cabinets': cabinets, 'MinShifts': str(min_shifts), 'MaxShifts': str(max_shifts), 'ForbiddenShifts': forbidden,
+            'RequiredShifts': required, 'Specialization': specialization, 'Fine': str(fine)}
@@ -0,0 +1,58 @@
+import io
+import contextlib
+
+import pytest
+
+from algo_flow import generate_monthly_schedule, generate_preference_schedule
+from conftest import doctor_row
+from problem_instance import ProblemInstance
+
+
+def test_aggregated_groups_partition_the_cabinets(instance):
+    aggregated = instance.aggregated()
+    assert len(aggregated.cabinets) < len(instance.cabinets)
+    assert sorted(c for members in aggregated.members for c in members) == list(range(len(instance.cabinets)))
+
+    eligible = [{c for c, _ in cabinets} for cabinets in instance.eligible]
+    for i, members in enumerate(aggregated.members):
+        assert len({instance.cabinets[c][0] for c in members}) == 1
+        assert len({tuple(c in cabinets for cabinets in eligible) for c in members}) == 1
+        assert all(aggregated.merged[c] == i for c in members)
+        if len(members) == 1:
+            assert aggregated.cabinets[i] == instance.cabinets[members[0]]
+
+    for d, cabinets in enumerate(instance.eligible):
+        assert dict(aggregated.eligible[d]) == {aggregated.merged[c]: cost for c, cost in cabinets}
+
+
+def test_aggregated_month_takes_the_same_flow(instance):
+    with contextlib.redirect_stdout(io.StringIO()):
+        plain = generate_monthly_schedule(instance, workers=1)
+        merged = generate_monthly_schedule(instance, workers=1, aggregate=True)
+
+    eligible = [{instance.cabinets[c] for c, _ in cabinets} for cabinets in instance.eligible]
+    for week, (plain_week, merged_week) in enumerate(zip(plain, merged), start=1):
+        for phase in ('necessary', 'preference'):
+            assert merged_week.stats[phase].flow == plain_week.stats[phase].flow
+        assert merged_week.stats['necessary'].merged_slots > 0
+        for doctor, slots in merged_week.assignments().items():
+            d = instance.doctor_ids[doctor]
+            shifts = [shift for _, _, shift in slots]
+            assert len(shifts) == len(set(shifts))
+            assert all((loc, cab) in eligible[d] for loc, cab, _ in slots)
+            assert set(shifts) <= set(instance.available_shifts(d, week))
+
+
+def test_decomposed_engine_is_refused(instance):
+    with pytest.raises(ValueError):
+        generate_preference_schedule(instance, None, {doctor: 0 for doctor in instance.doctors}, 1, engine='decomposed', aggregate=True)
+
+
+def test_doctors_are_spread_over_a_group():
+    instance = ProblemInstance([doctor_row('A', min_shifts=12, max_shifts=12)], {'L': {'S': ['101', '102', '103']}})
+    assert instance.aggregated().members == [[0, 1, 2]]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule = generate_preference_schedule(instance, None, {'A': 0}, 1, aggregate=True)
+    slots = schedule.assignments()['A']
+    assert len(slots) == 3 and sorted(cab for _, cab, _ in slots) == ['101', '102', '103']
@@ -0,0 +1,83 @@
+import io
+import shutil
+import contextlib
+
+import pytest
+
+import algo_flow
+from algo_flow import generate_monthly_schedule, change_weekly_schedule, load_week_state
+from benchmark import run_benchmarks
+from instance_generator import generate_instance, write_instance
+from problem_instance import ProblemInstance
+from scenarios import evaluate_month
+
+
+@pytest.fixture
+def clinic(tmp_path):
+    # Three sites that share no doctors, written out as the CLI would read them.
+    rows, loc_cabs = generate_instance(doctors=30, locations=2, cabinets_per_spec=2, seed=4, sites=3)
+    csv, js = str(tmp_path / 'doctors.csv'), str(tmp_path / 'rooms.json')
+    write_instance(rows, loc_cabs, csv, js)
+    return csv, js, ProblemInstance.from_files(csv, js)
+
+
+def test_components_are_disjoint_and_closed(clinic):
+    instance = clinic[2]
+    parts = instance.components()
+    assert len(parts) > 1
+
+    doctors = [d for part, _ in parts for d in part]
+    cabinets = [c for _, part in parts for c in part]
+    assert len(doctors) == len(set(doctors)) and len(cabinets) == len(set(cabinets))
+    for part_doctors, part_cabinets in parts:
+        assert all(c in part_cabinets for d in part_doctors for c, _ in instance.eligible[d])
+
+    part_doctors, part_cabinets = parts[0]
+    part = instance.subset(part_doctors, part_cabinets)
+    assert part.doctors == [instance.doctors[d] for d in part_doctors]
+    assert part.cabinets == [instance.cabinets[c] for c in part_cabinets]
+    for i, d in enumerate(part_doctors):
+        assert [part.cabinets[c] for c, _ in part.eligible[i]] == [instance.cabinets[c] for c, _ in instance.eligible[d]]
+
+
+def test_week_solved_in_parts_is_repaired_from_its_state(clinic, tmp_path):
+    csv, js, instance = clinic
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedules = generate_monthly_schedule(instance, str(tmp_path), workers=1)
+
+    week = str(tmp_path / 'week_2.jsonl')
+    state = load_week_state(algo_flow.state_path(week), 2, instance)
+    assert state is not None and len(state['network']) == len(instance.components())
+
+    # Slots the reduction fixed are not in any part's network and always take a rebuild.
+    kept = [(doctor, shift) for doctor, slots in schedules[1].assignments().items() for loc, cab, shift in sorted(slots)
+            if any((loc, cab, shift) in network.ids for network in state['network'])]
+    first = {}
+    for doctor, shift in kept:
+        first.setdefault(doctor, [shift])
+    deleted = dict(list(first.items())[::3][:3])
+    assert len(deleted) == 3
+    shutil.copy(week, str(tmp_path / 'week_2.bak'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        repaired = change_weekly_schedule(csv, js, week, deleted, instance=instance)
+        shutil.copy(str(tmp_path / 'week_2.bak'), week)
+        rebuilt = change_weekly_schedule(csv, js, week, deleted, instance=instance, incremental=False)
+
+    assert 'repair' in repaired.stats and 'repair' not in rebuilt.stats
+    assert evaluate_month(instance, [repaired])['objective'] == evaluate_month(instance, [rebuilt])['objective']
+
+
+def test_small_parts_stay_in_process(clinic, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError('pool started for parts below PARALLEL_MIN_DOCTORS')
+
+    monkeypatch.setattr(algo_flow, 'ProcessPoolExecutor', no_pool)
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedules = generate_monthly_schedule(clinic[2], workers=4)
+    assert len(schedules) == 4
+
+
+def test_change_benchmark_runs_on_a_generated_clinic():
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = run_benchmarks([10], ['change_weekly_schedule'], repeat=1, memory=False)
+    assert [result['benchmark'] for result in results['results']] == ['change_weekly_schedule']
@@ -0,0 +1,64 @@
+import io
+import contextlib
+from collections import defaultdict
+
+import pytest
+
+from algo_flow import build_week_network
+from instance_generator import generate_problem_instance
+from maximum_flow_impl import min_cost_max_flow
+from solver_stats import SolveStats
+
+
+def _clinic(seed):
+    # Small enough for every engine, with forbidden and required shifts in every week.
+    return generate_problem_instance(doctors=8, locations=2, specializations=3, cabinets_per_spec=2, forbidden_density=0.2,
+                                     required_density=0.05, min_ratio=0.5, seed=seed)
+
+
+def _solve(instance, week, engine, **options):
+    # One solve up to every doctor's MaxShifts, so the penalties decide between many flows.
+    network, necessary_shifts, schedule, _, extra_capacity = build_week_network(instance, week)
+    network.freeze()
+    source = network.ids['S']
+    for doctor, extra in extra_capacity.items():
+        a = network.arc(source, network.ids.get(doctor))
+        if a != -1:
+            network.residual[a] += extra
+            network.capacity[a] += extra
+    doctor_penalty = {doctor: 4 if not fine else 0 for doctor, fine in zip(instance.doctors, instance.fine)}
+    with contextlib.redirect_stdout(io.StringIO()):
+        flow, cost, _ = min_cost_max_flow(network, instance.costs, doctor_penalty, defaultdict(int), necessary_shifts, schedule, 'S', 'T', engine=engine,
+                                          **options)
+    return flow, cost
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_dijkstra_matches_bellman_ford(seed):
+    instance = _clinic(seed)
+    assert any(shifts for weeks in instance.required_shifts for shifts in weeks)
+    for week in (1, 3):
+        flow, cost = _solve(instance, week, 'dijkstra')
+        assert (flow, cost) == pytest.approx(_solve(instance, week, 'bellman_ford'))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_convex_costs_the_same_as_dijkstra(seed):
+    instance = _clinic(seed)
+    for week in (1, 3):
+        flow, cost = _solve(instance, week, 'convex')
+        assert (flow, cost) == pytest.approx(_solve(instance, week, 'dijkstra'))
+
+
+def test_decomposed_report_counts_the_pre_assigned_shifts():
+    instance = _clinic(1)
+    assert build_week_network(instance, 1)[1]
+
+    stats = SolveStats()
+    flow, _ = _solve(instance, 1, 'decomposed', stats=stats)
+    assert stats.report.flow == flow
+    assert stats.report.monolithic_cost is None
+
+    stats = SolveStats()
+    flow, _ = _solve(instance, 1, 'decomposed', stats=stats, compare=True)
+    assert stats.report.flow == stats.report.monolithic_flow == flow
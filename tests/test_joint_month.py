@@ -0,0 +1,50 @@
+import io
+import contextlib
+from collections import defaultdict
+
+import pytest
+
+from algo_flow import generate_monthly_schedule, generate_joint_monthly_schedule
+from instance_generator import generate_problem_instance
+from problem_instance import shift_mask
+from scenarios import evaluate_month
+
+
+@pytest.fixture(scope='module')
+def month():
+    instance = generate_problem_instance(doctors=20, locations=2, specializations=3, cabinets_per_spec=2, forbidden_density=0.2,
+                                         required_density=0.03, min_ratio=0.5, seed=2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        weekly = generate_monthly_schedule(instance, None, workers=1)
+        joint = generate_joint_monthly_schedule(instance, None)
+    return instance, weekly, joint
+
+
+def test_joint_month_keeps_every_limit(month):
+    instance, _, joint = month
+    assert [schedule.week for schedule in joint] == [1, 2, 3, 4]
+
+    load = defaultdict(int)
+    for schedule in joint:
+        taken = set()
+        for doctor, slots in schedule.assignments().items():
+            d = instance.doctor_ids[doctor]
+            eligible = {instance.cabinets[c] for c, _ in instance.eligible[d]}
+            for loc, cab, shift in slots:
+                assert (doctor, shift) not in taken
+                taken.add((doctor, shift))
+                assert (loc, cab) in eligible
+                assert not instance.forbidden[d][schedule.week - 1] & shift_mask([shift])
+            assert instance.required_shifts[d][schedule.week - 1] <= slots
+            load[doctor] += len(slots)
+
+    assert all(load[doctor] <= maximum for doctor, maximum in zip(instance.doctors, instance.max_shifts))
+
+
+def test_joint_month_costs_no_more_than_week_by_week(month):
+    instance, weekly, joint = month
+    weekly, joint = evaluate_month(instance, weekly), evaluate_month(instance, joint)
+
+    assert sum(joint['load'].values()) == sum(weekly['load'].values())
+    assert joint['unmet_minimums'] <= weekly['unmet_minimums']
+    assert joint['objective'] <= weekly['objective']
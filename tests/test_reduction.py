@@ -0,0 +1,53 @@
+import io
+import json
+import contextlib
+
+from algo_flow import build_week_network, generate_preference_schedule
+from conftest import doctor_row
+from problem_instance import ProblemInstance, SHIFT_IDS
+from scenarios import evaluate_month
+from solver_stats import SolveStats
+
+
+def _week(instance, week, reduce):
+    penalty = {doctor: 4 if not fine else 0 for doctor, fine in zip(instance.doctors, instance.fine)}
+    with contextlib.redirect_stdout(io.StringIO()):
+        return generate_preference_schedule(instance, None, penalty, week, reduce=reduce)
+
+
+def _clinic(available):
+    # One doctor who must work 2 shifts a week in a clinic of one cabinet, free for the
+    # first `available` shifts of week 1 only.
+    forbidden = ', '.join(f'1.{day}.{shift}' for day, shift in SHIFT_IDS[available:])
+    return ProblemInstance([doctor_row('A', min_shifts=8, forbidden=forbidden)], {'L': {'S': ['101']}})
+
+
+def test_reduced_week_reaches_the_same_flow(instance):
+    for week in range(1, 5):
+        reduced, full = _week(instance, week, True), _week(instance, week, False)
+        assert reduced.stats['necessary'].flow == full.stats['necessary'].flow
+        assert reduced.stats['necessary'].pruned_nodes > 0 and full.stats['necessary'].pruned_nodes == 0
+        assert evaluate_month(instance, [reduced])['objective'] == evaluate_month(instance, [full])['objective']
+
+
+def test_slots_a_doctor_cannot_do_without_are_forced():
+    stats = SolveStats()
+    build_week_network(_clinic(2), 1, reduce=True, stats=stats)
+    assert (stats.forced_shifts, stats.fixed_shifts) == (2, 2)
+
+    instance = _clinic(2)
+    reduced, full = _week(instance, 1, True), _week(instance, 1, False)
+    assert reduced.to_dict() == full.to_dict()
+    assert sorted(reduced.assignments()['A']) == [('L', '101', SHIFT_IDS[0]), ('L', '101', SHIFT_IDS[1])]
+    assert evaluate_month(instance, [reduced]) == evaluate_month(instance, [full])
+
+
+def test_a_doctor_with_a_choice_is_not_forced():
+    stats = SolveStats()
+    build_week_network(_clinic(3), 1, reduce=True, stats=stats)
+    assert (stats.forced_shifts, stats.fixed_shifts) == (0, 0)
+
+
+def test_stats_are_json_serializable(instance):
+    stats = _week(instance, 1, True).stats
+    json.dumps({phase: phase_stats.as_dict() for phase, phase_stats in stats.items()})
@@ -0,0 +1,28 @@
+import io
+import contextlib
+
+from conftest import DOCTORS_CSV, ROOMS_JSON
+from scenarios import run_scenarios, format_comparison
+
+REMOVED = {'location': 'Козельницька', 'cabinet': '103 - УЗД'}
+
+
+def _run(scenarios):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {result['name']: result for result in run_scenarios(DOCTORS_CSV, ROOMS_JSON, scenarios, workers=1)}
+
+
+def test_removing_a_cabinet_drops_its_required_shifts():
+    # Григоришин А. В. has a required shift in 103 - УЗД.
+    results = _run([{'name': 'no103', 'remove_cabinets': [REMOVED]}])
+
+    assert 'error' not in results['no103']
+    assert results['no103']['objective'] is not None
+
+
+def test_a_failing_scenario_does_not_stop_the_others():
+    results = _run([{'name': 'broken', 'max_shifts': {'Григоришин А. В.': 'x'}}, {'name': 'no103', 'remove_cabinets': [REMOVED]}])
+
+    assert 'ValueError' in results['broken']['error']
+    assert results['no103']['objective'] is not None
+    assert 'помилка' in format_comparison(list(results.values()))
@@ -0,0 +1,90 @@
+import asyncio
+import io
+import contextlib
+
+import pytest
+
+import schedule_service
+from conftest import DOCTORS_CSV, ROOMS_JSON
+
+DISPLACED = 'Костюк О. В.'
+REQUIRING = 'Горічко І.В.'
+
+
+@pytest.fixture
+def session():
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule_service._load(DOCTORS_CSV, ROOMS_JSON)
+        schedule_service._generate('dijkstra')
+    yield schedule_service._session
+    schedule_service._session.clear()
+
+
+def _apply(events):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return schedule_service._apply(events)
+
+
+def _at(session, week, shift):
+    return {(loc, cab): doctor for loc, cab, slot, doctor in session['schedules'][week].rows() if slot == shift and doctor is not None}
+
+
+def test_required_slot_moves_its_holder_into_the_slot_left(session):
+    # Both doctors can work either cabinet, so whoever holds 103 moves over to 203.
+    before = _at(session, 1, (1, 1))
+    displaced, requiring = before[('Козельницька', '103 - УЗД')], before[('Козельницька', '203 - УЗД1')]
+    assert {displaced, requiring} == {DISPLACED, REQUIRING}
+
+    updates = _apply([{'type': 'require', 'week': 1, 'doctor': requiring, 'location': 'Козельницька', 'cabinet': '103 - УЗД', 'day': 1, 'shift': 1}])
+
+    after = _at(session, 1, (1, 1))
+    assert after[('Козельницька', '103 - УЗД')] == requiring
+    assert after[('Козельницька', '203 - УЗД1')] == displaced
+    assert sorted(updates[1]['changes']) == [['Козельницька', '103 - УЗД', 1, 1, displaced, requiring],
+                                             ['Козельницька', '203 - УЗД1', 1, 1, requiring, displaced]]
+
+
+def test_cancel_frees_the_shift_and_refills_it(session):
+    held = sorted(session['schedules'][2].assignments()[DISPLACED])
+    loc, cab, shift = held[0]
+
+    updates = _apply([{'type': 'cancel', 'week': 2, 'doctor': DISPLACED, 'shifts': [list(shift)]}])
+
+    assert all(slot != shift for _, _, slot in session['schedules'][2].assignments()[DISPLACED])
+    assert [loc, cab, shift[0], shift[1], DISPLACED] == updates[2]['changes'][0][:5]
+    assert session['states'][2]['schedule'] == session['schedules'][2].to_dict()
+
+
+def test_cancel_after_require_in_one_batch_undoes_the_placement(session):
+    before = _at(session, 1, (1, 1))
+    requiring = before[('Козельницька', '203 - УЗД1')]
+    _apply([{'type': 'require', 'week': 1, 'doctor': requiring, 'location': 'Козельницька', 'cabinet': '103 - УЗД', 'day': 1, 'shift': 1},
+            {'type': 'cancel', 'week': 1, 'doctor': requiring, 'shifts': [[1, 1]]}])
+
+    after = _at(session, 1, (1, 1))
+    assert after[('Козельницька', '103 - УЗД')] == before[('Козельницька', '103 - УЗД')]
+    assert requiring not in after.values()
+
+
+def test_events_within_the_coalesce_window_make_one_batch():
+    async def run():
+        service = schedule_service.ScheduleService(coalesce=0.2)
+        messages = []
+        service.clients.add(messages.append)
+        events = asyncio.create_task(service.process_events())
+        try:
+            await service.rpc_load(DOCTORS_CSV, ROOMS_JSON)
+            await service.rpc_generate()
+            service._queue({'type': 'cancel', 'week': 1, 'doctor': DISPLACED, 'shifts': [[1, 1]]})
+            service._queue({'type': 'availability', 'week': 2, 'doctor': REQUIRING, 'forbid': [[1, 1]], 'allow': []})
+            while not messages:
+                await asyncio.sleep(0.05)
+        finally:
+            events.cancel()
+            service.executor.shutdown(cancel_futures=True)
+        return service, messages
+
+    service, messages = asyncio.run(run())
+    assert [message['method'] for message in messages] == ['schedule_updated']
+    assert messages[0]['params']['events'] == 2 and service.stats['batches'] == 1
+    assert set(messages[0]['params']['weeks']) == {1, 2}
@@ -0,0 +1,59 @@
+import io
+import contextlib
+import os
+
+from algo_flow import generate_monthly_schedule
+from problem_instance import shift_mask
+from solve_cache import SolveCache, week_key
+
+
+def _penalty(instance):
+    return {doctor: 4 if not fine else 0 for doctor, fine in zip(instance.doctors, instance.fine)}
+
+
+def test_week_key_follows_what_the_week_depends_on(instance):
+    key = week_key(instance, 2, _penalty(instance), 'dijkstra')
+    assert week_key(instance, 2, _penalty(instance), 'dijkstra') == key
+    assert week_key(instance, 3, _penalty(instance), 'dijkstra') != key
+    assert week_key(instance, 2, _penalty(instance), 'bellman_ford') != key
+    assert week_key(instance, 2, _penalty(instance), 'dijkstra', reduce=False) != key
+    assert week_key(instance, 2, _penalty(instance), 'dijkstra', aggregate=True) != key
+
+    penalty = _penalty(instance)
+    penalty[instance.doctors[0]] += 0.5
+    assert week_key(instance, 2, penalty, 'dijkstra') != key
+
+    # Forbidding a shift in another week leaves this week's key alone.
+    instance.forbidden[0][0] |= shift_mask([(1, 1)])
+    assert week_key(instance, 2, _penalty(instance), 'dijkstra') == key
+    instance.forbidden[0][1] |= shift_mask([(1, 1)])
+    assert week_key(instance, 2, _penalty(instance), 'dijkstra') != key
+
+
+def test_put_get_and_least_recently_used_eviction(tmp_path):
+    cache = SolveCache(str(tmp_path))
+    assert cache.get('a') is None
+    for i, key in enumerate('abc'):
+        cache.put(key, {'value': key * 1000})
+        os.utime(cache._path(key), (i + 1, i + 1))
+    assert cache.get('a') == {'value': 'a' * 1000}
+    assert (cache.hits, cache.misses, cache.stores) == (1, 1, 3)
+
+    # 'a' was just read, so 'b' is the least recently used and goes first.
+    size = os.path.getsize(cache._path('a'))
+    cache.max_bytes = 2 * size
+    cache.evict()
+    assert sorted(name for name in os.listdir(tmp_path)) == ['a.pickle', 'c.pickle']
+    assert cache.evictions == 1
+
+
+def test_cached_month_is_read_back(instance, tmp_path):
+    cache = SolveCache(str(tmp_path / 'cache'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        solved = generate_monthly_schedule(instance, None, cache=cache)
+        cached = generate_monthly_schedule(instance, str(tmp_path), cache=cache)
+
+    assert cache.hits == 4 and cache.stores == 4
+    assert [schedule.doctors for schedule in cached] == [schedule.doctors for schedule in solved]
+    assert all(list(schedule.stats) == ['cached'] for schedule in cached)
+    assert os.path.exists(tmp_path / 'week_1.state')
@@ -0,0 +1,39 @@
+import numpy as np
+
+from algo_flow import build_month_network, build_week_network
+from flow_network import ASSIGN
+from problem_instance import SHIFT_BITS, WEEKS
+
+
+def _assignment_arcs(network):
+    kind = np.frombuffer(network.kind, dtype=np.int8)
+    return [(network.names[network.tail(a)], network.names[network.head[a]]) for a in np.flatnonzero(kind == ASSIGN).tolist()]
+
+
+def test_week_network_has_an_arc_for_every_eligible_open_shift(instance):
+    network, necessary_shifts, _, expected_flow, _ = build_week_network(instance, 1)
+    available = instance.availability(1)
+
+    arcs = _assignment_arcs(network)
+    expected = sum(int(available[d].sum()) for d, cabinets in enumerate(instance.eligible) for _ in cabinets)
+    assert len(arcs) == expected
+    for (doctor, shift), (loc, cab, slot_shift) in arcs:
+        d = instance.doctor_ids[doctor]
+        assert shift == slot_shift and available[d, SHIFT_BITS[shift]]
+        assert instance.cabinet_ids[(loc, cab)] in dict(instance.eligible[d])
+
+    assert expected_flow == sum(instance.weekly_min(d, 1) for d in range(len(instance.doctors)))
+    assert necessary_shifts == {doctor: instance.required_shifts[d][0] for d, doctor in enumerate(instance.doctors)}
+
+
+def test_month_network_keys_assignments_by_doctor_and_week(instance):
+    network, costs, schedule, required, expected_flow, _ = build_month_network(instance)
+
+    arcs = _assignment_arcs(network)
+    assert {tail[0][1] for tail, _ in arcs} == set(range(1, WEEKS + 1))
+    for ((doctor, week), (arc_week, day, shift)), (loc, cab, slot) in arcs:
+        assert week == arc_week and slot == (week, day, shift)
+        assert costs[(doctor, week)] == instance.costs[doctor]
+
+    placed = sum(doctor is not None for cabs in schedule.values() for slots in cabs.values() for doctor in slots.values())
+    assert placed == sum(required.values())
@@ -0,0 +1,34 @@
+import pytest
+
+from week_schedule import WeekSchedule, write_month_xlsx, read_month_xlsx
+
+
+def _week(week):
+    # Two locations, a cabinet name with a dash in it and most slots left empty.
+    return WeekSchedule.from_dict(week, {'Козельницька': {'103 - УЗД': {(1, 1): 'Костюк О. В.', (7, 2): 'Бойко (Сулима) А.М.'}, '12': {}},
+                                         'Стрийська': {'110-МРТ': {(3, 2): 'Іващенко І. С.'}}})
+
+
+def _same(read, written):
+    assert read.week == written.week
+    assert list(read.rows()) == list(written.rows())
+
+
+@pytest.mark.parametrize('extension', ['jsonl', 'txt', 'xlsx'])
+def test_week_is_read_back_as_written(tmp_path, extension):
+    schedule = _week(2)
+    assert any(doctor is None for doctor in schedule.doctors)
+    path = str(tmp_path / f'week_2.{extension}')
+    schedule.write(path)
+    _same(WeekSchedule.read(path), schedule)
+
+
+def test_month_workbook_is_read_back_as_written(tmp_path):
+    schedules = [_week(week) for week in range(1, 5)]
+    path = str(tmp_path / 'month.xlsx')
+    write_month_xlsx(schedules, path)
+
+    read = read_month_xlsx(path)
+    assert len(read) == len(schedules)
+    for week, schedule in zip(read, schedules):
+        _same(week, schedule)
@@ -0,0 +1,42 @@
+import io
+import contextlib
+import pickle
+
+import numpy as np
+
+from algo_flow import generate_monthly_schedule, load_week_state, week_state, _state_matches
+from flow_network import SAVED_ARRAYS
+from problem_instance import shift_mask
+
+
+def test_saved_state_is_read_back(instance, tmp_path):
+    states = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_monthly_schedule(instance, str(tmp_path), states=states)
+
+    held = states[2]
+    state = load_week_state(str(tmp_path / 'week_2.state'), 2, instance)
+    assert state['schedule'] == held['schedule']
+    assert state['potential'] == held['potential']
+    network = state['network']
+    assert network.names == held['network'].names and network.doctors == held['network'].doctors
+    for field, typecode in SAVED_ARRAYS:
+        assert np.array_equal(np.frombuffer(getattr(network, field), dtype=np.dtype(typecode)),
+                              np.frombuffer(getattr(held['network'], field), dtype=np.dtype(typecode)))
+
+    assert load_week_state(str(tmp_path / 'week_2.state'), 3, instance) is None
+
+
+def test_pickled_state_is_not_loaded(instance, tmp_path):
+    path = tmp_path / 'week_1.state'
+    with open(path, 'wb') as f:
+        pickle.dump({'week': 1}, f)
+    assert load_week_state(str(path), 1, instance) is None
+
+
+def test_state_key_does_not_follow_later_edits(instance):
+    state = week_state(1, instance, {}, None, None)
+    assert _state_matches(state, 1, instance)
+
+    instance.forbidden[0][0] |= shift_mask([(1, 1)])
+    assert not _state_matches(state, 1, instance)
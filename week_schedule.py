@@ -0,0 +1,213 @@
+import json
+import os
+import re
+from array import array
+
+from problem_instance import SHIFT_IDS
+
+EMPTY = ("None", "Немає лікаря", "")
+
+
+def week_from_path(path):
+    match = re.search(r'week_(\d+)', os.path.basename(path))
+    if match is None:
+        raise ValueError(f"Cannot tell the week from file name: {path}")
+    return int(match.group(1))
+
+
+class WeekSchedule:
+    # One week as columns, one row per (location, cabinet, shift) slot in the order the text and
+    # XLSX layouts list them; doctor is None for an empty slot. This is what the solver functions
+    # hand out and take back; text, XLSX and JSON lines are only ways of storing it.
+
+    def __init__(self, week):
+        self.week = week
+        self.locations = []
+        self.cabinets = []
+        self.days = array('b')
+        self.shifts = array('b')
+        self.doctors = []
+        self.stats = {}
+        self.truncated = False
+
+    def append(self, loc, cab, shift, doctor):
+        self.locations.append(loc)
+        self.cabinets.append(cab)
+        self.days.append(shift[0])
+        self.shifts.append(shift[1])
+        self.doctors.append(doctor)
+
+    @classmethod
+    def from_dict(cls, week, schedule):
+        result = cls(week)
+        for loc in sorted(schedule):
+            for cab in sorted(schedule[loc]):
+                for shift in SHIFT_IDS:
+                    result.append(loc, cab, shift, schedule[loc][cab].get(shift))
+        return result
+
+    def to_dict(self):
+        schedule = {}
+        for loc, cab, shift, doctor in self.rows():
+            schedule.setdefault(loc, {}).setdefault(cab, {})[shift] = doctor
+        return schedule
+
+    def __len__(self):
+        return len(self.doctors)
+
+    def rows(self):
+        for i in range(len(self.doctors)):
+            yield self.locations[i], self.cabinets[i], (self.days[i], self.shifts[i]), self.doctors[i]
+
+    def assignments(self):
+        result = {}
+        for loc, cab, shift, doctor in self.rows():
+            if doctor is not None:
+                result.setdefault(doctor, set()).add((loc, cab, shift))
+        return result
+
+    def write(self, path):
+        if path.endswith('.jsonl'):
+            self.write_jsonl(path)
+        elif path.endswith('.xlsx'):
+            self.write_xlsx(path)
+        else:
+            self.write_text(path)
+
+    @classmethod
+    def read(cls, path):
+        if path.endswith('.jsonl'):
+            return cls.read_jsonl(path)
+        if path.endswith('.xlsx'):
+            return cls.read_xlsx(path)
+        return cls.read_text(path)
+
+    def write_jsonl(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'week': self.week, 'columns': ['location', 'cabinet', 'day', 'shift', 'doctor']}) + '\n')
+            for loc, cab, (day, shift), doctor in self.rows():
+                f.write(json.dumps([loc, cab, day, shift, doctor], ensure_ascii=False) + '\n')
+
+    @classmethod
+    def read_jsonl(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            result = cls(json.loads(f.readline())['week'])
+            for line in f:
+                if line.strip():
+                    loc, cab, day, shift, doctor = json.loads(line)
+                    result.append(loc, cab, (day, shift), doctor)
+        return result
+
+    def write_text(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            last_loc, last_cab = None, None
+            for loc, cab, shift, doctor in self.rows():
+                if loc != last_loc:
+                    if last_cab is not None:
+                        f.write("-"*30 + "\n")
+                    f.write(f"Локація: {loc}\n")
+                    f.write("="*40 + "\n")
+                    last_loc, last_cab = loc, None
+
+                if cab != last_cab:
+                    if last_cab is not None:
+                        f.write("-"*30 + "\n")
+                    f.write(f"Кабінет: {cab}\n")
+                    f.write("-"*30 + "\n")
+                    last_cab = cab
+
+                f.write(f"{shift} - {doctor}\n")
+
+            if last_cab is not None:
+                f.write("-"*30 + "\n")
+
+    @classmethod
+    def read_text(cls, path):
+        result = cls(week_from_path(path))
+        with open(path, 'r', encoding='utf-8') as f:
+            loc, cab = None, None
+            for line in f.read().splitlines():
+                if line.startswith("Локація:"):
+                    loc = line.replace("Локація: ", "").strip()
+                elif line.startswith("Кабінет:"):
+                    cab = line.replace("Кабінет: ", "").strip()
+                elif line.startswith("-") or line.startswith("=") or not line.strip():
+                    continue
+                else:
+                    shift, doctor = line.split(" - ")
+                    shift = tuple(map(int, shift.strip()[1:-1].split(',')))
+                    result.append(loc, cab, shift, None if doctor in EMPTY else doctor)
+        return result
+
+    def xlsx_rows(self):
+        for loc, cab, (day, shift), doctor in self.rows():
+            yield self.week, loc, cab, day, shift, doctor or ""
+
+    def write_xlsx(self, path):
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        self._write_sheet(wb)
+        wb.save(path)
+
+    def _write_sheet(self, wb):
+        ws = wb.create_sheet(f"Week {self.week}")
+        ws.append(["Week", "Location", "Room", "Day", "Shift", "Doctor"])
+        for row in self.xlsx_rows():
+            ws.append(row)
+
+    @classmethod
+    def read_xlsx(cls, path):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            return cls._read_sheet(wb.worksheets[0], path)
+        finally:
+            wb.close()
+
+    @classmethod
+    def _read_sheet(cls, ws, path):
+        result = None
+        for week, loc, cab, day, shift, doctor in ws.iter_rows(min_row=2, max_col=6, values_only=True):
+            if result is None:
+                result = cls(int(week) if week is not None else week_from_path(path))
+            if loc is None:
+                continue
+            result.append(str(loc), str(cab), (int(day), int(shift)), None if doctor is None or doctor in EMPTY else doctor)
+
+        return result if result is not None else cls(week_from_path(path))
+
+
+def write_month_xlsx(schedules, path):
+    # One workbook for the month: a sheet per week and a summary of shifts per doctor. Sheets are
+    # written in write-only mode, row by row, straight from the WeekSchedule columns.
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    load = {}
+    for schedule in schedules:
+        schedule._write_sheet(wb)
+        for doctor in schedule.doctors:
+            if doctor is not None:
+                load.setdefault(doctor, {})
+                load[doctor][schedule.week] = load[doctor].get(schedule.week, 0) + 1
+
+    weeks = [schedule.week for schedule in schedules]
+    ws = wb.create_sheet("Summary")
+    ws.append(["Doctor"] + [f"Week {week}" for week in weeks] + ["Total"])
+    for doctor in sorted(load):
+        counts = [load[doctor].get(week, 0) for week in weeks]
+        ws.append([doctor] + counts + [sum(counts)])
+
+    wb.save(path)
+
+
+def read_month_xlsx(path):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return [WeekSchedule._read_sheet(wb[name], path) for name in wb.sheetnames if name.startswith("Week ")]
+    finally:
+        wb.close()